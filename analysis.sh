@@ -1,58 +1,85 @@
 #!/bin/bash
 # ==========================================================
 # Simple pipeline orchestrator for biosensor model analysis
-# Usage: bash analysis.sh <models_path> <output_path>
+# Usage: bash analysis.sh <models_path> <output_path> [shard i/N]
+#
+# Sharded (SLURM array, 0-based task IDs):
+#   sbatch --array=0-15 --wrap 'bash analysis.sh <models> <out> $SLURM_ARRAY_TASK_ID/16'
+#   python3 reduce_shards.py --output_dir <out> --num_shards 16
 # ==========================================================
 
 set -e  # stop on first error
 
 models_path="$1"
 analyzed_path="$2"
+shard="$3"
+
+shard_args=()
+if [ -n "$shard" ]; then
+    shard_args=(--shard "$shard")
+fi
 
 if [ -z "$models_path" ] || [ -z "$analyzed_path" ]; then
-    echo "Usage: bash analysis.sh <models_path> <output_path>"
+    echo "Usage: bash analysis.sh <models_path> <output_path> [shard i/N]"
     exit 1
 fi
 
+# Installed package (pip install -e .) provides `idopa`; otherwise run the scripts from the lab checkout
+if command -v idopa >/dev/null 2>&1; then
+    idopa=(idopa)
+else
+    idopa=(python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/idopa_cli.py)
+fi
+
 echo "=== Running analysis pipeline ==="
 echo "Models:   $models_path"
 echo "Output:   $analyzed_path"
+echo "Shard:    ${shard:-all}"
 echo
 
 # === Step 1: Run analysis scripts ===
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/batch_LigOverlapVol.py \
+"${idopa[@]}" volume \
     --input_dir "$models_path" \
-    --output_dir "$analyzed_path"
+    --output_dir "$analyzed_path" \
+    "${shard_args[@]}"
 
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/batch_distanceMaps_variance.py \
+"${idopa[@]}" variance \
     --input_dir "$models_path" \
-    --output_dir "$analyzed_path"
+    --output_dir "$analyzed_path" \
+    "${shard_args[@]}"
 
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/getAffinities.py \
+"${idopa[@]}" affinities \
     --input-dir "$models_path" \
-    --output-csv "$analyzed_path/affinities.csv"
+    --output-csv "$analyzed_path/affinities.csv" \
+    "${shard_args[@]}"
 
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/getOpenessDistances.py \
+"${idopa[@]}" openess \
     --parent-folder "$models_path" \
     --res1 40 --res2 389 --chain A \
-    --output-csv "$analyzed_path/openess.csv"
+    --output-csv "$analyzed_path/openess.csv" \
+    "${shard_args[@]}"
+
+if [ -n "$shard" ]; then
+    echo "Shard $shard done. Merge all shards with reduce_shards.py --output_dir $analyzed_path"
+    exit 0
+fi
 
 # === Step 2: Merge CSVs ===
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/merge_csv_tags.py \
+"${idopa[@]}" merge \
     --primary_csv "$analyzed_path/overall_folder_summary.csv" \
     --secondary_csv "$analyzed_path/composite_variances.csv" \
     --output_csv "$analyzed_path/volumes_variances.csv" \
     --ref_column 'Tag' \
     --columns_to_merge variance_avg variance_pLDDT_w complex_PDE_avg complex_PDE_var complex_PDE_min complex_PDE_max PAE_avg PDE_avg
 
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/merge_csv_tags.py \
+"${idopa[@]}" merge \
     --primary_csv "$analyzed_path/volumes_variances.csv" \
     --secondary_csv "$analyzed_path/affinities.csv" \
     --output_csv "$analyzed_path/volumes_variances_affinities.csv" \
     --ref_column 'Tag' \
     --columns_to_merge affinity_pred_value affinity_probability_binary
 
-python3 /share/yarovlab/ahgz/Biosensor/iDopaSnFr/2-AnalysisNew/merge_csv_tags.py \
+"${idopa[@]}" merge \
     --primary_csv "$analyzed_path/volumes_variances_affinities.csv" \
     --secondary_csv "$analyzed_path/openess.csv" \
     --output_csv "$analyzed_path/volumes_variances_affinities_openess.csv" \
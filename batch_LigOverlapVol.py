@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import zlib
 import argparse
-from Bio.PDB import PDBParser, Superimposer
 import numpy as np
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args, select_models
+from fast_structure import apply_transforms, kabsch_transforms, list_structure_files, read_structure, select_atoms
+from memory_budget import add_memory_arguments, memory_plan_from_args
+from bootstrap_ci import add_bootstrap_arguments, bootstrap_from_args, ci_fieldnames, jackknife_ci_columns, jackknife_union_volume, union_membership
 from collections import defaultdict
 import csv
 
@@ -11,6 +16,15 @@ BINDING_POCKET_RESIDUES = {
     "A": [12, 65, 67, 80, 355]
 }
 LIGAND_RESIDUE_NAME = "LIG"
+COMBINED_N_POINTS = 500000
+# Base seed of the Monte Carlo points; each folder draws from its own stream derived from it and its Tag
+DEFAULT_SEED = 0
+
+SUMMARY_FIELDS = [
+    'Tag', 'Folder_Path', 'overlap_volume', 'overlap_w_pos_volume',
+    'overlap_w_neg_volume', 'ligand_pLDDT_avg', 'ligand_pLDDT_min', 'ligand_pLDDT_max'
+] + SELECTION_FIELDS
+BOOTSTRAP_VOLUME_FIELDS = ci_fieldnames(['overlap_volume'])
 
 def default_vdw_radius_factory():
     return 1.5
@@ -19,106 +33,161 @@ VAN_DER_WAALS_RADII = defaultdict(default_vdw_radius_factory)
 VAN_DER_WAALS_RADII.update({"C": 1.70, "O": 1.52, "N": 1.55, "S": 1.80, "H": 1.20})
 
 def get_atoms_from_selection(structure, selection_dict):
-    selected_atoms = []
-    for model in structure:
-        for chain_id, res_nums in selection_dict.items():
-            if chain_id in model:
-                chain = model[chain_id]
-                for res_num in res_nums:
-                    residue_id = (' ', res_num, ' ')
-                    if residue_id in chain:
-                        selected_atoms.extend(chain[residue_id].get_atoms())
+    mask = np.zeros(len(structure), dtype=bool)
+    for chain_id, res_nums in selection_dict.items():
+        mask |= select_atoms(structure, record='ATOM', chain=chain_id, resnums=res_nums)
+    selected_atoms = structure[mask]
     print(f"      Found {len(selected_atoms)} binding pocket atoms for selection.")
     return selected_atoms
 
 def get_ligand_atoms(structure, ligand_name):
-    ligand_atoms = []
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                if residue.get_resname().strip() == ligand_name.strip() and residue.id[0] != ' ':
-                    ligand_atoms.extend(residue.get_atoms())
+    ligand_atoms = structure[select_atoms(structure, resname=ligand_name, exclude_record='ATOM')]
     print(f"      Found {len(ligand_atoms)} ligand atoms for '{ligand_name}'.")
     return ligand_atoms
 
-def calculate_ligand_volume_monte_carlo(atoms, vdw_radii_dict, n_points=100000):
-    if not atoms:
-        return 0.0
-    print(f"        Starting Monte Carlo volume estimation with {n_points} points for {len(atoms)} atoms...")
-    coords = np.array([atom.get_coord() for atom in atoms])
-    radii = np.array([
-        vdw_radii_dict.get(atom.element.strip() if atom.element else atom.get_name()[0], 1.5)
-        for atom in atoms
-    ])
+def folder_rng(tag, seed=DEFAULT_SEED):
+    """Random generator of one folder, seeded from the base seed and the Tag so parallel workers never share a stream."""
+    return np.random.default_rng([seed, zlib.crc32(tag.encode())])
+
+def monte_carlo_points(coords, radii, n_points, rng=None):
+    """Uniform random points in the bounding box of the spheres (+0.5 Å) and the box volume."""
+    rng = rng or np.random.default_rng()
     min_coords = np.min(coords - radii[:, np.newaxis], axis=0)
     max_coords = np.max(coords + radii[:, np.newaxis], axis=0)
     box_min = min_coords - 0.5
     box_max = max_coords + 0.5
     box_dimensions = box_max - box_min
-    box_volume = np.prod(box_dimensions)
-    random_points = box_min + box_dimensions * np.random.rand(n_points, 3)
-    diffs = random_points[:, np.newaxis, :] - coords[np.newaxis, :, :]
-    dists_squared = np.sum(diffs ** 2, axis=2)
-    within_any_sphere = np.any(dists_squared <= radii[np.newaxis, :] ** 2, axis=1)
-    points_in_molecule = np.sum(within_any_sphere)
+    return box_min + box_dimensions * rng.random((n_points, 3)), np.prod(box_dimensions)
+
+def calculate_ligand_volume_monte_carlo(atoms, vdw_radii_dict, n_points=100000, chunk_points=None, rng=None):
+    if not len(atoms):
+        return 0.0
+    print(f"        Starting Monte Carlo volume estimation with {n_points} points for {len(atoms)} atoms...")
+    coords = atoms['coord']
+    radii = np.array([vdw_radii_dict.get(element, 1.5) for element in atoms['element']])
+    random_points, box_volume = monte_carlo_points(coords, radii, n_points, rng)
+    # Chunks bound the (points, atoms, 3) difference tensor; the result does not depend on the chunk size
+    chunk_points = chunk_points or n_points
+    points_in_molecule = 0
+    for start in range(0, n_points, chunk_points):
+        diffs = random_points[start:start + chunk_points, np.newaxis, :] - coords[np.newaxis, :, :]
+        dists_squared = np.sum(diffs ** 2, axis=2)
+        within_any_sphere = np.any(dists_squared <= radii[np.newaxis, :] ** 2, axis=1)
+        points_in_molecule += np.sum(within_any_sphere)
     estimated_volume = (points_in_molecule / n_points) * box_volume
     print(f"        Monte Carlo estimation complete. Estimated volume: {estimated_volume:.2f} A^3")
     return estimated_volume
 
 def get_average_plddt(atoms):
-    if not atoms:
+    if not len(atoms):
         return 0.0
-    return np.mean([atom.get_bfactor() / 100.0 for atom in atoms])
+    return np.mean(atoms['bfactor'] / 100.0)
+
+def superpose_ligand(ref_pocket_atoms, pocket_atoms, ligand_atoms):
+    """Moves `ligand_atoms` in place with the superposition of `pocket_atoms` onto `ref_pocket_atoms`; returns the pocket RMSD."""
+    ref_coords = ref_pocket_atoms['coord'][np.argsort(ref_pocket_atoms['name'], kind='stable')]
+    current_coords = pocket_atoms['coord'][np.argsort(pocket_atoms['name'], kind='stable')]
+    transform = kabsch_transforms(current_coords[np.newaxis], ref_coords)
+    moved = apply_transforms(current_coords[np.newaxis], *transform)[0]
+    ligand_atoms['coord'] = apply_transforms(ligand_atoms['coord'][np.newaxis], *transform)[0]
+    return np.sqrt(np.mean(np.sum((moved - ref_coords) ** 2, axis=1)))
+
+def align_ligands(structures, binding_pocket_residues, ligand_name):
+    """
+    Superposes the binding pocket of every parsed model onto the first model
+    that has one and moves its ligand along. The input structures are not modified.
 
-def process_pdb_files_in_subfolder(subfolder_path, binding_pocket_residues, ligand_name, vdw_radii):
+    Returns:
+        tuple: (indices of the models that have a ligand, their aligned ligand atoms), or None without a pocket.
+    """
+    pockets = [get_atoms_from_selection(atoms, binding_pocket_residues) for atoms in structures]
+    reference = next((pocket for pocket in pockets if len(pocket)), None)
+    if reference is None:
+        return None
+    indices, ligands = [], []
+    for index, (atoms, pocket) in enumerate(zip(structures, pockets)):
+        ligand = get_ligand_atoms(atoms, ligand_name)
+        if not len(ligand):
+            continue
+        if pocket is not reference and len(pocket) == len(reference):
+            superpose_ligand(reference, pocket, ligand)
+        indices.append(index)
+        ligands.append(ligand)
+    return indices, ligands
+
+def combined_ligand_volume(per_model_ligands, vdw_radii, chunk_points=None, n_points=COMBINED_N_POINTS, rng=None):
+    """
+    Union volume of the aligned ligands of all models and its pLDDT weighting.
+
+    Returns:
+        tuple: (weighted+ volume, weighted- volume, volume, pLDDT avg, pLDDT min, pLDDT max).
+    """
+    all_ligand_atoms = np.concatenate(per_model_ligands)
+    volume = calculate_ligand_volume_monte_carlo(all_ligand_atoms, vdw_radii, n_points, chunk_points, rng)
+    plddt_vals = all_ligand_atoms['bfactor'] / 100.0
+    avg_plddt = np.mean(plddt_vals)
+    return volume * avg_plddt, volume * (1.0 - avg_plddt), volume, avg_plddt, np.min(plddt_vals), np.max(plddt_vals)
+
+def overlap_volume_jackknife(per_model_ligands, vdw_radii, chunk_points=None, n_points=COMBINED_N_POINTS, rng=None):
+    """
+    Union volume of the aligned ligands and its M leave-one-out volumes, all
+    counted on one set of Monte Carlo points (the same kind of estimate as
+    calculate_ligand_volume_monte_carlo on the pooled atoms).
+
+    Returns:
+        tuple: (volume, (M,) leave-one-out volumes).
+    """
+    radii = [np.array([vdw_radii.get(element, 1.5) for element in atoms['element']]) for atoms in per_model_ligands]
+    coords = [atoms['coord'] for atoms in per_model_ligands]
+    points, box_volume = monte_carlo_points(np.concatenate(coords), np.concatenate(radii), n_points, rng)
+    return jackknife_union_volume(union_membership(coords, radii, points, chunk_points), box_volume)
+
+def process_pdb_files_in_subfolder(subfolder_path, binding_pocket_residues, ligand_name, vdw_radii, model_filter=None, bootstrap=None,
+                                   memory_plan=None, seed=DEFAULT_SEED):
     print(f"\n--- Processing Subfolder: {os.path.basename(subfolder_path)} ---")
-    parser = PDBParser()
-    pdb_files = [f for f in os.listdir(subfolder_path) if f.endswith(".pdb")]
     subfolder_name = os.path.basename(subfolder_path)
+    rng = folder_rng(subfolder_name, seed)
+    chunk_points = memory_plan['mc_chunk_points'] if memory_plan else None
+    pdb_files, selection = select_models(subfolder_path, list_structure_files(subfolder_path), model_filter)
 
     all_ligand_atoms_aligned = []
     individual_results = []
-    reference_structure = None
+    reference_file = None
     ref_atoms_for_superimposition = []
 
     for pdb_file in pdb_files:
         pdb_path = os.path.join(subfolder_path, pdb_file)
         print(f"  Checking {pdb_file} for reference structure...")
-        structure = parser.get_structure(pdb_file, pdb_path)
+        structure = read_structure(pdb_path)
         binding_pocket_atoms = get_atoms_from_selection(structure, binding_pocket_residues)
-        if binding_pocket_atoms:
-            reference_structure = structure
+        if len(binding_pocket_atoms):
+            reference_file = pdb_file
             ref_atoms_for_superimposition = binding_pocket_atoms
             print(f"  Reference structure set: {pdb_file}")
             break
 
-    if not reference_structure:
+    if reference_file is None:
         print(f"  No suitable reference structure found in {subfolder_name}. Skipping.")
-        return [], 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, subfolder_name
+        return [], 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, subfolder_name, selection
 
     for pdb_file in pdb_files:
         pdb_path = os.path.join(subfolder_path, pdb_file)
         print(f"  Processing {pdb_file}...")
-        structure = parser.get_structure(pdb_file, pdb_path)
+        structure = read_structure(pdb_path)
         current_binding_pocket_atoms = get_atoms_from_selection(structure, binding_pocket_residues)
         ligand_atoms = get_ligand_atoms(structure, ligand_name)
-        if not ligand_atoms:
+        if not len(ligand_atoms):
             print(f"    No ligand found. Skipping.")
             continue
 
-        if structure.id != reference_structure.id:
+        if pdb_file != reference_file:
             if len(ref_atoms_for_superimposition) == len(current_binding_pocket_atoms):
                 print(f"    Superimposing onto reference...")
-                sup = Superimposer()
-                ref_atoms_sorted = sorted(ref_atoms_for_superimposition, key=lambda a: a.get_name())
-                current_atoms_sorted = sorted(current_binding_pocket_atoms, key=lambda a: a.get_name())
-                sup.set_atoms(ref_atoms_sorted, current_atoms_sorted)
-                sup.apply(structure.get_atoms())
-                print(f"    RMSD: {sup.rms:.3f} Å")
-                ligand_atoms = get_ligand_atoms(structure, ligand_name)
+                rmsd = superpose_ligand(ref_atoms_for_superimposition, current_binding_pocket_atoms, ligand_atoms)
+                print(f"    RMSD: {rmsd:.3f} Å")
 
         print(f"    Calculating volume...")
-        unweighted_vol = calculate_ligand_volume_monte_carlo(ligand_atoms, vdw_radii)
+        unweighted_vol = calculate_ligand_volume_monte_carlo(ligand_atoms, vdw_radii, chunk_points=chunk_points, rng=rng)
         avg_plddt = get_average_plddt(ligand_atoms)
         weighted_vol = unweighted_vol * avg_plddt
         print(f"    Volume: {unweighted_vol:.2f} Å^3 | pLDDT avg: {avg_plddt:.2f} | Weighted+: {weighted_vol:.2f}")
@@ -129,31 +198,33 @@ def process_pdb_files_in_subfolder(subfolder_path, binding_pocket_residues, liga
             'Individual_Ligand_Avg_pLDDT': avg_plddt,
             'Individual_Weighted_Ligand_Volume_A^3': weighted_vol
         })
-        all_ligand_atoms_aligned.extend(ligand_atoms)
+        all_ligand_atoms_aligned.append(ligand_atoms)
 
     if not all_ligand_atoms_aligned:
         print(f"  No aligned ligand atoms for combined volume calculation in {subfolder_name}.")
-        return individual_results, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, subfolder_name
+        return individual_results, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, subfolder_name, selection
 
     print(f"  Calculating combined volume for {subfolder_name}...")
-    combined_unweighted_volume = calculate_ligand_volume_monte_carlo(all_ligand_atoms_aligned, vdw_radii, 500000)
-    plddt_vals = [atom.get_bfactor() / 100.0 for atom in all_ligand_atoms_aligned]
-    combined_avg_plddt = np.mean(plddt_vals)
-    combined_min_plddt = np.min(plddt_vals)
-    combined_max_plddt = np.max(plddt_vals)
-    combined_weighted_vol_pos = combined_unweighted_volume * combined_avg_plddt
-    combined_weighted_vol_neg = combined_unweighted_volume * (1.0 - combined_avg_plddt)
+    per_model_ligands = all_ligand_atoms_aligned
+    (combined_weighted_vol_pos, combined_weighted_vol_neg, combined_unweighted_volume,
+     combined_avg_plddt, combined_min_plddt, combined_max_plddt) = combined_ligand_volume(
+        per_model_ligands, vdw_radii, chunk_points, rng=rng)
     print(f"    Combined Volume: {combined_unweighted_volume:.2f} Å^3")
     print(f"    Weighted+: {combined_weighted_vol_pos:.2f} | Weighted-: {combined_weighted_vol_neg:.2f}")
     print(f"    pLDDT avg: {combined_avg_plddt:.2f} | min: {combined_min_plddt:.2f} | max: {combined_max_plddt:.2f}")
 
-    return individual_results, combined_weighted_vol_pos, combined_weighted_vol_neg, combined_unweighted_volume, combined_avg_plddt, combined_min_plddt, combined_max_plddt, subfolder_name
+    if bootstrap:
+        # Union volume grows with every model, so its interval is a jackknife (bootstrap_ci.py). It is drawn
+        # after the estimate, which therefore does not depend on whether intervals are requested
+        _, loo_volumes = overlap_volume_jackknife(per_model_ligands, vdw_radii, chunk_points, rng=rng)
+        ci = jackknife_ci_columns('overlap_volume', combined_unweighted_volume, loo_volumes, bootstrap['level'])
+        selection = {**selection, **ci}
+        print(f"    overlap_volume {100 * bootstrap['level']:g}% CI: "
+              f"[{selection['overlap_volume_ci_low']}, {selection['overlap_volume_ci_high']}]")
 
-def write_overall_summary_to_csv(summary_list, output_filepath):
-    fieldnames = [
-        'Tag', 'Folder_Path', 'overlap_volume', 'overlap_w_pos_volume',
-        'overlap_w_neg_volume', 'ligand_pLDDT_avg', 'ligand_pLDDT_min', 'ligand_pLDDT_max'
-    ]
+    return individual_results, combined_weighted_vol_pos, combined_weighted_vol_neg, combined_unweighted_volume, combined_avg_plddt, combined_min_plddt, combined_max_plddt, subfolder_name, selection
+
+def write_overall_summary_to_csv(summary_list, output_filepath, fieldnames=SUMMARY_FIELDS):
     with open(output_filepath, 'w', newline='') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
@@ -175,16 +246,24 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ligand Volume Analysis")
     parser.add_argument("--input_dir", required=True, help="Path to parent folder containing subfolders with PDBs")
     parser.add_argument("--output_dir", required=True, help="Directory where summary CSV and images will be saved")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
+    add_bootstrap_arguments(parser)
+    add_memory_arguments(parser)
     args = parser.parse_args()
+    shard = parse_shard(args.shard)
+    model_filter = model_filter_from_args(args)
+    bootstrap = bootstrap_from_args(args)
+    memory_plan = memory_plan_from_args(args, args.input_dir)
 
     parent_folder_path = args.input_dir
     output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
 
-    overall_summary_csv_path = os.path.join(output_dir, "overall_folder_summary.csv")
+    overall_summary_csv_path = shard_output_path(os.path.join(output_dir, "overall_folder_summary.csv"), shard)
     all_subfolder_summary_results = []
 
-    for item_name in os.listdir(parent_folder_path):
+    for item_name in select_shard(sorted(os.listdir(parent_folder_path)), shard):
         current_subfolder_path = os.path.join(parent_folder_path, item_name)
         if not os.path.isdir(current_subfolder_path):
             continue
@@ -192,10 +271,14 @@ if __name__ == "__main__":
             current_subfolder_path,
             BINDING_POCKET_RESIDUES,
             LIGAND_RESIDUE_NAME,
-            VAN_DER_WAALS_RADII
+            VAN_DER_WAALS_RADII,
+            model_filter,
+            bootstrap,
+            memory_plan,
+            args.seed
         )
         (individual_results, pos_vol, neg_vol, raw_vol,
-         avg_plddt, min_plddt, max_plddt, subfolder_name) = result
+         avg_plddt, min_plddt, max_plddt, subfolder_name, selection) = result
 
         individual_csv_path = os.path.join(output_dir, f"{subfolder_name}_individual_ligand_analysis.csv")
         write_individual_results_to_csv(individual_results, individual_csv_path)
@@ -208,11 +291,13 @@ if __name__ == "__main__":
             'overlap_w_neg_volume': neg_vol,
             'ligand_pLDDT_avg': avg_plddt,
             'ligand_pLDDT_min': min_plddt,
-            'ligand_pLDDT_max': max_plddt
+            'ligand_pLDDT_max': max_plddt,
+            **selection
         }
         all_subfolder_summary_results.append(summary)
 
-    write_overall_summary_to_csv(all_subfolder_summary_results, overall_summary_csv_path)
+    write_overall_summary_to_csv(all_subfolder_summary_results, overall_summary_csv_path,
+                                 SUMMARY_FIELDS + (BOOTSTRAP_VOLUME_FIELDS if bootstrap else []))
     print("\nAnalysis complete. Results written to:")
     print(f"  Summary CSV: {overall_summary_csv_path}")
     for summary in all_subfolder_summary_results:
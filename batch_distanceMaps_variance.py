@@ -2,37 +2,52 @@
 import os
 import json
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.spatial.distance import pdist, squareform
 import csv
 import argparse
 import sys
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args, select_models
+from bootstrap_ci import (
+    add_bootstrap_arguments, bootstrap_composite_variance, bootstrap_from_args, bootstrap_mean,
+    ci_columns, ci_fieldnames, resample_counts
+)
+from fast_structure import list_structure_files, read_structure, select_atoms, structure_stem
+from memory_budget import add_memory_arguments, memory_plan_from_args
 sys.stdout.reconfigure(encoding='utf-8')
 
+COMPOSITE_VARIANCE_FIELDS = [
+    'Tag', 'variance_avg', 'variance_pLDDT_w', 'variance_PAE_w', 'variance_PDE_w',
+    'complex_PDE_avg', 'complex_PDE_var', 'complex_PDE_min', 'complex_PDE_max',
+    'PAE_min', 'PAE_max', 'PAE_avg', 'PDE_min', 'PDE_max', 'PDE_avg'] + SELECTION_FIELDS
+BOOTSTRAP_VARIANCE_FIELDS = ci_fieldnames(['variance_avg', 'variance_pLDDT_w', 'complex_PDE_avg'])
+
+def ca_distance_map(atoms, chain_id='A'):
+    """CA distance matrix of one parsed model and its pLDDT outer-product weights."""
+    ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id)]
+    if not len(ca):
+        raise ValueError(f"No CA atoms found for chain {chain_id}")
+    plddt_scores = ca['bfactor'] / 100.0
+    return squareform(pdist(ca['coord'], 'euclidean')), np.outer(plddt_scores, plddt_scores)
+
 def distance_map(pdb_file):
-    coords = []
-    plddt_scores = []
-    pdb_code = os.path.basename(pdb_file).split('.')[0]
-
-    with open(pdb_file, 'r') as f:
-        for line in f:
-            if line.startswith('ATOM') and line[12:16].strip() == 'CA' and line[21] == 'A':
-                x = float(line[30:38])
-                y = float(line[38:46])
-                z = float(line[46:54])
-                bfactor = float(line[60:66])
-                coords.append([x, y, z])
-                plddt_scores.append(bfactor / 100.0)
-
-    if not coords:
+    pdb_code = structure_stem(pdb_file)
+    try:
+        dist_matrix, plddt_weight_matrix = ca_distance_map(read_structure(pdb_file))
+    except ValueError:
         raise ValueError(f"No CA atoms found in {pdb_file}")
-
-    coords = np.array(coords)
-    plddt_scores = np.array(plddt_scores)
-    dist_matrix = squareform(pdist(coords, 'euclidean'))
-    plddt_weight_matrix = np.outer(plddt_scores, plddt_scores)
     return dist_matrix, plddt_weight_matrix, pdb_code
 
+def composite_variance(matrices, chunk=None):
+    """Mean over elements of the across-model variance, stacking `chunk` elements at a time."""
+    flat = [m.ravel() for m in matrices]
+    chunk = chunk or flat[0].size
+    total = 0.0
+    for start in range(0, flat[0].size, chunk):
+        stacked = np.stack([f[start:start + chunk] for f in flat])
+        total += np.sum(np.var(stacked, axis=0, dtype=np.float64))
+    return total / flat[0].size
+
 def load_pae_matrix(npz_file, key):
     npz = np.load(npz_file)
     if key not in npz:
@@ -41,136 +56,165 @@ def load_pae_matrix(npz_file, key):
     scaling_factor = 5.0
     return np.exp(-matrix / scaling_factor), matrix
 
-def process_all_folders(parent_folder, output_folder):
+def process_folder(folder, output_folder, model_filter=None, bootstrap=None, memory_plan=None):
+    """
+    Computes the composite variance and PAE/PDE statistics for one prediction folder.
+    With `bootstrap` ({'n_boot', 'level', 'seed'}) the BOOTSTRAP_VARIANCE_FIELDS
+    intervals are appended to the row. A `memory_plan` (memory_budget.plan_memory)
+    sets the dtype of the retained matrices and the variance chunk size.
+
+    Returns:
+        list or None: The formatted composite_variances.csv row, or None if the folder is skipped.
+    """
+    folder_name = os.path.basename(folder)
+    selected, selection = select_models(folder, list_structure_files(folder), model_filter)
+    pdb_files = [os.path.join(folder, f) for f in selected]
+    matrices_unweighted, matrices_plddt_weighted = [], []
+    matrices_pae_weighted, matrices_pde_weighted = [], []
+    dist_dtype = memory_plan['dist_dtype'] if memory_plan else np.float64
+    variance_chunk = memory_plan['variance_chunk'] if memory_plan else None
+    # Running sums instead of the raw PAE/PDE matrices, which are only needed for their mean
+    pae_sum = pde_sum = 0.0
+    pae_count = pde_count = 0
+    complex_pde_values = []
+    pae_min_values, pae_max_values = [], []
+    pde_min_values, pde_max_values = [], []
+
+    for pdb_file in pdb_files:
+        try:
+            out_dir = os.path.join(output_folder, folder_name)
+            os.makedirs(out_dir, exist_ok=True)
+            dist_matrix, plddt_weight_matrix, pdb_code = distance_map(pdb_file)
+            basename = structure_stem(pdb_file)
+            json_file, pae_file, pde_file = None, None, None
+
+            for f in os.listdir(folder):
+                if f.startswith('pae_' + basename) and f.endswith('.npz'):
+                    pae_file = os.path.join(folder, f)
+                elif f.startswith('pde_' + basename) and f.endswith('.npz'):
+                    pde_file = os.path.join(folder, f)
+                elif f.startswith('confidence_' + basename) and f.endswith('.json'):
+                    json_file = os.path.join(folder, f)
+
+            if pae_file:
+                try:
+                    pae_weight, pae_raw = load_pae_matrix(pae_file, 'pae')
+                    pae_sum += np.sum(pae_raw, dtype=np.float64)
+                    pae_count += pae_raw.size
+                    if pae_weight.shape == dist_matrix.shape:
+                        matrices_pae_weighted.append((dist_matrix * pae_weight).astype(dist_dtype, copy=False))
+                        pae_min_values.append(np.min(pae_raw))
+                        pae_max_values.append(np.max(pae_raw))
+                    else:
+                        print(f"Skipping PAE weighting for {basename}: shape mismatch {pae_weight.shape} vs {dist_matrix.shape}")
+                except Exception as e:
+                    print(f"Warning (PAE): {e}")
+
+            if pde_file:
+                try:
+                    pde_weight, pde_raw = load_pae_matrix(pde_file, 'pde')
+                    pde_sum += np.sum(pde_raw, dtype=np.float64)
+                    pde_count += pde_raw.size
+                    if pde_weight.shape == dist_matrix.shape:
+                        matrices_pde_weighted.append((dist_matrix * pde_weight).astype(dist_dtype, copy=False))
+                        pde_min_values.append(np.min(pde_raw))
+                        pde_max_values.append(np.max(pde_raw))
+                    else:
+                        print(f"Skipping PDE weighting for {basename}: shape mismatch {pde_weight.shape} vs {dist_matrix.shape}")
+                except Exception as e:
+                    print(f"Warning (PDE): {e}")
+
+            if json_file:
+                try:
+                    with open(json_file, 'r') as jf:
+                        conf_data = json.load(jf)
+                    if 'complex_pde' in conf_data:
+                        complex_pde_values.append(conf_data['complex_pde'])
+                except Exception as e:
+                    print(f"Warning reading complex_pde from {json_file}: {e}")
+
+            weighted_plddt = dist_matrix * plddt_weight_matrix
+            matrices_unweighted.append(dist_matrix.astype(dist_dtype, copy=False))
+            matrices_plddt_weighted.append(weighted_plddt.astype(dist_dtype, copy=False))
+
+        except Exception as e:
+            print(f"Failed: {pdb_file} - {e}")
+
+    if not matrices_unweighted:
+        print(f"Skipping {folder_name}, no valid PDBs.")
+        return None
+
+    shapes = {m.shape for m in matrices_unweighted}
+    if len(shapes) > 1:
+        print(f"Mixed dimensions in {folder_name}, skipping variance calculation.")
+        return None
+
+    def compute_variance(matrices):
+        return composite_variance(matrices, variance_chunk)
+
+    compvar_unweighted = compute_variance(matrices_unweighted)
+    compvar_plddt = compute_variance(matrices_plddt_weighted)
+    compvar_pae = compute_variance(matrices_pae_weighted) if matrices_pae_weighted else 'NA'
+    compvar_pde = compute_variance(matrices_pde_weighted) if matrices_pde_weighted else 'NA'
+
+    if complex_pde_values:
+        mean_complex_pde = np.mean(complex_pde_values)
+        var_complex_pde = np.var(complex_pde_values) * 1000
+        min_complex_pde = np.min(complex_pde_values)
+        max_complex_pde = np.max(complex_pde_values)
+    else:
+        mean_complex_pde = var_complex_pde = min_complex_pde = max_complex_pde = 'NA'
+
+    pae_avg = f"{pae_sum / pae_count:.3f}" if pae_count else 'NA'
+    pae_min = f"{np.min(pae_min_values):.3f}" if pae_min_values else 'NA'
+    pae_max = f"{np.max(pae_max_values):.3f}" if pae_max_values else 'NA'
+
+    pde_avg = f"{pde_sum / pde_count:.3f}" if pde_count else 'NA'
+    pde_min = f"{np.min(pde_min_values):.3f}" if pde_min_values else 'NA'
+    pde_max = f"{np.max(pde_max_values):.3f}" if pde_max_values else 'NA'
+
+    row = [
+        folder_name,
+        f"{compvar_unweighted:.3f}",
+        f"{compvar_plddt:.3f}",
+        f"{compvar_pae:.3f}" if compvar_pae != 'NA' else 'NA',
+        f"{compvar_pde:.3f}" if compvar_pde != 'NA' else 'NA',
+        f"{mean_complex_pde:.3f}" if mean_complex_pde != 'NA' else 'NA',
+        f"{var_complex_pde:.3f}" if var_complex_pde != 'NA' else 'NA',
+        f"{min_complex_pde:.3f}" if min_complex_pde != 'NA' else 'NA',
+        f"{max_complex_pde:.3f}" if max_complex_pde != 'NA' else 'NA',
+        pae_min, pae_max, pae_avg,
+        pde_min, pde_max, pde_avg,
+        selection['models_used'], selection['model_selection']
+    ]
+
+    if bootstrap:
+        counts = resample_counts(len(matrices_unweighted), bootstrap['n_boot'], bootstrap['seed'])
+        ci = ci_columns('variance_avg', bootstrap_composite_variance(matrices_unweighted, counts, variance_chunk), bootstrap['level'])
+        ci.update(ci_columns('variance_pLDDT_w', bootstrap_composite_variance(matrices_plddt_weighted, counts, variance_chunk), bootstrap['level']))
+        if complex_pde_values:
+            pde_counts = resample_counts(len(complex_pde_values), bootstrap['n_boot'], bootstrap['seed'])
+            ci.update(ci_columns('complex_PDE_avg', bootstrap_mean(complex_pde_values, pde_counts), bootstrap['level']))
+        row += [ci.get(field, 'NA') for field in BOOTSTRAP_VARIANCE_FIELDS]
+
+    print(f"Done with {folder_name}")
+    return row
+
+def process_all_folders(parent_folder, output_folder, shard=None, model_filter=None, bootstrap=None, memory_plan=None):
     os.makedirs(output_folder, exist_ok=True)
-    subfolders = [f.path for f in os.scandir(parent_folder) if f.is_dir()]
+    tags = select_shard(sorted(f.name for f in os.scandir(parent_folder) if f.is_dir()), shard)
+    subfolders = [os.path.join(parent_folder, tag) for tag in tags]
     composite_variances = []
 
     for folder in subfolders:
-        folder_name = os.path.basename(folder)
-        pdb_files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.pdb')]
-        matrices_unweighted, matrices_plddt_weighted = [], []
-        matrices_pae_weighted, matrices_pde_weighted = [], []
-        pae_raw_values, pde_raw_values = [], []
-        complex_pde_values = []
-        pae_min_values, pae_max_values = [], []
-        pde_min_values, pde_max_values = [], []
-
-        for pdb_file in pdb_files:
-            try:
-                out_dir = os.path.join(output_folder, folder_name)
-                os.makedirs(out_dir, exist_ok=True)
-                dist_matrix, plddt_weight_matrix, pdb_code = distance_map(pdb_file)
-                basename = os.path.basename(pdb_file).replace('.pdb', '')
-                json_file, pae_file, pde_file = None, None, None
-
-                for f in os.listdir(folder):
-                    if f.startswith('pae_' + basename) and f.endswith('.npz'):
-                        pae_file = os.path.join(folder, f)
-                    elif f.startswith('pde_' + basename) and f.endswith('.npz'):
-                        pde_file = os.path.join(folder, f)
-                    elif f.startswith('confidence_' + basename) and f.endswith('.json'):
-                        json_file = os.path.join(folder, f)
-
-                if pae_file:
-                    try:
-                        pae_weight, pae_raw = load_pae_matrix(pae_file, 'pae')
-                        pae_raw_values.append(pae_raw)
-                        if pae_weight.shape == dist_matrix.shape:
-                            matrices_pae_weighted.append(dist_matrix * pae_weight)
-                            pae_min_values.append(np.min(pae_raw))
-                            pae_max_values.append(np.max(pae_raw))
-                        else:
-                            print(f"Skipping PAE weighting for {basename}: shape mismatch {pae_weight.shape} vs {dist_matrix.shape}")
-                    except Exception as e:
-                        print(f"Warning (PAE): {e}")
-
-                if pde_file:
-                    try:
-                        pde_weight, pde_raw = load_pae_matrix(pde_file, 'pde')
-                        pde_raw_values.append(pde_raw)
-                        if pde_weight.shape == dist_matrix.shape:
-                            matrices_pde_weighted.append(dist_matrix * pde_weight)
-                            pde_min_values.append(np.min(pde_raw))
-                            pde_max_values.append(np.max(pde_raw))
-                        else:
-                            print(f"Skipping PDE weighting for {basename}: shape mismatch {pde_weight.shape} vs {dist_matrix.shape}")
-                    except Exception as e:
-                        print(f"Warning (PDE): {e}")
-
-                if json_file:
-                    try:
-                        with open(json_file, 'r') as jf:
-                            conf_data = json.load(jf)
-                        if 'complex_pde' in conf_data:
-                            complex_pde_values.append(conf_data['complex_pde'])
-                    except Exception as e:
-                        print(f"Warning reading complex_pde from {json_file}: {e}")
-
-                weighted_plddt = dist_matrix * plddt_weight_matrix
-                matrices_unweighted.append(dist_matrix)
-                matrices_plddt_weighted.append(weighted_plddt)
-
-            except Exception as e:
-                print(f"Failed: {pdb_file} - {e}")
-
-        if not matrices_unweighted:
-            print(f"Skipping {folder_name}, no valid PDBs.")
-            continue
-
-        shapes = {m.shape for m in matrices_unweighted}
-        if len(shapes) > 1:
-            print(f"Mixed dimensions in {folder_name}, skipping variance calculation.")
-            continue
-
-        def compute_variance(matrices):
-            stacked = np.stack(matrices)
-            return np.var(stacked, axis=0), np.mean(np.var(stacked, axis=0))
-
-        var_unweighted, compvar_unweighted = compute_variance(matrices_unweighted)
-        var_plddt, compvar_plddt = compute_variance(matrices_plddt_weighted)
-        var_pae, compvar_pae = compute_variance(matrices_pae_weighted) if matrices_pae_weighted else (None, 'NA')
-        var_pde, compvar_pde = compute_variance(matrices_pde_weighted) if matrices_pde_weighted else (None, 'NA')
+        row = process_folder(folder, output_folder, model_filter, bootstrap, memory_plan)
+        if row is not None:
+            composite_variances.append(row)
 
-        if complex_pde_values:
-            mean_complex_pde = np.mean(complex_pde_values)
-            var_complex_pde = np.var(complex_pde_values) * 1000
-            min_complex_pde = np.min(complex_pde_values)
-            max_complex_pde = np.max(complex_pde_values)
-        else:
-            mean_complex_pde = var_complex_pde = min_complex_pde = max_complex_pde = 'NA'
-
-        pae_avg = f"{np.mean([v for mat in pae_raw_values for v in mat.flatten()]):.3f}" if pae_raw_values else 'NA'
-        pae_min = f"{np.min(pae_min_values):.3f}" if pae_min_values else 'NA'
-        pae_max = f"{np.max(pae_max_values):.3f}" if pae_max_values else 'NA'
-
-        pde_avg = f"{np.mean([v for mat in pde_raw_values for v in mat.flatten()]):.3f}" if pde_raw_values else 'NA'
-        pde_min = f"{np.min(pde_min_values):.3f}" if pde_min_values else 'NA'
-        pde_max = f"{np.max(pde_max_values):.3f}" if pde_max_values else 'NA'
-
-        composite_variances.append([
-            folder_name,
-            f"{compvar_unweighted:.3f}",
-            f"{compvar_plddt:.3f}",
-            f"{compvar_pae:.3f}" if compvar_pae != 'NA' else 'NA',
-            f"{compvar_pde:.3f}" if compvar_pde != 'NA' else 'NA',
-            f"{mean_complex_pde:.3f}" if mean_complex_pde != 'NA' else 'NA',
-            f"{var_complex_pde:.3f}" if var_complex_pde != 'NA' else 'NA',
-            f"{min_complex_pde:.3f}" if min_complex_pde != 'NA' else 'NA',
-            f"{max_complex_pde:.3f}" if max_complex_pde != 'NA' else 'NA',
-            pae_min, pae_max, pae_avg,
-            pde_min, pde_max, pde_avg
-        ])
-
-        print(f"Done with {folder_name}")
-
-    csv_path = os.path.join(output_folder, "composite_variances.csv")
+    csv_path = shard_output_path(os.path.join(output_folder, "composite_variances.csv"), shard)
     with open(csv_path, 'w', newline='') as csvfile:
         csv_writer = csv.writer(csvfile)
-        csv_writer.writerow([
-            'Tag', 'variance_avg', 'variance_pLDDT_w', 'variance_PAE_w', 'variance_PDE_w',
-            'complex_PDE_avg', 'complex_PDE_var', 'complex_PDE_min', 'complex_PDE_max',
-            'PAE_min', 'PAE_max', 'PAE_avg', 'PDE_min', 'PDE_max', 'PDE_avg'])
+        csv_writer.writerow(COMPOSITE_VARIANCE_FIELDS + (BOOTSTRAP_VARIANCE_FIELDS if bootstrap else []))
         csv_writer.writerows(composite_variances)
     print(f"\nComposite variances saved to: {csv_path}")
 
@@ -178,6 +222,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Compute composite variance and complex_pde statistics from AlphaFold models.")
     parser.add_argument("--input_dir", required=True, help="Path to input parent folder (folder of folders)")
     parser.add_argument("--output_dir", required=True, help="Path to output folder")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
+    add_bootstrap_arguments(parser)
+    add_memory_arguments(parser)
     args = parser.parse_args()
-    process_all_folders(args.input_dir, args.output_dir)
+    process_all_folders(args.input_dir, args.output_dir, parse_shard(args.shard), model_filter_from_args(args),
+                        bootstrap_from_args(args), memory_plan_from_args(args, args.input_dir, n_boot=args.bootstrap))
 
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import os
+import zipfile
+import argparse
+import numpy as np
+
+from batch_LigOverlapVol import BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME
+from fast_structure import list_structure_files, read_structure, structure_stem
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args, select_models
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path, write_rows
+
+CONFIDENCE_KEYS = ('pae', 'pde')
+INTERFACE_STATS = ('avg', 'min', 'var')
+
+INTERFACE_SUMMARY_FIELDS = (
+    ['Tag', 'n_pocket_tokens', 'n_ligand_tokens']
+    + [f"interface_{key.upper()}_{stat}" for key in CONFIDENCE_KEYS for stat in INTERFACE_STATS]
+    + SELECTION_FIELDS
+)
+INTERFACE_INDIVIDUAL_FIELDS = ['PDB_File'] + [f"interface_{key.upper()}_{stat}" for key in CONFIDENCE_KEYS for stat in INTERFACE_STATS]
+
+
+def token_indices(structure, binding_pocket_residues, ligand_name):
+    """
+    Maps the binding pocket and ligand to PAE/PDE token indices. Boltz has one
+    token per polymer residue and one per non-polymer heavy atom, in chain
+    order, which is the order of the structure file.
+
+    Returns:
+        tuple: (pocket token indices, ligand token indices, total number of tokens).
+    """
+    polymer = structure['record'] == 'ATOM'
+    heavy_ligand = ~polymer & (np.char.upper(structure['element'].astype(str)) != 'H')
+    counted = polymer | heavy_ligand
+    atoms = structure[counted]
+    is_polymer = polymer[counted]
+    new_residue = np.ones(len(atoms), dtype=bool)
+    new_residue[1:] = (atoms['chain'][1:] != atoms['chain'][:-1]) | (atoms['resnum'][1:] != atoms['resnum'][:-1])
+    token = np.cumsum(~is_polymer | new_residue) - 1
+
+    pocket_mask = np.zeros(len(atoms), dtype=bool)
+    for chain_id, res_nums in binding_pocket_residues.items():
+        pocket_mask |= is_polymer & (atoms['chain'] == chain_id) & np.isin(atoms['resnum'], res_nums)
+    ligand_mask = ~is_polymer & (atoms['resname'] == ligand_name)
+    n_tokens = int(token[-1]) + 1 if len(token) else 0
+    return np.unique(token[pocket_mask]), np.unique(token[ligand_mask]), n_tokens
+
+
+def _npy_header(f):
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
+
+def read_npz_rows(npz_path, key, rows):
+    """
+    Reads only the given rows of the 2-D array `key` of an .npz file.
+
+    Uncompressed members (np.savez) are memory-mapped, so only the pages of
+    those rows are read. Compressed members (np.savez_compressed) are streamed
+    row by row, keeping just the requested rows and stopping after the last one.
+    Fortran-ordered arrays fall back to a full load.
+
+    Args:
+        rows (array-like): Distinct row indices.
+
+    Returns:
+        tuple: (array of shape (len(rows), n_columns) in the order of `rows`, full shape).
+    """
+    rows = np.asarray(rows, dtype=int)
+    with zipfile.ZipFile(npz_path) as zf:
+        info = zf.getinfo(f"{key}.npy")
+        with zf.open(info) as member:
+            shape, fortran_order, dtype = _npy_header(member)
+            header_size = member.tell()
+            if len(rows) and rows.max() >= shape[0]:
+                raise ValueError(f"'{key}' has shape {shape}, row {rows.max()} requested")
+            if fortran_order or len(shape) != 2:
+                with np.load(npz_path) as npz:
+                    matrix = npz[key]
+                return matrix[rows], matrix.shape
+
+            if info.compress_type == zipfile.ZIP_STORED:
+                # Data offset: local file header (30 bytes + name + extra) + .npy header
+                with open(npz_path, 'rb') as raw:
+                    raw.seek(info.header_offset + 26)
+                    name_len, extra_len = np.frombuffer(raw.read(4), dtype='<u2')
+                offset = info.header_offset + 30 + int(name_len) + int(extra_len) + header_size
+                matrix = np.memmap(npz_path, dtype=dtype, mode='r', offset=offset, shape=shape)
+                return np.array(matrix[rows]), shape
+
+            row_bytes = shape[1] * dtype.itemsize
+            out = np.empty((len(rows), shape[1]), dtype=dtype)
+            position = 0
+            for i in np.argsort(rows):
+                if rows[i] > position:
+                    # Forward seek decompresses without keeping the skipped rows
+                    member.seek((rows[i] - position) * row_bytes, os.SEEK_CUR)
+                out[i] = np.frombuffer(member.read(row_bytes), dtype=dtype)
+                position = rows[i] + 1
+            return out, shape
+
+
+def interface_values(npz_path, key, pocket, ligand, n_tokens):
+    """PAE/PDE entries of the pocket->ligand and ligand->pocket blocks, or None if the matrix is not n_tokens x n_tokens."""
+    block, shape = read_npz_rows(npz_path, key, np.concatenate([pocket, ligand]))
+    if tuple(shape) != (n_tokens, n_tokens):
+        return None
+    pocket_rows, ligand_rows = block[:len(pocket)], block[len(pocket):]
+    return np.concatenate([pocket_rows[:, ligand].ravel(), ligand_rows[:, pocket].ravel()]).astype(np.float64)
+
+
+def describe(values):
+    return {'avg': values.mean(), 'min': values.min(), 'var': values.var()}
+
+
+def process_interface_in_subfolder(subfolder_path, binding_pocket_residues, ligand_name, model_filter=None):
+    """
+    Interface PAE/PDE of every (selected) model of a folder. The token layout is
+    taken from the first model that can be read, since all models of a folder
+    share it; only the pocket and ligand rows of each matrix are read.
+
+    Returns:
+        tuple: (individual results, summary dict without Tag, selection).
+    """
+    subfolder_name = os.path.basename(subfolder_path)
+    print(f"\n--- Processing Subfolder: {subfolder_name} ---")
+    pdb_files, selection = select_models(subfolder_path, list_structure_files(subfolder_path), model_filter)
+
+    layout = None
+    for pdb_file in pdb_files:
+        try:
+            layout = token_indices(read_structure(os.path.join(subfolder_path, pdb_file)), binding_pocket_residues, ligand_name)
+            break
+        except Exception as e:
+            print(f"  Failed: {pdb_file} - {e}")
+    if layout is None or not len(layout[0]) or not len(layout[1]):
+        print(f"  No pocket or ligand tokens in {subfolder_name}. Skipping.")
+        return [], None, selection
+    pocket, ligand, n_tokens = layout
+    print(f"  {len(pocket)} pocket and {len(ligand)} ligand tokens of {n_tokens}")
+
+    individual_results = []
+    pooled = {key: [] for key in CONFIDENCE_KEYS}
+    for pdb_file in pdb_files:
+        stem = structure_stem(pdb_file)
+        row = {'PDB_File': pdb_file}
+        for key in CONFIDENCE_KEYS:
+            npz_path = os.path.join(subfolder_path, f"{key}_{stem}.npz")
+            values = None
+            if os.path.exists(npz_path):
+                try:
+                    values = interface_values(npz_path, key, pocket, ligand, n_tokens)
+                    if values is None:
+                        print(f"  Skipping {key.upper()} of {stem}: matrix does not match the {n_tokens} tokens")
+                except Exception as e:
+                    print(f"  Warning ({key.upper()}): {npz_path} - {e}")
+            stats = describe(values) if values is not None else {}
+            for stat in INTERFACE_STATS:
+                row[f"interface_{key.upper()}_{stat}"] = stats.get(stat, 'NA')
+            if values is not None:
+                pooled[key].append(values)
+        individual_results.append(row)
+
+    if not any(pooled.values()):
+        print(f"  No PAE/PDE files in {subfolder_name}.")
+        return individual_results, None, selection
+
+    summary = {'n_pocket_tokens': len(pocket), 'n_ligand_tokens': len(ligand)}
+    for key in CONFIDENCE_KEYS:
+        stats = describe(np.concatenate(pooled[key])) if pooled[key] else {}
+        for stat in INTERFACE_STATS:
+            summary[f"interface_{key.upper()}_{stat}"] = stats.get(stat, 'NA')
+    print("  " + " | ".join(f"interface {key.upper()} avg: {summary[f'interface_{key.upper()}_avg']:.3f}"
+                            for key in CONFIDENCE_KEYS if pooled[key]))
+    return individual_results, summary, selection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pocket-ligand interface PAE/PDE from the pocket and ligand rows only")
+    parser.add_argument("--input_dir", required=True, help="Path to parent folder containing subfolders with PDBs and pae_/pde_ npz files")
+    parser.add_argument("--output_dir", required=True, help="Directory where the CSVs will be saved")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
+    args = parser.parse_args()
+    shard = parse_shard(args.shard)
+    model_filter = model_filter_from_args(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    summaries = []
+    for item_name in select_shard(sorted(os.listdir(args.input_dir)), shard):
+        subfolder_path = os.path.join(args.input_dir, item_name)
+        if not os.path.isdir(subfolder_path):
+            continue
+        individual_results, summary, selection = process_interface_in_subfolder(
+            subfolder_path, BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, model_filter
+        )
+        write_rows(individual_results, INTERFACE_INDIVIDUAL_FIELDS,
+                   os.path.join(args.output_dir, f"{item_name}_individual_interface_confidence.csv"))
+        if summary is not None:
+            summaries.append({'Tag': item_name, **summary, **selection})
+
+    summary_csv_path = shard_output_path(os.path.join(args.output_dir, "interface_confidence.csv"), shard)
+    write_rows(summaries, INTERFACE_SUMMARY_FIELDS, summary_csv_path)
+    print("\nAnalysis complete. Results written to:")
+    print(f"  Summary CSV: {summary_csv_path}")
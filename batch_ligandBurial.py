@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import os
+import argparse
+import numpy as np
+from scipy.spatial import cKDTree
+
+from batch_LigOverlapVol import (
+    BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, VAN_DER_WAALS_RADII, get_atoms_from_selection, get_ligand_atoms
+)
+from fast_structure import list_structure_files, read_structure, select_atoms
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args, select_models
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path, write_rows
+
+PROBE_RADIUS = 1.4
+N_SPHERE_POINTS = 100
+# Tolerance so a surface point is never counted as buried by the atom it was placed on
+SURFACE_EPS = 1e-6
+
+BURIAL_SUMMARY_FIELDS = [
+    'Tag', 'Folder_Path', 'ligand_SASA_avg', 'ligand_SASA_isolated_avg',
+    'ligand_buried_fraction_avg', 'ligand_buried_fraction_min', 'ligand_buried_fraction_max',
+    'pocket_dSASA_avg', 'pocket_dSASA_min', 'pocket_dSASA_max'
+] + SELECTION_FIELDS
+BURIAL_INDIVIDUAL_FIELDS = [
+    'PDB_File', 'ligand_SASA_complex', 'ligand_SASA_isolated', 'ligand_buried_fraction',
+    'pocket_SASA_apo', 'pocket_SASA_complex', 'pocket_dSASA'
+]
+
+
+def sphere_points(n_points=N_SPHERE_POINTS):
+    """Unit vectors evenly spread on a sphere (golden spiral), as in Shrake & Rupley."""
+    i = np.arange(n_points) + 0.5
+    phi = np.arccos(1 - 2 * i / n_points)
+    theta = np.pi * (1 + 5 ** 0.5) * i
+    return np.column_stack([np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)])
+
+
+def atom_radii(atoms, vdw_radii=VAN_DER_WAALS_RADII):
+    return np.array([vdw_radii.get(element, 1.5) for element in atoms['element']])
+
+
+def neighbor_prune(env_coords, query_coords, cutoff):
+    """Indices of environment atoms within `cutoff` of any query atom; only these can occlude its surface."""
+    if not len(env_coords) or not len(query_coords):
+        return np.array([], dtype=int)
+    hits = cKDTree(env_coords).query_ball_point(query_coords, cutoff)
+    return np.unique(np.concatenate([np.asarray(h, dtype=int) for h in hits]))
+
+
+def atom_sasa(query_coords, query_radii, env_coords, env_radii, probe=PROBE_RADIUS, unit_points=None):
+    """
+    Shrake-Rupley SASA of every query atom, occluded by the environment atoms
+    (which should include the query atoms themselves).
+
+    All surface points are tested at once: environment atoms are grouped by
+    radius, and one cKDTree nearest-neighbor query per radius class finds the
+    points lying inside an expanded sphere of that class.
+
+    Returns:
+        np.ndarray: SASA per query atom in Å^2.
+    """
+    if unit_points is None:
+        unit_points = sphere_points()
+    expanded = query_radii + probe
+    points = (query_coords[:, np.newaxis, :] + expanded[:, np.newaxis, np.newaxis] * unit_points).reshape(-1, 3)
+    buried = np.zeros(len(points), dtype=bool)
+    for radius in np.unique(env_radii):
+        tree = cKDTree(env_coords[env_radii == radius])
+        distances, _ = tree.query(points, k=1, distance_upper_bound=radius + probe - SURFACE_EPS)
+        buried |= np.isfinite(distances)
+    exposed = 1.0 - buried.reshape(len(query_coords), len(unit_points)).mean(axis=1)
+    return 4.0 * np.pi * expanded ** 2 * exposed
+
+
+def model_burial(structure, binding_pocket_residues, ligand_name, vdw_radii, probe=PROBE_RADIUS, unit_points=None):
+    """
+    Ligand and pocket burial of one model.
+
+    Returns:
+        dict or None: BURIAL_INDIVIDUAL_FIELDS values (without PDB_File), or None if the model has no ligand.
+    """
+    ligand = get_ligand_atoms(structure, ligand_name)
+    if not len(ligand):
+        return None
+    protein = structure[select_atoms(structure, record='ATOM')]
+    pocket = get_atoms_from_selection(structure, binding_pocket_residues)
+
+    lig_xyz, lig_r = ligand['coord'], atom_radii(ligand, vdw_radii)
+    prot_xyz, prot_r = protein['coord'], atom_radii(protein, vdw_radii)
+    reach = 2 * (max(lig_r.max(), prot_r.max() if len(prot_r) else 0.0) + probe)
+
+    # Ligand: isolated vs in the complex with the protein atoms that can touch it
+    isolated = atom_sasa(lig_xyz, lig_r, lig_xyz, lig_r, probe, unit_points).sum()
+    near = neighbor_prune(prot_xyz, lig_xyz, reach)
+    env_xyz = np.concatenate([lig_xyz, prot_xyz[near]])
+    env_r = np.concatenate([lig_r, prot_r[near]])
+    complex_sasa = atom_sasa(lig_xyz, lig_r, env_xyz, env_r, probe, unit_points).sum()
+
+    # Pocket residues: apo (protein only) vs holo (protein + ligand)
+    pocket_apo = pocket_holo = 0.0
+    if len(pocket):
+        pocket_xyz, pocket_r = pocket['coord'], atom_radii(pocket, vdw_radii)
+        near = neighbor_prune(prot_xyz, pocket_xyz, reach)
+        apo_xyz, apo_r = prot_xyz[near], prot_r[near]
+        pocket_apo = atom_sasa(pocket_xyz, pocket_r, apo_xyz, apo_r, probe, unit_points).sum()
+        pocket_holo = atom_sasa(pocket_xyz, pocket_r, np.concatenate([apo_xyz, lig_xyz]),
+                                np.concatenate([apo_r, lig_r]), probe, unit_points).sum()
+
+    return {
+        'ligand_SASA_complex': complex_sasa,
+        'ligand_SASA_isolated': isolated,
+        'ligand_buried_fraction': 1.0 - complex_sasa / isolated if isolated > 0 else 0.0,
+        'pocket_SASA_apo': pocket_apo,
+        'pocket_SASA_complex': pocket_holo,
+        'pocket_dSASA': pocket_apo - pocket_holo,
+    }
+
+
+def process_burial_in_subfolder(subfolder_path, binding_pocket_residues, ligand_name, vdw_radii,
+                                model_filter=None, probe=PROBE_RADIUS, n_sphere_points=N_SPHERE_POINTS):
+    """
+    Computes ligand/pocket burial for every model of a folder and aggregates it
+    over the ensemble.
+
+    Returns:
+        tuple: (individual results, summary dict without Tag/Folder_Path, selection).
+    """
+    subfolder_name = os.path.basename(subfolder_path)
+    print(f"\n--- Processing Subfolder: {subfolder_name} ---")
+    pdb_files, selection = select_models(subfolder_path, list_structure_files(subfolder_path), model_filter)
+    unit_points = sphere_points(n_sphere_points)
+
+    individual_results = []
+    for pdb_file in pdb_files:
+        try:
+            burial = model_burial(read_structure(os.path.join(subfolder_path, pdb_file)), binding_pocket_residues,
+                                  ligand_name, vdw_radii, probe, unit_points)
+        except Exception as e:
+            print(f"  Failed: {pdb_file} - {e}")
+            continue
+        if burial is None:
+            print(f"  No ligand found in {pdb_file}. Skipping.")
+            continue
+        print(f"  {pdb_file}: ligand SASA {burial['ligand_SASA_complex']:.1f} Å^2 "
+              f"(isolated {burial['ligand_SASA_isolated']:.1f}), buried {burial['ligand_buried_fraction']:.3f}, "
+              f"pocket dSASA {burial['pocket_dSASA']:.1f} Å^2")
+        individual_results.append({'PDB_File': pdb_file, **burial})
+
+    if not individual_results:
+        return individual_results, None, selection
+
+    def column(key):
+        return np.array([r[key] for r in individual_results])
+
+    buried, dsasa = column('ligand_buried_fraction'), column('pocket_dSASA')
+    summary = {
+        'ligand_SASA_avg': column('ligand_SASA_complex').mean(),
+        'ligand_SASA_isolated_avg': column('ligand_SASA_isolated').mean(),
+        'ligand_buried_fraction_avg': buried.mean(),
+        'ligand_buried_fraction_min': buried.min(),
+        'ligand_buried_fraction_max': buried.max(),
+        'pocket_dSASA_avg': dsasa.mean(),
+        'pocket_dSASA_min': dsasa.min(),
+        'pocket_dSASA_max': dsasa.max(),
+    }
+    return individual_results, summary, selection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ligand burial (Shrake-Rupley SASA) analysis")
+    parser.add_argument("--input_dir", required=True, help="Path to parent folder containing subfolders with PDBs")
+    parser.add_argument("--output_dir", required=True, help="Directory where the summary CSVs will be saved")
+    parser.add_argument("--probe", type=float, default=PROBE_RADIUS, help="Probe radius in Å (default: 1.4)")
+    parser.add_argument("--n_points", type=int, default=N_SPHERE_POINTS,
+                        help="Surface points per atom (default: 100)")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
+    args = parser.parse_args()
+    shard = parse_shard(args.shard)
+    model_filter = model_filter_from_args(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    summaries = []
+    for item_name in select_shard(sorted(os.listdir(args.input_dir)), shard):
+        subfolder_path = os.path.join(args.input_dir, item_name)
+        if not os.path.isdir(subfolder_path):
+            continue
+        individual_results, summary, selection = process_burial_in_subfolder(
+            subfolder_path, BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, VAN_DER_WAALS_RADII,
+            model_filter, args.probe, args.n_points
+        )
+        write_rows(individual_results, BURIAL_INDIVIDUAL_FIELDS,
+                   os.path.join(args.output_dir, f"{item_name}_individual_ligand_burial.csv"))
+        if summary is None:
+            print(f"  No models with a ligand in {item_name}.")
+            continue
+        summaries.append({'Tag': item_name, 'Folder_Path': subfolder_path, **summary, **selection})
+
+    summary_csv_path = shard_output_path(os.path.join(args.output_dir, "ligand_burial_summary.csv"), shard)
+    write_rows(summaries, BURIAL_SUMMARY_FIELDS, summary_csv_path)
+    print("\nAnalysis complete. Results written to:")
+    print(f"  Summary CSV: {summary_csv_path}")
+    for summary in summaries:
+        print(f"  Tag: {summary['Tag']} → buried fraction {summary['ligand_buried_fraction_avg']:.3f}")
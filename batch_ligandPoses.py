@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import os
+import argparse
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+
+from batch_LigOverlapVol import BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, align_ligands
+from fast_structure import list_structure_files, read_structure, structure_stem
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args, model_label, select_models
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path, write_rows
+
+# Poses closer than this (average-linkage RMSD, Å) belong to the same binding mode
+DEFAULT_RMSD_CUTOFF = 2.0
+# Bond if the distance is below the summed covalent radii plus this tolerance (Å)
+BOND_TOLERANCE = 0.45
+COVALENT_RADII = {"C": 0.76, "N": 0.71, "O": 0.66, "S": 1.05, "P": 1.07, "F": 0.57,
+                  "CL": 1.02, "BR": 1.20, "I": 1.39, "H": 0.31}
+MAX_AUTOMORPHISMS = 1000
+
+POSE_SUMMARY_FIELDS = [
+    'Tag', 'n_models', 'n_modes', 'dominant_mode_occupancy', 'dominant_mode_pLDDT',
+    'dominant_centroid_model', 'pose_RMSD_avg', 'pose_RMSD_max'
+] + SELECTION_FIELDS
+POSE_MODE_FIELDS = ['Tag', 'mode', 'n_models', 'occupancy', 'pLDDT_avg', 'intra_RMSD_avg', 'centroid_model', 'members']
+
+
+def bond_graph(ligand_atoms):
+    """Boolean adjacency matrix of the ligand inferred from interatomic distances."""
+    radii = np.array([COVALENT_RADII.get(element.upper(), 0.77) for element in ligand_atoms['element']])
+    coords = ligand_atoms['coord']
+    dists = np.linalg.norm(coords[:, np.newaxis] - coords[np.newaxis], axis=2)
+    adjacency = dists < radii[:, np.newaxis] + radii[np.newaxis] + BOND_TOLERANCE
+    np.fill_diagonal(adjacency, False)
+    return adjacency
+
+
+def ligand_automorphisms(elements, adjacency, limit=MAX_AUTOMORPHISMS):
+    """
+    Atom permutations that map the ligand graph onto itself (same element,
+    same bonds), e.g. the flip of a symmetric ring. The identity comes first;
+    the search stops after `limit` permutations.
+    """
+    n = len(elements)
+    degree = adjacency.sum(axis=1)
+    candidates = [[j for j in range(n) if elements[j] == elements[i] and degree[j] == degree[i]] for i in range(n)]
+    perms, mapping, used = [], [-1] * n, [False] * n
+
+    def extend(i):
+        if len(perms) >= limit:
+            return
+        if i == n:
+            perms.append(list(mapping))
+            return
+        for j in candidates[i]:
+            if used[j] or any(adjacency[i, k] != adjacency[j, mapping[k]] for k in range(i)):
+                continue
+            mapping[i], used[j] = j, True
+            extend(i + 1)
+            mapping[i], used[j] = -1, False
+
+    extend(0)
+    return np.array(perms, dtype=int)
+
+
+def pose_rmsd_matrix(coords, perms=None):
+    """
+    Symmetry-corrected RMSD between every pair of poses, without refitting
+    (the poses are already in the common pocket frame).
+
+    For each atom permutation the (M, M) squared distances come from a single
+    Gram matrix, ||x_i||^2 + ||x_j||^2 - 2 x_i . x_j[perm]; the minimum is taken over permutations.
+
+    Args:
+        coords (np.ndarray): (M, N, 3) ligand coordinates with matching atom order.
+        perms (np.ndarray or None): (P, N) automorphisms; None compares atoms in order.
+
+    Returns:
+        np.ndarray: (M, M) symmetric RMSD matrix with a zero diagonal.
+    """
+    n_models, n_atoms = coords.shape[:2]
+    if perms is None:
+        perms = np.arange(n_atoms)[np.newaxis]
+    flat = coords.reshape(n_models, -1)
+    sq_norms = np.einsum('ij,ij->i', flat, flat)
+    best = np.full((n_models, n_models), np.inf)
+    for perm in perms:
+        permuted = coords[:, perm].reshape(n_models, -1)
+        msd = (sq_norms[:, np.newaxis] + sq_norms[np.newaxis] - 2.0 * flat @ permuted.T) / n_atoms
+        np.minimum(best, msd, out=best)
+    rmsd = np.sqrt(np.clip(np.minimum(best, best.T), 0.0, None))
+    np.fill_diagonal(rmsd, 0.0)
+    return rmsd
+
+
+def cluster_poses(rmsd, cutoff=DEFAULT_RMSD_CUTOFF):
+    """Average-linkage clusters of the RMSD matrix cut at `cutoff` Å; labels are 0-based, largest mode first."""
+    if len(rmsd) == 1:
+        return np.zeros(1, dtype=int)
+    labels = fcluster(linkage(squareform(rmsd, checks=False), method='average'), t=cutoff, criterion='distance')
+    sizes = np.bincount(labels)
+    # Relabel by decreasing size (ties by first member) so mode 0 is the dominant one
+    order = sorted(np.unique(labels), key=lambda label: (-sizes[label], np.flatnonzero(labels == label)[0]))
+    relabel = {label: rank for rank, label in enumerate(order)}
+    return np.array([relabel[label] for label in labels])
+
+
+def pose_modes(ligands, labels_of_models, cutoff=DEFAULT_RMSD_CUTOFF):
+    """
+    Clusters the pocket-aligned ligand poses of one ensemble.
+
+    Args:
+        ligands (list): Aligned ligand atom arrays, one per model.
+        labels_of_models (list): Model labels (e.g. '3' for *_model_3) in the same order.
+
+    Returns:
+        tuple: (list of mode dicts, largest first; the RMSD matrix), or (None, None) if the
+        ligands do not share atom names.
+    """
+    orders = [np.argsort(ligand['name'], kind='stable') for ligand in ligands]
+    names = ligands[0]['name'][orders[0]]
+    if any(len(o) != len(names) or not np.array_equal(lig['name'][o], names) for lig, o in zip(ligands, orders)):
+        return None, None
+    ordered = [ligand[order] for ligand, order in zip(ligands, orders)]
+    coords = np.stack([ligand['coord'] for ligand in ordered]).astype(np.float64)
+    plddt = np.array([np.mean(ligand['bfactor']) / 100.0 for ligand in ordered])
+
+    perms = ligand_automorphisms(list(ordered[0]['element']), bond_graph(ordered[0]))
+    rmsd = pose_rmsd_matrix(coords, perms)
+    labels = cluster_poses(rmsd, cutoff)
+
+    modes = []
+    for mode in range(labels.max() + 1):
+        members = np.flatnonzero(labels == mode)
+        within = rmsd[np.ix_(members, members)]
+        # Centroid pose: the member with the smallest summed RMSD to the rest of its mode
+        centroid = members[np.argmin(within.sum(axis=1))]
+        modes.append({
+            'mode': mode,
+            'n_models': len(members),
+            'occupancy': len(members) / len(labels),
+            'pLDDT_avg': plddt[members].mean(),
+            'intra_RMSD_avg': within[np.triu_indices(len(members), 1)].mean() if len(members) > 1 else 0.0,
+            'centroid_model': labels_of_models[centroid],
+            'members': ';'.join(labels_of_models[i] for i in members),
+        })
+    return modes, rmsd
+
+
+def process_poses_in_subfolder(subfolder_path, binding_pocket_residues, ligand_name, model_filter=None,
+                               cutoff=DEFAULT_RMSD_CUTOFF):
+    """
+    Aligns the ligands of every (selected) model on the binding pocket and
+    clusters their poses into binding modes.
+
+    Returns:
+        tuple: (summary dict without Tag, list of mode dicts), or (None, None) if the folder is skipped.
+    """
+    subfolder_name = os.path.basename(subfolder_path)
+    print(f"\n--- Processing Subfolder: {subfolder_name} ---")
+    pdb_files, selection = select_models(subfolder_path, list_structure_files(subfolder_path), model_filter)
+    kept = []
+    for pdb_file in pdb_files:
+        try:
+            kept.append((pdb_file, read_structure(os.path.join(subfolder_path, pdb_file))))
+        except Exception as e:
+            print(f"  Failed: {pdb_file} - {e}")
+
+    aligned = align_ligands([structure for _, structure in kept], binding_pocket_residues, ligand_name)
+    if not aligned or not aligned[1]:
+        print(f"  No aligned ligands in {subfolder_name}. Skipping.")
+        return None, None
+
+    indices, ligands = aligned
+    model_labels = [model_label(structure_stem(kept[i][0])) for i in indices]
+    modes, rmsd = pose_modes(ligands, model_labels, cutoff)
+    if modes is None:
+        print(f"  Ligand atom names differ between models in {subfolder_name}. Skipping.")
+        return None, None
+
+    pairs = rmsd[np.triu_indices(len(rmsd), 1)]
+    dominant = modes[0]
+    summary = {
+        'n_models': len(ligands),
+        'n_modes': len(modes),
+        'dominant_mode_occupancy': dominant['occupancy'],
+        'dominant_mode_pLDDT': dominant['pLDDT_avg'],
+        'dominant_centroid_model': dominant['centroid_model'],
+        'pose_RMSD_avg': pairs.mean() if len(pairs) else 0.0,
+        'pose_RMSD_max': pairs.max() if len(pairs) else 0.0,
+        **selection,
+    }
+    print(f"  {len(modes)} binding mode(s); dominant mode holds {dominant['n_models']}/{len(ligands)} models "
+          f"(pLDDT {dominant['pLDDT_avg']:.2f}, centroid model {dominant['centroid_model']})")
+    return summary, modes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster pocket-aligned ligand poses into binding modes")
+    parser.add_argument("--input_dir", required=True, help="Path to parent folder containing subfolders with PDBs")
+    parser.add_argument("--output_dir", required=True, help="Directory where the CSVs will be saved")
+    parser.add_argument("--rmsd_cutoff", type=float, default=DEFAULT_RMSD_CUTOFF,
+                        help="Average-linkage RMSD (Å) below which poses share a mode (default: 2.0)")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
+    args = parser.parse_args()
+    shard = parse_shard(args.shard)
+    model_filter = model_filter_from_args(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    summaries, mode_rows = [], []
+    for item_name in select_shard(sorted(os.listdir(args.input_dir)), shard):
+        subfolder_path = os.path.join(args.input_dir, item_name)
+        if not os.path.isdir(subfolder_path):
+            continue
+        summary, modes = process_poses_in_subfolder(subfolder_path, BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME,
+                                                    model_filter, args.rmsd_cutoff)
+        if summary is None:
+            continue
+        summaries.append({'Tag': item_name, **summary})
+        mode_rows.extend({'Tag': item_name, **mode} for mode in modes)
+
+    summary_csv_path = shard_output_path(os.path.join(args.output_dir, "ligand_pose_summary.csv"), shard)
+    modes_csv_path = shard_output_path(os.path.join(args.output_dir, "ligand_pose_modes.csv"), shard)
+    write_rows(summaries, POSE_SUMMARY_FIELDS, summary_csv_path)
+    write_rows(mode_rows, POSE_MODE_FIELDS, modes_csv_path)
+    print("\nAnalysis complete. Results written to:")
+    print(f"  Summary CSV: {summary_csv_path}")
+    print(f"  Modes CSV:   {modes_csv_path}")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import json
+import argparse
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+from batch_LigOverlapVol import BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME
+from fast_structure import kabsch_transforms, list_structure_files, read_structure, select_atoms, superposed_rmsd
+
+CACHE_VERSION = 2
+
+
+def read_ca_and_ligand(pdb_file, chain_id, ligand_name):
+    """
+    Reads the C-alpha coordinates of one chain and the ligand coordinates of a
+    structure file.
+
+    Returns:
+        tuple: (resnums, ca_coords, ligand_coords) as NumPy arrays.
+    """
+    atoms = read_structure(pdb_file)
+    ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id)]
+    ligand = atoms[select_atoms(atoms, resname=ligand_name, exclude_record='ATOM')]
+    if not len(ca):
+        raise ValueError(f"No CA atoms found for chain {chain_id} in {pdb_file}")
+    return ca['resnum'], ca['coord'], ligand['coord']
+
+
+def load_ensemble(folder, chain_id, ligand_name, pocket_resnums, res1, res2):
+    """
+    Loads the per-model arrays needed for parent/variant comparisons from every
+    structure in a prediction folder. Models whose residue numbering differs from the
+    first model are skipped.
+    """
+    pdb_files = list_structure_files(folder)
+    resnums, ca_models, centroids, names = None, [], [], []
+    for pdb_file in pdb_files:
+        try:
+            model_resnums, ca, lig = read_ca_and_ligand(os.path.join(folder, pdb_file), chain_id, ligand_name)
+        except Exception as e:
+            print(f"  Failed: {pdb_file} - {e}")
+            continue
+        if resnums is None:
+            resnums = model_resnums
+        elif not np.array_equal(resnums, model_resnums):
+            print(f"  Skipping {pdb_file}: residue numbering differs from first model.")
+            continue
+        ca_models.append(ca)
+        centroids.append(lig.mean(axis=0) if len(lig) else np.full(3, np.nan))
+        names.append(pdb_file)
+
+    if not ca_models:
+        return None
+
+    ca_models = np.stack(ca_models)
+    pocket_idx = np.flatnonzero(np.isin(resnums, pocket_resnums))
+    openness_idx = [np.flatnonzero(resnums == r) for r in (res1, res2)]
+    if all(len(i) for i in openness_idx):
+        openness = np.linalg.norm(ca_models[:, openness_idx[0][0]] - ca_models[:, openness_idx[1][0]], axis=1)
+    else:
+        openness = np.full(len(ca_models), np.nan)
+
+    return {
+        'models': np.array(names),
+        'resnums': resnums,
+        'ca_coords': ca_models,
+        'pocket_idx': pocket_idx,
+        'ligand_centroids': np.stack(centroids),
+        'openness': openness,
+    }
+
+
+def mean_distance_map(ca_models):
+    """Mean CA distance map of an ensemble, accumulated in condensed form."""
+    total = np.zeros(len(ca_models[0]) * (len(ca_models[0]) - 1) // 2)
+    for ca in ca_models:
+        total += pdist(ca, 'euclidean')
+    return squareform(total / len(ca_models))
+
+
+def pocket_frame_centroids(ensemble, ref_pocket):
+    """Ligand centroids of every model after superposing its pocket CAs onto `ref_pocket`."""
+    pocket = ensemble['ca_coords'][:, ensemble['pocket_idx']]
+    rot, mobile_c, target_c = kabsch_transforms(pocket, ref_pocket)
+    centroids = ensemble['ligand_centroids']
+    return np.einsum('mi,mij->mj', centroids - mobile_c, rot) + target_c
+
+
+def folder_signature(folder):
+    """Names and modification times of the structure files in a folder, used to invalidate the cache."""
+    pdb_files = list_structure_files(folder)
+    return json.dumps([[f, os.path.getmtime(os.path.join(folder, f))] for f in pdb_files])
+
+
+def reference_parameters(chain_id, ligand_name, pocket_resnums, res1, res2):
+    """The parameters a parent reference was built with, used to invalidate the cache when they change."""
+    return json.dumps({'chain': chain_id, 'ligand': ligand_name, 'pocket': [int(r) for r in pocket_resnums],
+                       'res1': int(res1), 'res2': int(res2)})
+
+
+def build_parent_reference(parent_folder, chain_id, ligand_name, pocket_resnums, res1, res2):
+    """
+    Computes the parent-scaffold reference features once: mean CA distance map,
+    medoid model, pocket geometry, ligand centroid distribution and openness
+    distribution.
+    """
+    ensemble = load_ensemble(parent_folder, chain_id, ligand_name, pocket_resnums, res1, res2)
+    if ensemble is None:
+        raise ValueError(f"No valid parent models found in {parent_folder}")
+    if len(ensemble['pocket_idx']) < 3:
+        raise ValueError(f"Fewer than 3 binding pocket residues found in parent {parent_folder}")
+
+    ca_models = ensemble['ca_coords']
+    # Medoid: the model with the lowest summed RMSD to every other model
+    rmsd_sums = np.array([superposed_rmsd(ca_models, ca).sum() for ca in ca_models])
+    medoid = int(np.argmin(rmsd_sums))
+    medoid_pocket = ca_models[medoid][ensemble['pocket_idx']]
+    centroids = pocket_frame_centroids(ensemble, medoid_pocket)
+
+    return {
+        'version': np.array(CACHE_VERSION),
+        'signature': np.array(folder_signature(parent_folder)),
+        'parameters': np.array(reference_parameters(chain_id, ligand_name, pocket_resnums, res1, res2)),
+        'models': ensemble['models'],
+        'resnums': ensemble['resnums'],
+        'pocket_resnums': ensemble['resnums'][ensemble['pocket_idx']],
+        'mean_dmap': mean_distance_map(ca_models),
+        'medoid_index': np.array(medoid),
+        'medoid_coords': ca_models[medoid],
+        'medoid_pocket': medoid_pocket,
+        'ligand_centroids': centroids,
+        'openness': ensemble['openness'],
+    }
+
+
+def load_or_build_parent_reference(parent_folder, cache_path, chain_id, ligand_name, pocket_resnums, res1, res2):
+    """
+    Returns the cached parent reference, rebuilding it if the parent models or
+    the chain, ligand, pocket residues or openness residues changed.
+    """
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            ref = {k: cached[k] for k in cached.files}
+        if (int(ref['version']) == CACHE_VERSION
+                and str(ref['signature']) == folder_signature(parent_folder)
+                and str(ref['parameters']) == reference_parameters(chain_id, ligand_name, pocket_resnums, res1, res2)):
+            print(f"Loaded cached parent reference: {cache_path}")
+            return ref
+        print(f"Parent reference cache is stale, rebuilding: {cache_path}")
+
+    print(f"Building parent reference from {parent_folder}...")
+    ref = build_parent_reference(parent_folder, chain_id, ligand_name, pocket_resnums, res1, res2)
+    np.savez(cache_path, **ref)
+    print(f"Parent reference cached to: {cache_path}")
+    return ref
+
+
+def score_variant(folder, ref, chain_id, ligand_name, res1, res2):
+    """
+    Scores one variant ensemble against the parent reference.
+
+    Returns:
+        dict or None: Delta features, or None if the folder has no valid models.
+    """
+    ensemble = load_ensemble(folder, chain_id, ligand_name, ref['pocket_resnums'], res1, res2)
+    if ensemble is None:
+        return None
+
+    ca_models = ensemble['ca_coords']
+    row = {'n_models': len(ca_models)}
+
+    if np.array_equal(ensemble['resnums'], ref['resnums']):
+        delta = mean_distance_map(ca_models) - ref['mean_dmap']
+        condensed = delta[np.triu_indices_from(delta, k=1)]
+        row['dmap_delta_mean_abs'] = np.mean(np.abs(condensed))
+        row['dmap_delta_rms'] = np.sqrt(np.mean(condensed ** 2))
+        row['dmap_delta_max_abs'] = np.max(np.abs(condensed))
+        rmsd = superposed_rmsd(ca_models, ref['medoid_coords'])
+        row['rmsd_to_parent_avg'] = rmsd.mean()
+        row['rmsd_to_parent_min'] = rmsd.min()
+    else:
+        print(f"  Residue numbering differs from parent, skipping distance map and RMSD deltas.")
+
+    # Left out (written as NA) when either ensemble lacks one of the openness residues
+    if np.any(np.isfinite(ensemble['openness'])) and np.any(np.isfinite(ref['openness'])):
+        row['openess_shift'] = np.nanmean(ensemble['openness']) - np.nanmean(ref['openness'])
+
+    if np.array_equal(ensemble['resnums'][ensemble['pocket_idx']], ref['pocket_resnums']):
+        centroids = pocket_frame_centroids(ensemble, ref['medoid_pocket'])
+        parent_mean = np.nanmean(ref['ligand_centroids'], axis=0)
+        per_model = np.linalg.norm(centroids - parent_mean, axis=1)
+        row['ligand_centroid_displacement'] = np.linalg.norm(np.nanmean(centroids, axis=0) - parent_mean)
+        row['ligand_centroid_displacement_avg'] = np.nanmean(per_model)
+    else:
+        print(f"  Binding pocket residues differ from parent, skipping ligand displacement.")
+
+    return row
+
+
+def score_all_variants(parent_folder, output_dir, parent_tag, chain_id, res1, res2,
+                       ligand_name=LIGAND_RESIDUE_NAME, pocket_residues=BINDING_POCKET_RESIDUES):
+    os.makedirs(output_dir, exist_ok=True)
+    parent_path = os.path.join(parent_folder, parent_tag)
+    if not os.path.isdir(parent_path):
+        raise FileNotFoundError(f"Parent tag folder not found: {parent_path}")
+
+    pocket_resnums = pocket_residues.get(chain_id, [])
+    cache_path = os.path.join(output_dir, f"parent_reference_{parent_tag}.npz")
+    ref = load_or_build_parent_reference(parent_path, cache_path, chain_id, ligand_name, pocket_resnums, res1, res2)
+
+    fieldnames = [
+        'Tag', 'Parent_Tag', 'n_models',
+        'dmap_delta_mean_abs', 'dmap_delta_rms', 'dmap_delta_max_abs',
+        'rmsd_to_parent_avg', 'rmsd_to_parent_min', 'openess_shift',
+        'ligand_centroid_displacement', 'ligand_centroid_displacement_avg'
+    ]
+    rows = []
+    for tag in sorted(os.listdir(parent_folder)):
+        folder = os.path.join(parent_folder, tag)
+        if tag == parent_tag or not os.path.isdir(folder):
+            continue
+        print(f"Scoring {tag} against {parent_tag}...")
+        row = score_variant(folder, ref, chain_id, ligand_name, res1, res2)
+        if row is None:
+            print(f"  Skipping {tag}, no valid PDBs.")
+            continue
+        formatted = {k: (f"{v:.3f}" if isinstance(v, (float, np.floating)) else v) for k, v in row.items()}
+        rows.append({'Tag': tag, 'Parent_Tag': parent_tag, **formatted})
+
+    csv_path = os.path.join(output_dir, "parent_deltas.csv")
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, restval='NA')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nParent deltas saved to: {csv_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every variant ensemble against a cached parent-scaffold reference ensemble.")
+    parser.add_argument("--input_dir", required=True, help="Path to input parent folder (folder of folders)")
+    parser.add_argument("--output_dir", required=True, help="Path to output folder (also holds the parent reference cache)")
+    parser.add_argument("--parent_tag", required=True, help="Tag (subfolder name) of the parent scaffold, e.g. iDopaSnFR_DOP")
+    parser.add_argument("--chain", default="A", help="Protein chain ID (default: A)")
+    parser.add_argument("--res1", type=int, default=40, help="First openness residue (default: 40)")
+    parser.add_argument("--res2", type=int, default=389, help="Second openness residue (default: 389)")
+    args = parser.parse_args()
+    score_all_variants(args.input_dir, args.output_dir, args.parent_tag, args.chain, args.res1, args.res2)
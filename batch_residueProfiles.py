@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import csv
+import argparse
+import numpy as np
+
+from fast_structure import apply_transforms, kabsch_transforms, list_structure_files, read_structure, select_atoms
+from model_filter import add_model_filter_arguments, model_filter_from_args, select_models
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path
+
+LIGAND_SUFFIX_RE = re.compile(r"_(DOP|5HT)$")
+
+# Long-format table: one row per (Tag, Ligand, residue), with the dtypes used for Parquet output
+PROFILE_COLUMNS = [
+    ('Tag', 'category'), ('Ligand', 'category'), ('chain', 'category'), ('resnum', 'int32'),
+    ('resname', 'category'), ('n_models', 'int16'), ('rmsf', 'float32'),
+    ('pLDDT_avg', 'float32'), ('pLDDT_min', 'float32'), ('openess_coupling', 'float32'),
+]
+PROFILE_FIELDS = [name for name, _ in PROFILE_COLUMNS]
+
+
+def split_tag_ligand(folder_name):
+    """'V1_DOP' -> ('V1', 'DOP'), using the same suffixes as the analysis.sh clean step."""
+    match = LIGAND_SUFFIX_RE.search(folder_name)
+    if not match:
+        return folder_name, ''
+    return folder_name[:match.start()], match.group(1)
+
+
+def read_ca_profile(pdb_file, chain_id):
+    """
+    Reads the C-alpha atoms of one chain.
+
+    Returns:
+        tuple: (resnums, resnames, coords (N, 3), pLDDT (N,) on a 0-1 scale).
+    """
+    atoms = read_structure(pdb_file)
+    ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id)]
+    if not len(ca):
+        raise ValueError(f"No CA atoms found for chain {chain_id} in {pdb_file}")
+    return ca['resnum'], ca['resname'], ca['coord'], ca['bfactor'] / 100.0
+
+
+def load_folder_ensemble(folder, chain_id, model_filter=None):
+    """
+    Stacks the CA coordinates and pLDDT of every (selected) model of a folder.
+    Models whose residue numbering differs from the first model are skipped.
+    """
+    pdb_files, _ = select_models(folder, list_structure_files(folder), model_filter)
+    resnums, resnames, coords, plddt = None, None, [], []
+    for pdb_file in pdb_files:
+        try:
+            model_resnums, model_resnames, ca, ca_plddt = read_ca_profile(os.path.join(folder, pdb_file), chain_id)
+        except Exception as e:
+            print(f"  Failed: {pdb_file} - {e}")
+            continue
+        if resnums is None:
+            resnums, resnames = model_resnums, model_resnames
+        elif not np.array_equal(resnums, model_resnums):
+            print(f"  Skipping {pdb_file}: residue numbering differs from first model.")
+            continue
+        coords.append(ca)
+        plddt.append(ca_plddt)
+
+    if not coords:
+        return None
+    return resnums, resnames, np.stack(coords), np.stack(plddt)
+
+
+def superpose_ensemble(ca_models, n_iter=2):
+    """Superposes every model onto the first one, then onto the ensemble mean `n_iter` - 1 more times."""
+    target = ca_models[0]
+    for _ in range(n_iter):
+        ca_models = apply_transforms(ca_models, *kabsch_transforms(ca_models, target))
+        target = ca_models.mean(axis=0)
+    return ca_models
+
+
+def residue_profiles(ca_models, plddt, resnums, res1, res2):
+    """
+    Per-residue RMSF, pLDDT mean/min and openness coupling of a superposed ensemble.
+
+    The openness coupling of a residue is the length of the regression slope of
+    its CA position on the res1-res2 CA distance across models, i.e. how many Å
+    the residue moves per Å the pocket opens (NaN if the openness does not vary).
+
+    Returns:
+        dict: Arrays of length N keyed by the PROFILE_FIELDS value columns.
+    """
+    deviations = ca_models - ca_models.mean(axis=0)
+    rmsf = np.sqrt(np.mean(np.sum(deviations ** 2, axis=2), axis=0))
+
+    coupling = np.full(len(resnums), np.nan)
+    idx1, idx2 = np.flatnonzero(resnums == res1), np.flatnonzero(resnums == res2)
+    if len(idx1) and len(idx2) and len(ca_models) > 1:
+        openness = np.linalg.norm(ca_models[:, idx1[0]] - ca_models[:, idx2[0]], axis=1)
+        openness_var = np.var(openness)
+        if openness_var > 0:
+            covariance = np.einsum('m,mnk->nk', openness - openness.mean(), deviations) / len(openness)
+            coupling = np.linalg.norm(covariance, axis=1) / openness_var
+
+    return {
+        'n_models': np.full(len(resnums), len(ca_models)),
+        'rmsf': rmsf,
+        'pLDDT_avg': plddt.mean(axis=0),
+        'pLDDT_min': plddt.min(axis=0),
+        'openess_coupling': coupling,
+    }
+
+
+def folder_profile_table(folder, chain_id, res1, res2, model_filter=None):
+    """Long-format profile columns of one prediction folder, or None if no model could be read."""
+    ensemble = load_folder_ensemble(folder, chain_id, model_filter)
+    if ensemble is None:
+        return None
+    resnums, resnames, ca_models, plddt = ensemble
+    tag, ligand = split_tag_ligand(os.path.basename(folder))
+    n = len(resnums)
+    columns = {
+        'Tag': np.full(n, tag, dtype=object), 'Ligand': np.full(n, ligand, dtype=object),
+        'chain': np.full(n, chain_id, dtype=object), 'resnum': resnums, 'resname': resnames.astype(object),
+    }
+    columns.update(residue_profiles(superpose_ensemble(ca_models), plddt, resnums, res1, res2))
+    return columns
+
+
+def write_profiles_csv(tables, output_path):
+    with open(output_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(PROFILE_FIELDS)
+        for table in tables:
+            for i in range(len(table['resnum'])):
+                row = []
+                for name, dtype in PROFILE_COLUMNS:
+                    value = table[name][i]
+                    if dtype.startswith('float'):
+                        value = 'NA' if np.isnan(value) else f"{value:.3f}"
+                    row.append(value)
+                writer.writerow(row)
+
+
+def write_profiles_parquet(tables, output_path):
+    """Writes the profiles with explicit column dtypes (requires pandas with pyarrow)."""
+    import pandas as pd
+
+    df = pd.DataFrame({name: np.concatenate([t[name] for t in tables]) if tables else [] for name in PROFILE_FIELDS})
+    df = df.astype(dict(PROFILE_COLUMNS))
+    df.to_parquet(output_path, index=False)
+
+
+def analyze_residue_profiles(parent_folder, output_dir, chain_id="A", res1=40, res2=389, output_format="csv",
+                             shard=None, model_filter=None):
+    """
+    Computes the per-residue profiles of every prediction folder and writes them
+    as one long-format table (residue_profiles.csv or .parquet).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tables = []
+    for name in select_shard(sorted(os.listdir(parent_folder)), shard):
+        folder = os.path.join(parent_folder, name)
+        if not os.path.isdir(folder):
+            continue
+        print(f"Processing {name}...")
+        table = folder_profile_table(folder, chain_id, res1, res2, model_filter)
+        if table is None:
+            print(f"  No readable models in {name}, skipping.")
+            continue
+        tables.append(table)
+
+    output_path = shard_output_path(os.path.join(output_dir, f"residue_profiles.{output_format}"), shard)
+    if output_format == "parquet":
+        write_profiles_parquet(tables, output_path)
+    else:
+        write_profiles_csv(tables, output_path)
+    print(f"Done. {sum(len(t['resnum']) for t in tables)} residue rows from {len(tables)} folders written to {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-residue RMSF, pLDDT and openness coupling profiles.")
+    parser.add_argument("--input_dir", required=True, help="Path to parent folder containing subfolders with PDBs")
+    parser.add_argument("--output_dir", required=True, help="Path to output folder")
+    parser.add_argument("--chain", default="A", help="Protein chain ID (default: A)")
+    parser.add_argument("--res1", type=int, default=40, help="First openness residue (default: 40)")
+    parser.add_argument("--res2", type=int, default=389, help="Second openness residue (default: 389)")
+    parser.add_argument("--format", dest="output_format", choices=["csv", "parquet"], default="csv",
+                        help="Output table format; parquet keeps the column dtypes and needs pyarrow (default: csv)")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
+    args = parser.parse_args()
+    analyze_residue_profiles(args.input_dir, args.output_dir, args.chain, args.res1, args.res2, args.output_format,
+                             parse_shard(args.shard), model_filter_from_args(args))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_LigOverlapVol import (
+    BINDING_POCKET_RESIDUES, DEFAULT_SEED, LIGAND_RESIDUE_NAME, VAN_DER_WAALS_RADII, process_pdb_files_in_subfolder
+)
+from batch_distanceMaps_variance import COMPOSITE_VARIANCE_FIELDS, process_folder
+from getAffinities import extract_folder_affinity
+from getOpenessDistances import folder_openess_distances
+from model_filter import add_model_filter_arguments, model_filter_from_args
+from memory_budget import add_memory_arguments, memory_plan_from_args
+
+# Per-ligand features kept in the joint table (same names as volumes_variances_affinities_openess.csv)
+LIGAND_FEATURES = [
+    'overlap_volume', 'overlap_w_pos_volume', 'overlap_w_neg_volume',
+    'ligand_pLDDT_avg', 'ligand_pLDDT_min', 'ligand_pLDDT_max',
+    'variance_avg', 'variance_pLDDT_w', 'complex_PDE_avg', 'complex_PDE_var',
+    'complex_PDE_min', 'complex_PDE_max', 'PAE_avg', 'PDE_avg',
+    'affinity_pred_value', 'affinity_probability_binary',
+    'openess_avg', 'openess_min', 'openess_max', 'openess_range', 'models_used'
+]
+
+# Features compared between ligands as reference - other (delta) and reference / other (ratio)
+SELECTIVITY_FEATURES = [
+    'overlap_volume', 'affinity_pred_value', 'affinity_probability_binary', 'openess_avg', 'variance_avg'
+]
+
+
+def parse_roots(root_args):
+    """Parses LIGAND=PATH pairs into an ordered {ligand: predictions_path} dict."""
+    roots = {}
+    for item in root_args:
+        if '=' not in item:
+            raise ValueError(f"--roots entries must look like LIGAND=PATH, got '{item}'")
+        ligand, path = item.split('=', 1)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"Prediction root for {ligand} not found: {path}")
+        roots[ligand] = path
+    return roots
+
+
+def strip_ligand_suffix(folder_name, ligand):
+    suffix = f"_{ligand}"
+    return folder_name[:-len(suffix)] if folder_name.endswith(suffix) else folder_name
+
+
+def featurize_folder(folder, ligand, output_dir, res1, res2, chain_id, model_filter=None, memory_plan=None,
+                     seed=DEFAULT_SEED):
+    """
+    Runs every per-folder analyzer (overlap volume, composite variance,
+    affinity, openness) on one (variant, ligand) prediction folder. The Monte
+    Carlo volume draws from a generator seeded with `seed` and the folder name,
+    so results do not depend on which worker runs the folder.
+    """
+    folder_name = os.path.basename(folder)
+    features = {'Tag': strip_ligand_suffix(folder_name, ligand), 'Ligand': ligand}
+
+    (_, pos_vol, neg_vol, raw_vol, avg_plddt, min_plddt, max_plddt, _, selection) = process_pdb_files_in_subfolder(
+        folder, BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, VAN_DER_WAALS_RADII, model_filter, memory_plan=memory_plan,
+        seed=seed
+    )
+    features['models_used'] = selection['models_used']
+    features.update({
+        'overlap_volume': raw_vol, 'overlap_w_pos_volume': pos_vol, 'overlap_w_neg_volume': neg_vol,
+        'ligand_pLDDT_avg': avg_plddt, 'ligand_pLDDT_min': min_plddt, 'ligand_pLDDT_max': max_plddt
+    })
+
+    variance_row = process_folder(folder, output_dir, model_filter, memory_plan=memory_plan)
+    if variance_row is not None:
+        features.update({k: v for k, v in zip(COMPOSITE_VARIANCE_FIELDS[1:], variance_row[1:]) if k in LIGAND_FEATURES})
+
+    rec, _, err = extract_folder_affinity(folder)
+    if rec:
+        features.update(rec)
+    else:
+        print(f"[SKIP] affinity for {folder_name}: {err}")
+
+    distances, _ = folder_openess_distances(folder, res1, res2, chain_id, model_filter)
+    if distances:
+        distances = np.array(distances)
+        features.update({
+            'openess_avg': distances.mean(), 'openess_min': distances.min(),
+            'openess_max': distances.max(), 'openess_range': distances.max() - distances.min()
+        })
+
+    return features
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def selectivity_columns(per_ligand, reference, others):
+    """Delta and ratio columns of SELECTIVITY_FEATURES between the reference ligand and every other ligand."""
+    columns = {}
+    for other in others:
+        for feature in SELECTIVITY_FEATURES:
+            ref_value = to_float(per_ligand.get(reference, {}).get(feature))
+            other_value = to_float(per_ligand.get(other, {}).get(feature))
+            delta_key = f"{feature}_delta_{reference}_{other}"
+            ratio_key = f"{feature}_ratio_{reference}_{other}"
+            if ref_value is None or other_value is None:
+                columns[delta_key] = columns[ratio_key] = 'NA'
+                continue
+            columns[delta_key] = f"{ref_value - other_value:.3f}"
+            columns[ratio_key] = f"{ref_value / other_value:.3f}" if other_value != 0 else 'NA'
+    return columns
+
+
+def run_joint_selectivity(roots, output_dir, res1, res2, chain_id, reference=None, workers=None, model_filter=None,
+                          memory_plan=None, seed=DEFAULT_SEED):
+    """
+    Featurizes every (variant, ligand) folder of several prediction roots on one
+    shared process pool and writes a single per-variant table with per-ligand
+    features and selectivity deltas/ratios. A `memory_plan` caps the pool at its
+    worker count.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ligands = list(roots)
+    reference = reference or ligands[0]
+    if reference not in roots:
+        raise ValueError(f"Reference ligand {reference} is not one of {ligands}")
+    others = [lig for lig in ligands if lig != reference]
+    if memory_plan:
+        workers = memory_plan['workers']
+
+    jobs = [
+        (os.path.join(path, name), ligand)
+        for ligand, path in roots.items()
+        for name in sorted(os.listdir(path))
+        if os.path.isdir(os.path.join(path, name))
+    ]
+    print(f"=== Joint selectivity: {len(jobs)} folders over ligands {ligands} (reference {reference}) ===")
+
+    per_variant = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(featurize_folder, folder, ligand, output_dir, res1, res2, chain_id, model_filter, memory_plan, seed): (folder, ligand)
+            for folder, ligand in jobs
+        }
+        for future in as_completed(futures):
+            folder, ligand = futures[future]
+            try:
+                features = future.result()
+            except Exception as e:
+                print(f"Failed: {folder} ({ligand}) - {e}")
+                continue
+            per_variant.setdefault(features['Tag'], {})[ligand] = features
+
+    fieldnames = ['Tag'] + [f"{feature}_{ligand}" for ligand in ligands for feature in LIGAND_FEATURES]
+    fieldnames += list(selectivity_columns({}, reference, others))
+    rows = []
+    for tag in sorted(per_variant):
+        per_ligand = per_variant[tag]
+        row = {'Tag': tag}
+        for ligand, features in per_ligand.items():
+            for feature in LIGAND_FEATURES:
+                value = features.get(feature, 'NA')
+                row[f"{feature}_{ligand}"] = f"{value:.3f}" if isinstance(value, (float, np.floating)) else value
+        row.update(selectivity_columns(per_ligand, reference, others))
+        rows.append(row)
+
+    csv_path = os.path.join(output_dir, "selectivity_summary.csv")
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, restval='NA')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSelectivity summary saved to: {csv_path}")
+    return csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Joint multi-ligand featurization with per-variant selectivity deltas and ratios.")
+    parser.add_argument("--roots", nargs='+', required=True,
+                        help="Prediction roots as LIGAND=PATH pairs, e.g. DOP=/path/DOP/predictions 5HT=/path/5HT/predictions")
+    parser.add_argument("--output_dir", required=True, help="Path to output folder")
+    parser.add_argument("--reference_ligand", default=None, help="Ligand that deltas/ratios are computed against (default: first in --roots)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes shared by all ligands (default: CPU count)")
+    parser.add_argument("--res1", type=int, default=40, help="First openness residue (default: 40)")
+    parser.add_argument("--res2", type=int, default=389, help="Second openness residue (default: 389)")
+    parser.add_argument("--chain", default="A", help="Protein chain ID (default: A)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Base random seed of the Monte Carlo volumes (default: 0)")
+    add_model_filter_arguments(parser)
+    add_memory_arguments(parser)
+    args = parser.parse_args()
+    roots = parse_roots(args.roots)
+    memory_plan = memory_plan_from_args(args, list(roots.values()), args.workers, args.chain)
+    run_joint_selectivity(roots, args.output_dir, args.res1, args.res2, args.chain,
+                          args.reference_ligand, args.workers, model_filter_from_args(args), memory_plan, args.seed)
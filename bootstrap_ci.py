@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized bootstrap confidence intervals for ensemble features.
+
+Every resample is represented by its model counts c (how often each of the M
+models was drawn), so all B resamples are one (B, M) matrix and each feature is
+recomputed from per-model arrays kept in memory instead of re-reading files:
+
+- means/proportions: counts @ values / M
+- composite variance: mean_k var_k = (c . q) / M - c^T G c / (K M^2), with
+  q the per-model mean of squares and G = X X^T the (M, M) Gram matrix of the
+  flattened per-model matrices, so no (B, K) array is ever built
+
+The pooled ligand volume is a set union, which can only grow as models are
+added: a bootstrap resample (~63% distinct models) almost always covers less
+than the full ensemble, so percentile intervals would sit below the estimate.
+Its interval is a jackknife instead: the full and leave-one-out union volumes
+are counted on one set of Monte Carlo points from a per-model (M, points)
+membership matrix, and the interval is estimate -/+ t x jackknife SE.
+"""
+import numpy as np
+
+
+def resample_counts(n_models, n_boot, seed=0):
+    """(n_boot, n_models) model counts of n_boot bootstrap resamples."""
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(n_models, np.full(n_models, 1.0 / n_models), size=n_boot).astype(np.float64)
+
+
+def percentile_ci(samples, level=0.95):
+    """(low, high) percentile interval of bootstrap samples."""
+    alpha = (1.0 - level) / 2.0
+    low, high = np.percentile(samples, [100 * alpha, 100 * (1 - alpha)])
+    return low, high
+
+
+def bootstrap_mean(values, counts):
+    """Mean of per-model `values` (M,) for every resample."""
+    return counts @ np.asarray(values, dtype=np.float64) / counts.shape[1]
+
+
+def bootstrap_composite_variance(matrices, counts, chunk=None):
+    """
+    Composite variance (mean over elements of the across-model variance, as in
+    compute_variance) of a stack of per-model matrices for every resample.
+
+    q and G are accumulated over `chunk` elements at a time (like
+    composite_variance), so only one (M, chunk) float64 slice is built and the
+    matrices keep their own dtype.
+    """
+    flat = [np.asarray(m).ravel() for m in matrices]
+    n_models, n_elements = len(flat), flat[0].size
+    chunk = chunk or n_elements
+    q = np.zeros(n_models)
+    gram = np.zeros((n_models, n_models))
+    for start in range(0, n_elements, chunk):
+        x = np.stack([f[start:start + chunk] for f in flat]).astype(np.float64, copy=False)
+        q += np.einsum('ij,ij->i', x, x)
+        gram += x @ x.T
+    first = counts @ q / (n_elements * n_models)
+    second = np.einsum('bi,ij,bj->b', counts, gram, counts) / (n_elements * n_models ** 2)
+    return first - second
+
+
+def union_membership(coords_per_model, radii_per_model, points, chunk_points=None):
+    """(M, P) bool matrix: which Monte Carlo points fall inside the ligand spheres of each model."""
+    chunk_points = chunk_points or len(points)
+    membership = np.zeros((len(coords_per_model), len(points)), dtype=bool)
+    for m, (coords, radii) in enumerate(zip(coords_per_model, radii_per_model)):
+        for start in range(0, len(points), chunk_points):
+            d2 = np.sum((points[start:start + chunk_points, np.newaxis, :] - coords[np.newaxis, :, :]) ** 2, axis=2)
+            membership[m, start:start + chunk_points] = np.any(d2 <= radii[np.newaxis, :] ** 2, axis=1)
+    return membership
+
+
+def jackknife_union_volume(membership, box_volume):
+    """
+    Union volume of all models and the M leave-one-out union volumes, all
+    counted on the same Monte Carlo points.
+
+    Returns:
+        tuple: (full volume, (M,) leave-one-out volumes).
+    """
+    coverage = membership.sum(axis=0)
+    n_covered = np.count_nonzero(coverage)
+    # Leaving model m out uncovers exactly the points that only m covers
+    only_this_model = np.count_nonzero(membership & (coverage == 1), axis=1)
+    n_points = membership.shape[1]
+    return n_covered / n_points * box_volume, (n_covered - only_this_model) / n_points * box_volume
+
+
+def jackknife_ci(estimate, loo_values, level=0.95):
+    """(low, high) estimate -/+ t quantile x jackknife standard error of leave-one-out values."""
+    from scipy.stats import t
+
+    n = len(loo_values)
+    se = np.sqrt((n - 1) / n * np.sum((loo_values - np.mean(loo_values)) ** 2))
+    half_width = t.ppf(1 - (1 - level) / 2, n - 1) * se
+    return estimate - half_width, estimate + half_width
+
+
+def ci_columns(name, samples, level=0.95):
+    """{'<name>_ci_low': ..., '<name>_ci_high': ...} formatted like the other CSV values."""
+    low, high = percentile_ci(samples, level)
+    return {f"{name}_ci_low": f"{low:.3f}", f"{name}_ci_high": f"{high:.3f}"}
+
+
+def jackknife_ci_columns(name, estimate, loo_values, level=0.95):
+    """ci_columns() of a jackknife interval; 'NA' with fewer than two models."""
+    if len(loo_values) < 2:
+        return {f"{name}_ci_low": 'NA', f"{name}_ci_high": 'NA'}
+    low, high = jackknife_ci(estimate, loo_values, level)
+    return {f"{name}_ci_low": f"{low:.3f}", f"{name}_ci_high": f"{high:.3f}"}
+
+
+def ci_fieldnames(names):
+    return [f"{name}_ci_{bound}" for name in names for bound in ('low', 'high')]
+
+
+def add_bootstrap_arguments(parser):
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="Number of bootstrap resamples of the models for CI columns (default: 0, off)")
+    parser.add_argument("--ci_level", "--ci-level", dest="ci_level", type=float, default=0.95,
+                        help="Confidence level of the bootstrap intervals (default: 0.95)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the bootstrap and of the Monte Carlo volume points (default: 0)")
+
+
+def bootstrap_from_args(args):
+    """{'n_boot', 'level', 'seed'} from add_bootstrap_arguments() options, or None when off."""
+    if args.bootstrap <= 0:
+        return None
+    return {'n_boot': args.bootstrap, 'level': args.ci_level, 'seed': args.seed}
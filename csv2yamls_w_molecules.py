@@ -15,7 +15,8 @@ def load_molecules(molecules_arg: str) -> dict:
         raise ValueError("--molecules must be valid JSON or a path to a JSON file.")
 
 
-def generate_yaml_files(csv_file_path: str, output_dir: str, molecules_dict: dict) -> None:
+def generate_yaml_files(csv_file_path: str, output_dir: str, molecules_dict: dict,
+                        cache_dir: str = None, settings: dict = None, manifest_path: str = None) -> None:
     """
     Reads a CSV file containing protein tags and sequences, and generates YAML files for each entry,
     pairing the protein with ligands provided in the molecules dictionary.
@@ -25,11 +26,24 @@ def generate_yaml_files(csv_file_path: str, output_dir: str, molecules_dict: dic
     properties:
         - affinity:
             binder: B
+
+    With a prediction store (cache_dir, see prediction_cache.py) only jobs whose
+    (sequence, SMILES, settings) key is neither stored nor already emitted get a
+    YAML, and a YAML left in output_dir by an earlier run for a cached or
+    duplicate job is removed so it is not predicted again. Every requested name
+    and its key is listed in the manifest for prediction_cache.py
+    ingest/materialize. `settings` holds the prediction_key settings of the
+    Boltz run (num_models, recycles, use_potentials, output_format, MSA server
+    and pairing strategy).
     """
 
     # Ensure the output directory exists
     os.makedirs(output_dir, exist_ok=True)
     print(f"Output directory '{output_dir}' ensured.")
+    manifest, emitted_keys = [], set()
+    if cache_dir is not None:
+        # Imported only with a store, so plain YAML generation does not load numpy
+        from prediction_cache import default_manifest_path, is_cached, prediction_key, write_manifest
 
     try:
         with open(csv_file_path, mode='r', newline='', encoding='utf-8') as csvfile:
@@ -77,6 +91,25 @@ def generate_yaml_files(csv_file_path: str, output_dir: str, molecules_dict: dic
                     output_filename = f"{sanitized_tag}_{ligand_code}.yaml"
                     output_file_path = os.path.join(output_dir, output_filename)
 
+                    if cache_dir is not None:
+                        name = f"{sanitized_tag}_{ligand_code}"
+                        key = prediction_key(sequence, ligand_smiles, **settings)
+                        if is_cached(cache_dir, key):
+                            status = 'cached'
+                            print(f"Cached: {name} ({key[:12]}), no YAML written")
+                        elif key in emitted_keys:
+                            status = 'duplicate'
+                            print(f"Duplicate: {name} ({key[:12]}) is predicted under another name, no YAML written")
+                        else:
+                            status = 'predict'
+                            emitted_keys.add(key)
+                        manifest.append({'name': name, 'key': key, 'status': status})
+                        if status != 'predict':
+                            if os.path.exists(output_file_path):
+                                os.remove(output_file_path)
+                                print(f"Removed stale YAML from an earlier run: {output_file_path}")
+                            continue
+
                     # Write the YAML data to the file
                     try:
                         with open(output_file_path, 'w', encoding='utf-8') as outfile:
@@ -90,6 +123,12 @@ def generate_yaml_files(csv_file_path: str, output_dir: str, molecules_dict: dic
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
+    if cache_dir is not None:
+        manifest_path = manifest_path or default_manifest_path(output_dir)
+        write_manifest(manifest, manifest_path)
+        n_predict = sum(row['status'] == 'predict' for row in manifest)
+        print(f"{n_predict} of {len(manifest)} jobs need prediction; manifest written to {manifest_path}")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -115,6 +154,29 @@ if __name__ == "__main__":
         )
     )
 
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="Prediction store (see prediction_cache.py); only jobs not already stored get a YAML."
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Manifest CSV of requested names and their keys (default: <output-dir>_cache_manifest.csv)"
+    )
+    parser.add_argument("--num-models", type=int, default=25, help="Diffusion samples of the Boltz run, part of the cache key (default: 25)")
+    parser.add_argument("--recycles", type=int, default=0, help="Recycling steps of the Boltz run, part of the cache key (default: 0)")
+    parser.add_argument("--no-potentials", action="store_true", help="The Boltz run does not use --use_potentials (cache key)")
+    # Defaults live in prediction_cache (the Boltz defaults), which is only imported with --cache
+    parser.add_argument("--output-format", choices=["pdb", "mmcif"], default=None,
+                        help="--output_format of the Boltz run, part of the cache key (default: pdb)")
+    parser.add_argument("--msa-server-url", default=None,
+                        help="MSA server of the Boltz run, part of the cache key (default: https://api.colabfold.com)")
+    parser.add_argument("--msa-pairing-strategy", choices=["greedy", "complete"], default=None,
+                        help="MSA pairing strategy of the Boltz run, part of the cache key (default: greedy)")
+
     args = parser.parse_args()
 
     try:
@@ -123,4 +185,8 @@ if __name__ == "__main__":
         print(f"Error: {ve}")
         raise SystemExit(1)
 
-    generate_yaml_files(args.csv_file, args.output_dir, molecules_dict)
+    settings = {'num_models': args.num_models, 'recycles': args.recycles, 'use_potentials': not args.no_potentials}
+    for name in ('output_format', 'msa_server_url', 'msa_pairing_strategy'):
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    generate_yaml_files(args.csv_file, args.output_dir, molecules_dict, args.cache, settings, args.manifest)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized structure reading and superposition helpers shared by the analysis scripts.
+
+PDB files are loaded as one byte buffer and the fixed columns are sliced for all
+atoms at once; Boltz mmCIF output is read from its _atom_site loop into the same
+structured array, so every analyzer works on either --output_format.
+"""
+import os
+import re
+import numpy as np
+
+STRUCTURE_EXTENSIONS = ('.pdb', '.cif')
+
+ATOM_DTYPE = np.dtype([
+    ('record', 'U6'),
+    ('name', 'U4'),
+    ('resname', 'U3'),
+    ('chain', 'U4'),
+    ('resnum', 'i4'),
+    ('coord', 'f8', (3,)),
+    ('bfactor', 'f8'),
+    ('element', 'U2'),
+])
+
+# Fixed PDB columns (start, end) for each field
+PDB_COLUMNS = {
+    'record': (0, 6), 'name': (12, 16), 'resname': (17, 20), 'chain': (21, 22),
+    'resnum': (22, 26), 'x': (30, 38), 'y': (38, 46), 'z': (46, 54),
+    'bfactor': (60, 66), 'element': (76, 78),
+}
+PDB_LINE_WIDTH = 80
+
+# _atom_site items for each field, in order of preference
+CIF_ITEMS = {
+    'record': ['group_PDB'],
+    'name': ['auth_atom_id', 'label_atom_id'],
+    'resname': ['auth_comp_id', 'label_comp_id'],
+    'chain': ['auth_asym_id', 'label_asym_id'],
+    'resnum': ['auth_seq_id', 'label_seq_id'],
+    'x': ['Cartn_x'], 'y': ['Cartn_y'], 'z': ['Cartn_z'],
+    'bfactor': ['B_iso_or_equiv'],
+    'element': ['type_symbol'],
+}
+# mmCIF value: quoted ('...' or "..." closed before whitespace) or bare; quotes inside a bare value such as C1' are kept
+CIF_TOKEN_RE = re.compile(rb"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+
+def is_structure_file(filename):
+    return filename.lower().endswith(STRUCTURE_EXTENSIONS)
+
+
+def structure_stem(filename):
+    """File name without its structure extension, e.g. 'X_model_0.pdb' -> 'X_model_0'."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def list_structure_files(folder):
+    """Sorted structure files in a prediction folder. mmCIF files are skipped when a PDB of the same model exists."""
+    names = [f for f in os.listdir(folder) if is_structure_file(f)]
+    pdb_stems = {structure_stem(f) for f in names if f.lower().endswith('.pdb')}
+    return sorted(f for f in names if f.lower().endswith('.pdb') or structure_stem(f) not in pdb_stems)
+
+
+def _fill_element(atoms):
+    """Infers missing elements from the first letter of the atom name, like Bio.PDB does."""
+    missing = atoms['element'] == ''
+    if np.any(missing):
+        names = np.char.lstrip(atoms['name'][missing], '0123456789')
+        atoms['element'][missing] = np.char.upper(names.astype('U1'))
+    return atoms
+
+
+def read_pdb_atoms(pdb_file):
+    """
+    Reads the ATOM/HETATM records of a PDB file into a structured array.
+
+    The file is read as one byte buffer; line starts are located with NumPy and
+    every fixed column is sliced for all atoms in a single operation.
+
+    Returns:
+        np.ndarray: Structured array with dtype ATOM_DTYPE. Only the first MODEL is read.
+    """
+    with open(pdb_file, 'rb') as f:
+        data = f.read()
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return np.zeros(0, dtype=ATOM_DTYPE)
+
+    ends = np.flatnonzero(buf == ord('\n'))
+    if ends.size == 0 or ends[-1] != buf.size - 1:
+        ends = np.append(ends, buf.size)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # Stop at the first ENDMDL so multi-model files only contribute their first model
+    head = buf[np.minimum(starts[:, None] + np.arange(6), buf.size - 1)]
+    endmdl = np.flatnonzero(np.all(head == np.frombuffer(b'ENDMDL', dtype=np.uint8), axis=1))
+    if endmdl.size:
+        starts, ends, head = starts[:endmdl[0]], ends[:endmdl[0]], head[:endmdl[0]]
+
+    is_atom = np.all(head == np.frombuffer(b'ATOM  ', dtype=np.uint8), axis=1)
+    is_hetatm = np.all(head == np.frombuffer(b'HETATM', dtype=np.uint8), axis=1)
+    keep = (is_atom | is_hetatm) & ((ends - starts) >= PDB_COLUMNS['z'][1])
+    starts, lengths = starts[keep], (ends - starts)[keep]
+
+    cols = np.arange(PDB_LINE_WIDTH)
+    idx = np.minimum(starts[:, None] + cols, buf.size - 1)
+    lines = np.where(cols < lengths[:, None], buf[idx], ord(' ')).astype(np.uint8)
+    lines[lines == ord('\r')] = ord(' ')
+
+    def column(field):
+        start, end = PDB_COLUMNS[field]
+        return np.ascontiguousarray(lines[:, start:end]).view(f'S{end - start}').ravel()
+
+    atoms = np.zeros(len(lines), dtype=ATOM_DTYPE)
+    for field in ('record', 'name', 'resname', 'chain', 'element'):
+        atoms[field] = np.char.strip(column(field)).astype('U')
+    atoms['resnum'] = column('resnum').astype(np.int32)
+    atoms['coord'] = np.stack([column(axis).astype(float) for axis in 'xyz'], axis=1)
+    bfactor = np.char.strip(column('bfactor'))
+    atoms['bfactor'] = np.where(bfactor == b'', b'0', bfactor).astype(float)
+    return _fill_element(atoms)
+
+
+def _atom_site_loop(lines):
+    """Returns the _atom_site item names and data rows of an mmCIF file."""
+    items, rows = [], []
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() == b'loop_' and i + 1 < len(lines) and lines[i + 1].startswith(b'_atom_site.'):
+            i += 1
+            while i < len(lines) and lines[i].startswith(b'_atom_site.'):
+                items.append(lines[i].strip()[len(b'_atom_site.'):].decode())
+                i += 1
+            while i < len(lines) and lines[i].strip() and not lines[i].startswith((b'#', b'loop_', b'_')):
+                rows.append(lines[i])
+                i += 1
+            break
+        i += 1
+    return items, rows
+
+
+def _unquote(table):
+    """Removes a matching pair of surrounding quotes from mmCIF values, leaving quotes inside names (C1', O5') alone."""
+    quoted = np.char.str_len(table) >= 2
+    quoted &= ((np.char.startswith(table, b"'") & np.char.endswith(table, b"'"))
+               | (np.char.startswith(table, b'"') & np.char.endswith(table, b'"')))
+    if np.any(quoted):
+        table[quoted] = [value[1:-1] for value in table[quoted]]
+    return table
+
+
+def read_cif_atoms(cif_file):
+    """
+    Reads the _atom_site loop of an mmCIF file (e.g. Boltz output) into the same
+    structured array as read_pdb_atoms. Only the first model is read.
+    """
+    with open(cif_file, 'rb') as f:
+        items, rows = _atom_site_loop(f.read().splitlines())
+    if not items or not rows:
+        return np.zeros(0, dtype=ATOM_DTYPE)
+
+    tokens = b' '.join(rows).split()
+    if len(tokens) % len(items):
+        # Quoted values containing spaces: fall back to a per-row tokenizer, which also unquotes
+        tokens = [match.group(match.lastindex) for row in rows for match in CIF_TOKEN_RE.finditer(row)]
+        table = np.array(tokens).reshape(-1, len(items))
+    else:
+        table = _unquote(np.array(tokens).reshape(-1, len(items)))
+
+    if 'pdbx_PDB_model_num' in items:
+        model_num = table[:, items.index('pdbx_PDB_model_num')]
+        table = table[model_num == model_num[0]]
+
+    def column(field):
+        for item in CIF_ITEMS[field]:
+            if item in items:
+                return table[:, items.index(item)]
+        return np.full(len(table), b'')
+
+    def numeric(values, default=b'0'):
+        return np.where(np.isin(values, [b'.', b'?', b'']), default, values)
+
+    atoms = np.zeros(len(table), dtype=ATOM_DTYPE)
+    for field in ('record', 'name', 'resname', 'chain', 'element'):
+        atoms[field] = column(field).astype('U')
+    atoms['resnum'] = numeric(column('resnum'), b'1').astype(np.int32)
+    atoms['coord'] = np.stack([column(axis).astype(float) for axis in 'xyz'], axis=1)
+    atoms['bfactor'] = numeric(column('bfactor')).astype(float)
+    return _fill_element(atoms)
+
+
+def read_structure(path):
+    """Reads a .pdb or .cif structure file into an ATOM_DTYPE structured array."""
+    if path.lower().endswith('.cif'):
+        return read_cif_atoms(path)
+    return read_pdb_atoms(path)
+
+
+def select_atoms(atoms, record=None, chain=None, name=None, resname=None, resnums=None, exclude_record=None):
+    """Boolean mask over `atoms` matching every given criterion."""
+    mask = np.ones(len(atoms), dtype=bool)
+    if record is not None:
+        mask &= atoms['record'] == record
+    if exclude_record is not None:
+        mask &= atoms['record'] != exclude_record
+    if chain is not None:
+        mask &= atoms['chain'] == chain
+    if name is not None:
+        mask &= atoms['name'] == name
+    if resname is not None:
+        mask &= atoms['resname'] == resname.strip()
+    if resnums is not None:
+        mask &= np.isin(atoms['resnum'], list(resnums))
+    return mask
+
+
+def kabsch_transforms(mobile, target):
+    """
+    Batched Kabsch superposition.
+
+    Args:
+        mobile (np.ndarray): (M, N, 3) coordinates to move.
+        target (np.ndarray): (N, 3) or (M, N, 3) reference coordinates.
+
+    Returns:
+        tuple: (rotations (M, 3, 3), mobile centroids (M, 3), target centroids (M, 3)).
+        A point p of model m is superposed as (p - mobile_c[m]) @ R[m] + target_c[m].
+    """
+    mobile = np.asarray(mobile, dtype=float)
+    target = np.broadcast_to(np.asarray(target, dtype=float), mobile.shape)
+    mobile_c = mobile.mean(axis=1)
+    target_c = target.mean(axis=1)
+    h = np.einsum('mni,mnj->mij', mobile - mobile_c[:, None], target - target_c[:, None])
+    u, _, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(u @ vt))
+    u[:, :, -1] *= d[:, None]
+    return u @ vt, mobile_c, target_c
+
+
+def apply_transforms(coords, rot, mobile_c, target_c):
+    """Applies kabsch_transforms output to (M, K, 3) coordinates."""
+    return np.einsum('mki,mij->mkj', coords - mobile_c[:, None], rot) + target_c[:, None]
+
+
+def superposed_rmsd(mobile, target):
+    """RMSD of every model in `mobile` (M, N, 3) to `target` after optimal superposition."""
+    rot, mobile_c, target_c = kabsch_transforms(mobile, target)
+    moved = apply_transforms(mobile, rot, mobile_c, target_c)
+    target = np.broadcast_to(target, moved.shape)
+    return np.sqrt(np.mean(np.sum((moved - target) ** 2, axis=2), axis=1))
@@ -2,6 +2,7 @@
 #!/usr/bin/env python3
 import os, json, csv, argparse, glob
 import numpy as np
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path
 
 REQ_KEYS_JSON = ("affinity_pred_value", "affinity_probability_binary")
 
@@ -77,33 +78,33 @@ def try_from_npz(path):
     except Exception as e:
         return None, f"NPZ read error: {e}"
 
-def extract_affinity_values(input_dir, output_csv):
+def extract_folder_affinity(folder_path):
+    """Return (record, used_file, error) for the first JSON/NPZ in folder_path holding affinity values."""
+    files = find_candidate_files(folder_path)
+    if not files:
+        return None, None, "no JSON/NPZ found"
+
+    rec = None
+    err = None
+    for path in files:
+        if path.endswith(".json"):
+            rec, err = try_from_json(path)
+        elif path.endswith(".npz"):
+            rec, err = try_from_npz(path)
+        if rec:
+            return rec, os.path.basename(path), None
+    return None, None, err
+
+def extract_affinity_values(input_dir, output_csv, shard=None):
     rows, skipped, details = [], [], []
     folder_names = sorted(d for d in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, d)))
+    folder_names = select_shard(folder_names, shard)
+    output_csv = shard_output_path(output_csv, shard)
+    os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
 
     for folder_name in folder_names:
         folder_path = os.path.join(input_dir, folder_name)
-        files = find_candidate_files(folder_path)
-        if not files:
-            skipped.append(folder_name)
-            details.append(f"[MISS] {folder_name}: no JSON/NPZ found")
-            continue
-
-        used = None
-        rec = None
-        err = None
-        for path in files:
-            if path.endswith(".json"):
-                rec, err = try_from_json(path)
-                if rec: 
-                    used = os.path.basename(path)
-                    break
-            elif path.endswith(".npz"):
-                rec, err = try_from_npz(path)
-                if rec:
-                    used = os.path.basename(path)
-                    break
-
+        rec, used, err = extract_folder_affinity(folder_path)
         if rec:
             rows.append({"Tag": folder_name, **rec})
             details.append(f"[OK]   {folder_name}: {used}")
@@ -133,6 +134,7 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser(description="Extract affinity values from JSON/NPZ files in subfolders.")
     ap.add_argument('--input-dir', required=True, help="Parent folder containing result subfolders.")
     ap.add_argument('--output-csv', required=True, help="Output CSV file path.")
+    add_shard_argument(ap)
     args = ap.parse_args()
-    extract_affinity_values(args.input_dir, args.output_csv)
+    extract_affinity_values(args.input_dir, args.output_csv, parse_shard(args.shard))
 
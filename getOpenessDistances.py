@@ -2,37 +2,39 @@
 import os
 import csv
 import numpy as np
+from sharding import add_shard_argument, parse_shard, select_shard, shard_output_path
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args, select_models
+from fast_structure import list_structure_files, read_structure, select_atoms
 
 def extract_ca_coordinates(pdb_file, res1, res2, chain_id):
-    ca_coords = {}
-    with open(pdb_file, 'r') as file:
-        for line in file:
-            if line.startswith("ATOM") and line[12:16].strip() == "CA" and line[21] == chain_id:
-                res_num = int(line[22:26].strip())
-                if res_num in (res1, res2):
-                    x = float(line[30:38])
-                    y = float(line[38:46])
-                    z = float(line[46:54])
-                    ca_coords[res_num] = np.array([x, y, z])
+    atoms = read_structure(pdb_file)
+    ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id, resnums=(res1, res2))]
+    ca_coords = dict(zip(ca['resnum'], ca['coord']))
     if res1 in ca_coords and res2 in ca_coords:
         return np.linalg.norm(ca_coords[res1] - ca_coords[res2])
     return None
 
-def analyze_openess(parent_folder, res1, res2, chain_id, output_csv="openess_summary.csv"):
+def folder_openess_distances(subfolder, res1, res2, chain_id, model_filter=None):
+    distances = []
+    selected, selection = select_models(subfolder, list_structure_files(subfolder), model_filter)
+    for file in selected:
+        pdb_path = os.path.join(subfolder, file)
+        distance = extract_ca_coordinates(pdb_path, res1, res2, chain_id)
+        if distance is not None:
+            distances.append(distance)
+    return distances, selection
+
+def analyze_openess(parent_folder, res1, res2, chain_id, output_csv="openess_summary.csv", shard=None, model_filter=None):
     results = []
+    output_csv = shard_output_path(output_csv, shard)
+    os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
 
-    for tag in os.listdir(parent_folder):
+    for tag in select_shard(sorted(os.listdir(parent_folder)), shard):
         subfolder = os.path.join(parent_folder, tag)
         if not os.path.isdir(subfolder):
             continue
 
-        distances = []
-        for file in os.listdir(subfolder):
-            if file.endswith(".pdb"):
-                pdb_path = os.path.join(subfolder, file)
-                distance = extract_ca_coordinates(pdb_path, res1, res2, chain_id)
-                if distance is not None:
-                    distances.append(distance)
+        distances, selection = folder_openess_distances(subfolder, res1, res2, chain_id, model_filter)
 
         if distances:
             distances = np.array(distances)
@@ -40,12 +42,13 @@ def analyze_openess(parent_folder, res1, res2, chain_id, output_csv="openess_sum
             openess_min = distances.min()
             openess_max = distances.max()
             openess_range = openess_max - openess_min
-            results.append([tag, openess_avg, openess_min, openess_max, openess_range])
+            results.append([tag, openess_avg, openess_min, openess_max, openess_range,
+                            selection['models_used'], selection['model_selection']])
 
     # Write CSV
     with open(output_csv, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow(["Tag", "openess_avg", "openess_min", "openess_max", "openess_range"])
+        writer.writerow(["Tag", "openess_avg", "openess_min", "openess_max", "openess_range"] + SELECTION_FIELDS)
         writer.writerows(results)
 
     print(f"Done. Output written to {output_csv}")
@@ -60,7 +63,10 @@ if __name__ == "__main__":
     parser.add_argument("--res2", type=int, required=True, help="Second residue number")
     parser.add_argument("--chain", type=str, required=True, help="Chain ID")
     parser.add_argument("--output-csv", default="openess_summary.csv", help="Output CSV filename")
+    add_shard_argument(parser)
+    add_model_filter_arguments(parser)
     args = parser.parse_args()
 
-    analyze_openess(args.parent_folder, args.res1, args.res2, args.chain, args.output_csv)
+    analyze_openess(args.parent_folder, args.res1, args.res2, args.chain, args.output_csv,
+                    parse_shard(args.shard), model_filter_from_args(args))
 
@@ -1,6 +1,8 @@
 import os
 import csv
 import numpy as np
+from fast_structure import list_structure_files, read_structure, select_atoms
+from bootstrap_ci import add_bootstrap_arguments, bootstrap_from_args, bootstrap_mean, ci_columns, ci_fieldnames, resample_counts
 import argparse
 
 def extract_ca_coordinates(pdb_file, res1, res2, chain_id):
@@ -18,21 +20,16 @@ def extract_ca_coordinates(pdb_file, res1, res2, chain_id):
         float or None: The distance between the C-alpha atoms in Angstroms,
                        or None if coordinates are not found.
     """
-    ca_coords = {}
-    with open(pdb_file, 'r') as file:
-        for line in file:
-            if line.startswith("ATOM") and line[12:16].strip() == "CA" and line[21] == chain_id:
-                res_num = int(line[22:26].strip())
-                if res_num in (res1, res2):
-                    x = float(line[30:38])
-                    y = float(line[38:46])
-                    z = float(line[46:54])
-                    ca_coords[res_num] = np.array([x, y, z])
+    atoms = read_structure(pdb_file)
+    ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id, resnums=(res1, res2))]
+    ca_coords = dict(zip(ca['resnum'], ca['coord']))
     if res1 in ca_coords and res2 in ca_coords:
         return np.linalg.norm(ca_coords[res1] - ca_coords[res2])
     return None
 
-def analyze_openess(parent_folder, res1, res2, chain_id, open_threshold, output_csv="openess_summary.csv"):
+BOOTSTRAP_OPENESS_FIELDS = ci_fieldnames(["openess_avg", "proportion_open"])
+
+def analyze_openess(parent_folder, res1, res2, chain_id, open_threshold, output_csv="openess_summary.csv", bootstrap=None):
     """
     Analyzes 'openess' metrics, including the proportion of open vs. closed
     models, for PDB files within a nested folder structure.
@@ -44,6 +41,8 @@ def analyze_openess(parent_folder, res1, res2, chain_id, open_threshold, output_
         chain_id (str): The chain ID.
         open_threshold (float): The distance threshold to define an "open" model.
         output_csv (str): The name of the output CSV file.
+        bootstrap (dict or None): {'n_boot', 'level', 'seed'}; adds CI columns for
+                                  openess_avg and proportion_open.
     """
     results = []
 
@@ -53,12 +52,11 @@ def analyze_openess(parent_folder, res1, res2, chain_id, open_threshold, output_
             continue
 
         distances = []
-        for file in os.listdir(subfolder):
-            if file.endswith(".pdb"):
-                pdb_path = os.path.join(subfolder, file)
-                distance = extract_ca_coordinates(pdb_path, res1, res2, chain_id)
-                if distance is not None:
-                    distances.append(distance)
+        for file in list_structure_files(subfolder):
+            pdb_path = os.path.join(subfolder, file)
+            distance = extract_ca_coordinates(pdb_path, res1, res2, chain_id)
+            if distance is not None:
+                distances.append(distance)
 
         if distances:
             distances = np.array(distances)
@@ -87,6 +85,13 @@ def analyze_openess(parent_folder, res1, res2, chain_id, open_threshold, output_
                 proportion_closed
             ])
 
+            if bootstrap:
+                # Both statistics are means over models, so each resample is one counts @ values
+                counts = resample_counts(total_models, bootstrap['n_boot'], bootstrap['seed'])
+                ci = ci_columns("openess_avg", bootstrap_mean(distances, counts), bootstrap['level'])
+                ci.update(ci_columns("proportion_open", bootstrap_mean(distances > open_threshold, counts), bootstrap['level']))
+                results[-1] += [ci[field] for field in BOOTSTRAP_OPENESS_FIELDS]
+
     # Write CSV
     with open(output_csv, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
@@ -98,7 +103,7 @@ def analyze_openess(parent_folder, res1, res2, chain_id, open_threshold, output_
             "openess_range",
             "proportion_open",
             "proportion_closed"
-        ])
+        ] + (BOOTSTRAP_OPENESS_FIELDS if bootstrap else []))
         writer.writerows(results)
 
     print(f"Done. Output written to {output_csv}")
@@ -111,6 +116,8 @@ if __name__ == "__main__":
     parser.add_argument("--chain", type=str, required=True, help="Chain ID")
     parser.add_argument("--open-threshold", type=float, default=17.5, help="Distance threshold (in Angstroms) to define an 'open' model. Default is 17.5.")
     parser.add_argument("--output-csv", default="openess_summary.csv", help="Output CSV filename")
+    add_bootstrap_arguments(parser)
     args = parser.parse_args()
 
-    analyze_openess(args.parent_folder, args.res1, args.res2, args.chain, args.open_threshold, args.output_csv)
+    analyze_openess(args.parent_folder, args.res1, args.res2, args.chain, args.open_threshold, args.output_csv,
+                    bootstrap_from_args(args))
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory Python API of the featurizers.
+
+The batch scripts read a predictions/ tree and write CSVs; these functions run
+the same computations on ensembles that are already in memory (a list of
+structures parsed with fast_structure.read_structure, one per model) and
+return dicts, arrays or pandas DataFrames, so notebooks and pipelines can call
+them without subprocesses or CSV round-trips:
+
+    from idopa_api import load_ensemble, featurize_ensemble
+    names, models, selection = load_ensemble("predictions/V1_DOP", {'metric': 'confidence_score', 'top_k': 5})
+    row = featurize_ensemble(models)
+
+pandas is imported only by the functions that return DataFrames.
+"""
+import os
+import numpy as np
+
+from batch_LigOverlapVol import (
+    BINDING_POCKET_RESIDUES, DEFAULT_SEED, LIGAND_RESIDUE_NAME, VAN_DER_WAALS_RADII, align_ligands, combined_ligand_volume,
+    folder_rng
+)
+from batch_distanceMaps_variance import ca_distance_map, composite_variance
+from batch_ligandBurial import BURIAL_INDIVIDUAL_FIELDS, model_burial, sphere_points
+from batch_ligandPoses import DEFAULT_RMSD_CUTOFF, POSE_MODE_FIELDS, pose_modes
+from batch_residueProfiles import PROFILE_COLUMNS, residue_profiles, split_tag_ligand, superpose_ensemble
+from fast_structure import list_structure_files, read_structure, select_atoms
+from model_filter import select_models
+from sharding import select_shard
+
+OPENESS_RES1, OPENESS_RES2 = 40, 389
+
+
+def load_ensemble(folder, model_filter=None):
+    """
+    Parses the (selected) models of one prediction folder.
+
+    Returns:
+        tuple: (model file names, list of structure arrays, selection dict with models_used/model_selection).
+    """
+    names, selection = select_models(folder, list_structure_files(folder), model_filter)
+    return names, [read_structure(os.path.join(folder, name)) for name in names], selection
+
+
+def overlap_volume(models, binding_pocket_residues=BINDING_POCKET_RESIDUES, ligand_name=LIGAND_RESIDUE_NAME,
+                   vdw_radii=VAN_DER_WAALS_RADII, chunk_points=None, rng=None):
+    """
+    Union volume of the ligands of all models after superposing their binding
+    pockets onto the first model that has one (as batch_LigOverlapVol.py). The
+    Monte Carlo points are drawn from `rng` (e.g. batch_LigOverlapVol.folder_rng).
+
+    Returns:
+        dict: overlap_volume, overlap_w_pos_volume, overlap_w_neg_volume and ligand_pLDDT_avg/min/max,
+        or None if no model has a pocket and a ligand.
+    """
+    aligned = align_ligands(models, binding_pocket_residues, ligand_name)
+    if not aligned or not aligned[1]:
+        return None
+    _, ligands = aligned
+    pos, neg, volume, plddt_avg, plddt_min, plddt_max = combined_ligand_volume(ligands, vdw_radii, chunk_points, rng=rng)
+    return {'overlap_volume': volume, 'overlap_w_pos_volume': pos, 'overlap_w_neg_volume': neg,
+            'ligand_pLDDT_avg': plddt_avg, 'ligand_pLDDT_min': plddt_min, 'ligand_pLDDT_max': plddt_max}
+
+
+def distance_map_variance(models, chain_id='A'):
+    """
+    Composite variance of the CA distance maps across models, unweighted and
+    pLDDT-weighted (the PAE/PDE-weighted variants need the .npz files, see
+    batch_distanceMaps_variance.process_folder).
+
+    Returns:
+        dict: variance_avg and variance_pLDDT_w, or None if a model has no CA atoms or the models differ in size.
+    """
+    try:
+        maps = [ca_distance_map(atoms, chain_id) for atoms in models]
+    except ValueError:
+        return None
+    if len({dist.shape for dist, _ in maps}) != 1:
+        return None
+    return {'variance_avg': composite_variance([dist for dist, _ in maps]),
+            'variance_pLDDT_w': composite_variance([dist * weight for dist, weight in maps])}
+
+
+def openess_distances(models, res1=OPENESS_RES1, res2=OPENESS_RES2, chain_id='A'):
+    """res1-res2 CA distance of every model that has both residues."""
+    distances = []
+    for atoms in models:
+        ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id, resnums=(res1, res2))]
+        ca_coords = dict(zip(ca['resnum'], ca['coord']))
+        if res1 in ca_coords and res2 in ca_coords:
+            distances.append(np.linalg.norm(ca_coords[res1] - ca_coords[res2]))
+    return np.array(distances)
+
+
+def openess_summary(models, res1=OPENESS_RES1, res2=OPENESS_RES2, chain_id='A'):
+    """openess_avg/min/max/range as in openess.csv, or None if no model has both residues."""
+    distances = openess_distances(models, res1, res2, chain_id)
+    if not len(distances):
+        return None
+    return {'openess_avg': distances.mean(), 'openess_min': distances.min(), 'openess_max': distances.max(),
+            'openess_range': distances.max() - distances.min()}
+
+
+def ligand_burial(models, names=None, binding_pocket_residues=BINDING_POCKET_RESIDUES,
+                  ligand_name=LIGAND_RESIDUE_NAME, vdw_radii=VAN_DER_WAALS_RADII):
+    """Per-model ligand/pocket burial (batch_ligandBurial.py) as a DataFrame; models without ligand are left out."""
+    import pandas as pd
+
+    names = names or [f"model_{i}" for i in range(len(models))]
+    unit_points = sphere_points()
+    rows = []
+    for name, atoms in zip(names, models):
+        burial = model_burial(atoms, binding_pocket_residues, ligand_name, vdw_radii, unit_points=unit_points)
+        if burial is not None:
+            rows.append({'PDB_File': name, **burial})
+    return pd.DataFrame(rows, columns=BURIAL_INDIVIDUAL_FIELDS)
+
+
+def ligand_pose_modes(models, names=None, binding_pocket_residues=BINDING_POCKET_RESIDUES,
+                      ligand_name=LIGAND_RESIDUE_NAME, cutoff=DEFAULT_RMSD_CUTOFF):
+    """
+    Binding modes of the pocket-aligned ligand poses (batch_ligandPoses.py) as a
+    DataFrame with one row per mode, largest first; empty if the poses cannot be compared.
+    """
+    import pandas as pd
+
+    columns = [field for field in POSE_MODE_FIELDS if field != 'Tag']
+    names = names or [str(i) for i in range(len(models))]
+    aligned = align_ligands(models, binding_pocket_residues, ligand_name)
+    if not aligned or not aligned[1]:
+        return pd.DataFrame(columns=columns)
+    indices, ligands = aligned
+    modes, _ = pose_modes(ligands, [names[i] for i in indices], cutoff)
+    return pd.DataFrame(modes or [], columns=columns)
+
+
+def residue_profile_table(models, tag='', chain_id='A', res1=OPENESS_RES1, res2=OPENESS_RES2):
+    """
+    Long-format residue profiles (batch_residueProfiles.py) of one ensemble as
+    a typed DataFrame. Models whose residue numbering differs from the first are skipped.
+    """
+    import pandas as pd
+
+    resnums, resnames, coords, plddt = None, None, [], []
+    for atoms in models:
+        ca = atoms[select_atoms(atoms, record='ATOM', name='CA', chain=chain_id)]
+        if resnums is None:
+            resnums, resnames = ca['resnum'], ca['resname']
+        elif not np.array_equal(resnums, ca['resnum']):
+            continue
+        coords.append(ca['coord'])
+        plddt.append(ca['bfactor'] / 100.0)
+    if resnums is None or not len(resnums):
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in PROFILE_COLUMNS})
+
+    tag, ligand = split_tag_ligand(tag)
+    n = len(resnums)
+    columns = {'Tag': [tag] * n, 'Ligand': [ligand] * n, 'chain': [chain_id] * n,
+               'resnum': resnums, 'resname': resnames.astype(object)}
+    columns.update(residue_profiles(superpose_ensemble(np.stack(coords)), np.stack(plddt), resnums, res1, res2))
+    return pd.DataFrame(columns).astype(dict(PROFILE_COLUMNS))
+
+
+def featurize_ensemble(models, names=None, chain_id='A', res1=OPENESS_RES1, res2=OPENESS_RES2, rng=None):
+    """
+    The structural features of one ensemble as a single flat dict: overlap
+    volume, distance-map variances, openness, binding-mode count and occupancy
+    and the ensemble mean of the ligand burial. Features that cannot be computed are missing from the dict.
+    """
+    features = {}
+    for part in (overlap_volume(models, rng=rng), distance_map_variance(models, chain_id),
+                 openess_summary(models, res1, res2, chain_id)):
+        features.update(part or {})
+    modes = ligand_pose_modes(models, names)
+    if len(modes):
+        features['n_modes'] = len(modes)
+        features['dominant_mode_occupancy'] = modes['occupancy'].iloc[0]
+    burial = ligand_burial(models, names)
+    if len(burial):
+        features['ligand_buried_fraction_avg'] = burial['ligand_buried_fraction'].mean()
+        features['pocket_dSASA_avg'] = burial['pocket_dSASA'].mean()
+    return features
+
+
+def featurize_folders(parent_folder, model_filter=None, shard=None, affinities=True, chain_id='A',
+                      res1=OPENESS_RES1, res2=OPENESS_RES2, seed=DEFAULT_SEED):
+    """
+    featurize_ensemble for every prediction folder under `parent_folder`, plus
+    the affinity values when `affinities` is set, as a DataFrame with one row
+    per Tag. Each folder is parsed once for all features; its volume points
+    come from folder_rng(Tag, seed), so repeated calls give the same values.
+    """
+    import pandas as pd
+    from getAffinities import extract_folder_affinity
+
+    rows = []
+    for tag in select_shard(sorted(f.name for f in os.scandir(parent_folder) if f.is_dir()), shard):
+        folder = os.path.join(parent_folder, tag)
+        names, models, selection = load_ensemble(folder, model_filter)
+        if not models:
+            print(f"[SKIP] {tag}: no structure files")
+            continue
+        row = {'Tag': tag, **featurize_ensemble(models, names, chain_id, res1, res2, folder_rng(tag, seed))}
+        if affinities:
+            record, _, _ = extract_folder_affinity(folder)
+            row.update(record or {})
+        rows.append({**row, **selection})
+    return pd.DataFrame(rows)
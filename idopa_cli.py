@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Single entry point for the analysis scripts: `idopa <subcommand> [args]`.
+
+Each subcommand runs the __main__ block of its script with the remaining
+arguments, exactly as `python <script>.py [args]` would. The script module (and
+numpy, scipy, pandas, ...) is imported only when its subcommand is chosen, so
+light subcommands such as `idopa affinities` do not pay for the heavy ones.
+"""
+import sys
+import runpy
+
+# subcommand -> (module, one-line description)
+SUBCOMMANDS = {
+    'yamls': ('csv2yamls_w_molecules', 'Write Boltz2 YAML inputs from a library CSV'),
+    'volume': ('batch_LigOverlapVol', 'Ligand overlap volume per folder'),
+    'variance': ('batch_distanceMaps_variance', 'Distance-map composite variances and PAE/PDE statistics'),
+    'affinities': ('getAffinities', 'Harvest Boltz2 affinity predictions'),
+    'openess': ('getOpenessDistances', 'res1-res2 CA openness per folder'),
+    'openess-prop': ('getOpenessDistancesProp', 'Openness with the proportion of open models'),
+    'interface': ('batch_interfaceConfidence', 'Pocket-ligand interface PAE/PDE'),
+    'burial': ('batch_ligandBurial', 'Ligand SASA and burial fraction'),
+    'poses': ('batch_ligandPoses', 'Cluster pocket-aligned ligand poses into binding modes'),
+    'profiles': ('batch_residueProfiles', 'Per-residue RMSF/pLDDT/openness profiles'),
+    'parent-deltas': ('batch_parentDeltas', 'Score variant ensembles against the parent scaffold'),
+    'selectivity': ('batch_selectivity', 'Joint multi-ligand features with selectivity deltas'),
+    'merge': ('merge_csv_tags', 'Merge columns of two CSVs on their Tag column'),
+    'reduce': ('reduce_shards', 'Reduce --shard partial outputs into the final tables'),
+    'watch': ('watch_predictions', 'Analyze prediction folders as they complete'),
+    'similarity': ('similarity_index', 'Build/query the cross-variant similarity index'),
+    'cache': ('prediction_cache', 'Content-addressed prediction store'),
+    'pipeline': ('run_pipeline', 'Make-style runner of the whole pipeline'),
+}
+
+
+def print_usage(stream=sys.stdout):
+    print("usage: idopa <subcommand> [args]\n\nsubcommands:", file=stream)
+    width = max(len(name) for name in SUBCOMMANDS)
+    for name, (module, description) in SUBCOMMANDS.items():
+        print(f"  {name:<{width}}  {description} ({module}.py)", file=stream)
+    print("\nRun `idopa <subcommand> -h` for the options of a subcommand.", file=stream)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+    name, rest = argv[0], argv[1:]
+    if name not in SUBCOMMANDS:
+        print(f"idopa: unknown subcommand '{name}'\n", file=sys.stderr)
+        print_usage(sys.stderr)
+        return 2
+
+    # argparse takes the program name from argv[0], so help reads "usage: idopa <name> ..."
+    saved_argv = sys.argv
+    sys.argv = [f"idopa {name}"] + rest
+    try:
+        runpy.run_module(SUBCOMMANDS[name][0], run_name="__main__")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        sys.argv = saved_argv
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
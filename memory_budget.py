@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Memory budget shared by the analyzers (--max-memory).
+
+The size of a library is sampled once at startup (protein length, ligand atoms,
+models and PAE tokens of the largest prediction folder) and per-stage
+estimators turn it into a plan:
+
+- distance maps: the per-model N x N matrices kept for the composite variances
+  are stored as float64, or float32 if float64 does not fit, and the variances
+  are computed over element chunks instead of one stacked (M, N, N) copy; the
+  bootstrap of the variances (--bootstrap) reuses the same chunks and adds its
+  (resamples, M) count matrices
+- Monte Carlo volume: the (points, atoms, 3) tensor is evaluated in chunks of points
+- workers: parallel folders are capped so that workers x per-folder peak fits
+
+Without --max-memory no plan is made and the analyzers behave as before.
+"""
+import os
+import re
+import numpy as np
+
+from fast_structure import list_structure_files, read_structure, select_atoms
+
+MEMORY_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+MEMORY_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*$', re.IGNORECASE)
+
+# Distance-map-sized arrays retained per model: unweighted, pLDDT-, PAE- and PDE-weighted
+DISTANCE_MAP_STACKS = 4
+# Headroom for the interpreter, imports and arrays not covered by the estimators
+BASELINE_BYTES = 300 * 1024 ** 2
+MIN_MC_CHUNK = 1000
+DEFAULT_MC_POINTS = 500000
+
+
+def parse_memory_size(text):
+    """'8G', '512M', '1.5GB' or a plain byte count -> bytes (binary units, like SLURM --mem)."""
+    match = MEMORY_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Cannot parse memory size '{text}', expected e.g. 8G or 512M")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).upper()])
+
+
+def format_bytes(n_bytes):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if n_bytes < 1024 or unit == 'GiB':
+            return f"{n_bytes:.0f} {unit}" if unit == 'B' else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+
+def estimate_dimensions(parent_folder, chain_id="A", ligand_name="LIG"):
+    """
+    Sizes of the largest prediction folder under `parent_folder`: the biggest
+    structure file is read once for the protein length and ligand atom count.
+
+    Returns:
+        dict: {'residues', 'ligand_atoms', 'models', 'tokens', 'folders'}, or None if nothing was found.
+    """
+    largest, n_models, n_folders = None, 0, 0
+    for entry in os.scandir(parent_folder):
+        if not entry.is_dir():
+            continue
+        files = list_structure_files(entry.path)
+        if not files:
+            continue
+        n_folders += 1
+        n_models = max(n_models, len(files))
+        path = os.path.join(entry.path, files[0])
+        size = os.path.getsize(path)
+        if largest is None or size > largest[0]:
+            largest = (size, entry.path, path)
+    if largest is None:
+        return None
+
+    atoms = read_structure(largest[2])
+    residues = int(np.sum(select_atoms(atoms, record='ATOM', name='CA', chain=chain_id)))
+    ligand_atoms = int(np.sum(select_atoms(atoms, resname=ligand_name, exclude_record='ATOM')))
+    # PAE/PDE are token x token: one token per residue plus one per ligand heavy atom
+    tokens = int(np.sum(select_atoms(atoms, name='CA', exclude_record='HETATM'))) + ligand_atoms
+    return {'residues': residues, 'ligand_atoms': ligand_atoms, 'models': n_models,
+            'tokens': tokens, 'folders': n_folders}
+
+
+def distance_map_bytes(dims, itemsize):
+    """Per-model distance-map matrices retained by batch_distanceMaps_variance.process_folder."""
+    return DISTANCE_MAP_STACKS * dims['models'] * dims['residues'] ** 2 * itemsize
+
+
+def pae_bytes(dims):
+    """One PAE or PDE matrix (float32) plus its float64 exp-weight while it is loaded."""
+    return dims['tokens'] ** 2 * (4 + 8)
+
+
+def monte_carlo_bytes_per_point(n_atoms):
+    """Point coordinates, the float64 (atoms, 3) differences and their square, distances and the bool mask."""
+    return 3 * 8 + n_atoms * (2 * 3 * 8 + 8 + 1)
+
+
+def variance_chunk_bytes(dims, chunk, itemsize):
+    """One (models, chunk) slice stacked for the variance plus its float64 temporaries."""
+    return dims['models'] * chunk * (itemsize + 2 * 8)
+
+
+def bootstrap_variance_bytes(dims, n_boot):
+    """Resample counts and their einsum temporary (both (n_boot, models) float64) plus the Gram matrix."""
+    return 2 * n_boot * dims['models'] * 8 + dims['models'] ** 2 * 8
+
+
+def plan_stage_bytes(dims, dist_dtype, variance_chunk, mc_chunk_points, n_boot=0):
+    """Peak bytes of the distance-map and Monte Carlo stages of one folder under a plan."""
+    itemsize = np.dtype(dist_dtype).itemsize
+    distance_stage = (distance_map_bytes(dims, itemsize) + pae_bytes(dims) + bootstrap_variance_bytes(dims, n_boot)
+                      + variance_chunk_bytes(dims, variance_chunk, itemsize))
+    pooled_atoms = dims['models'] * dims['ligand_atoms']
+    volume_stage = mc_chunk_points * monte_carlo_bytes_per_point(pooled_atoms)
+    return {'distance_maps': distance_stage, 'monte_carlo': volume_stage}
+
+
+def plan_memory(max_memory, dims, workers=1, n_points=DEFAULT_MC_POINTS, n_boot=0):
+    """
+    Chooses the distance-map dtype, variance chunk, Monte Carlo chunk and
+    worker count that keep `workers` folders in flight within `max_memory` bytes,
+    including the `n_boot` bootstrap resamples of the composite variances.
+    The worker count is lowered until one folder fits its share; with a single
+    worker the smallest plan is used even if it exceeds the budget (with a warning).
+    """
+    n_elements = dims['residues'] ** 2
+    pooled_atoms = dims['models'] * dims['ligand_atoms']
+    for n_workers in range(max(1, workers), 0, -1):
+        share = (max_memory - BASELINE_BYTES) // n_workers
+        for dist_dtype in ('float64', 'float32'):
+            itemsize = np.dtype(dist_dtype).itemsize
+            fixed = distance_map_bytes(dims, itemsize) + pae_bytes(dims) + bootstrap_variance_bytes(dims, n_boot)
+            if fixed >= share:
+                continue
+            variance_chunk = int(min(n_elements, (share - fixed) // variance_chunk_bytes(dims, 1, itemsize)))
+            mc_chunk = int(min(n_points, share // monte_carlo_bytes_per_point(pooled_atoms)))
+            if variance_chunk >= dims['residues'] and mc_chunk >= MIN_MC_CHUNK:
+                return _make_plan(max_memory, dims, n_workers, dist_dtype, variance_chunk, mc_chunk, n_boot, fits=True)
+
+    return _make_plan(max_memory, dims, 1, 'float32', dims['residues'], MIN_MC_CHUNK, n_boot, fits=False)
+
+
+def _make_plan(max_memory, dims, workers, dist_dtype, variance_chunk, mc_chunk_points, n_boot, fits):
+    plan = {'max_memory': max_memory, 'dims': dims, 'workers': workers, 'dist_dtype': dist_dtype,
+            'variance_chunk': variance_chunk, 'mc_chunk_points': mc_chunk_points, 'fits': fits}
+    plan['stage_bytes'] = plan_stage_bytes(dims, dist_dtype, variance_chunk, mc_chunk_points, n_boot)
+    return plan
+
+
+def log_plan(plan):
+    dims, stages = plan['dims'], plan['stage_bytes']
+    print(f"[MEMORY] Budget {format_bytes(plan['max_memory'])} for {dims['folders']} folders "
+          f"(largest: {dims['residues']} residues, {dims['ligand_atoms']} ligand atoms, "
+          f"{dims['models']} models, {dims['tokens']} PAE tokens)")
+    print(f"[MEMORY]   distance maps: {plan['dist_dtype']}, variance over chunks of {plan['variance_chunk']} "
+          f"elements, ~{format_bytes(stages['distance_maps'])} per folder")
+    print(f"[MEMORY]   Monte Carlo volume: chunks of {plan['mc_chunk_points']} points, "
+          f"~{format_bytes(stages['monte_carlo'])} per folder")
+    print(f"[MEMORY]   workers: {plan['workers']}")
+    if not plan['fits']:
+        print(f"[WARN] Even the smallest plan (~{format_bytes(max(stages.values()) + BASELINE_BYTES)}) "
+              f"exceeds the budget; running with it anyway.")
+
+
+def add_memory_arguments(parser):
+    parser.add_argument("--max_memory", "--max-memory", dest="max_memory", default=None,
+                        help="Memory budget, e.g. 16G; sizes chunks, dtypes and workers to fit it (default: no limit)")
+
+
+def merge_dimensions(dims_list):
+    """Largest sizes over several prediction roots (folders are summed)."""
+    dims_list = [d for d in dims_list if d is not None]
+    if not dims_list:
+        return None
+    merged = {key: max(d[key] for d in dims_list) for key in dims_list[0]}
+    merged['folders'] = sum(d['folders'] for d in dims_list)
+    return merged
+
+
+def memory_plan_from_args(args, parent_folders, workers=1, chain_id="A", n_boot=0):
+    """
+    Estimates the library size of one or several prediction roots and logs the
+    plan for --max-memory (with `n_boot` variance bootstrap resamples), or
+    returns None when it is not set.
+    """
+    if args.max_memory is None:
+        return None
+    if isinstance(parent_folders, str):
+        parent_folders = [parent_folders]
+    dims = merge_dimensions([estimate_dimensions(folder, chain_id) for folder in parent_folders])
+    if dims is None:
+        print(f"[MEMORY] No structure files under {', '.join(parent_folders)}, no memory plan made.")
+        return None
+    plan = plan_memory(parse_memory_size(args.max_memory), dims, workers or os.cpu_count() or 1, n_boot=n_boot)
+    log_plan(plan)
+    return plan
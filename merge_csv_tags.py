@@ -89,7 +89,7 @@ def merge_csv_files(primary_csv_path, secondary_csv_path, output_csv_path, ref_c
             if col_name not in df_secondary.columns:
                 print(f"Warning: Column '{col_name}' from 'columns_to_merge' not found in the secondary CSV. Skipping this column.")
                 continue
-            df_primary[f'Merged_{col_name}'] = ''
+            df_primary[f'Merged_{col_name}'] = pd.Series('', index=df_primary.index, dtype=object)
 
         df_secondary['__normalized_tag__'] = df_secondary[secondary_tag_col_to_use].apply(normalize_tag)
 
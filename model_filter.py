@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Confidence-ranked model pre-filtering.
+
+Only the small confidence_<model>.json files are read to rank the diffusion
+samples of a folder; the structure parsing, Monte Carlo volume, distance maps
+and PAE/PDE loading then run on the selected models only. The selection is
+returned as models_used / model_selection columns so every feature row records
+which models it was computed from.
+"""
+import os
+import re
+import json
+
+CONFIDENCE_METRICS = (
+    'confidence_score', 'ligand_iptm', 'complex_pde', 'complex_ipde',
+    'complex_plddt', 'complex_iplddt', 'iptm', 'ptm', 'protein_iptm'
+)
+LOWER_IS_BETTER = {'complex_pde', 'complex_ipde'}
+SELECTION_FIELDS = ['models_used', 'model_selection']
+
+MODEL_INDEX_RE = re.compile(r'_model_(\d+)$')
+
+
+def model_label(stem):
+    """'Tag_model_12' -> '12'; other names are kept as they are."""
+    match = MODEL_INDEX_RE.search(stem)
+    return match.group(1) if match else stem
+
+
+def describe_filter(model_filter):
+    if not model_filter:
+        return 'all'
+    metric = model_filter['metric']
+    parts = []
+    if model_filter.get('threshold') is not None:
+        op = '<=' if metric in LOWER_IS_BETTER else '>='
+        parts.append(f"{metric}{op}{model_filter['threshold']:g}")
+    if model_filter.get('top_k') is not None:
+        parts.append(f"{metric} top{model_filter['top_k']}")
+    return ' & '.join(parts)
+
+
+def read_confidence_scores(folder, stems, metric):
+    """Maps each model stem to its `metric` from confidence_<stem>.json (missing/unreadable files are left out)."""
+    scores = {}
+    for stem in stems:
+        path = os.path.join(folder, f"confidence_{stem}.json")
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f).get(metric)
+            if value is not None:
+                scores[stem] = float(value)
+        except Exception as e:
+            print(f"Warning reading {metric} from {path}: {e}")
+    return scores
+
+
+def select_models(folder, structure_files, model_filter=None):
+    """
+    Applies the confidence filter to the structure files of one folder.
+
+    Args:
+        folder (str): Prediction folder.
+        structure_files (list): Structure file names in the folder.
+        model_filter (dict or None): {'metric', 'top_k', 'threshold'}; None keeps every model.
+
+    Returns:
+        tuple: (selected structure files, {'models_used': ..., 'model_selection': ...}).
+        Models without a confidence value are dropped when a filter is set.
+    """
+    stems = {os.path.splitext(f)[0]: f for f in structure_files}
+    if not model_filter:
+        selected = list(structure_files)
+    else:
+        metric = model_filter['metric']
+        scores = read_confidence_scores(folder, stems, metric)
+        ranked = sorted(scores, key=scores.get, reverse=metric not in LOWER_IS_BETTER)
+        threshold = model_filter.get('threshold')
+        if threshold is not None:
+            if metric in LOWER_IS_BETTER:
+                ranked = [s for s in ranked if scores[s] <= threshold]
+            else:
+                ranked = [s for s in ranked if scores[s] >= threshold]
+        if model_filter.get('top_k') is not None:
+            ranked = ranked[:model_filter['top_k']]
+        kept = set(ranked)
+        selected = [f for stem, f in stems.items() if stem in kept]
+        print(f"  Model filter ({describe_filter(model_filter)}): kept {len(selected)} of {len(structure_files)} models")
+
+    # (length, label) orders numeric model indices naturally: 2 before 10
+    labels = sorted((model_label(os.path.splitext(f)[0]) for f in selected), key=lambda label: (len(label), label))
+    return selected, {'models_used': ';'.join(labels), 'model_selection': describe_filter(model_filter)}
+
+
+def add_model_filter_arguments(parser):
+    parser.add_argument("--filter_metric", "--filter-metric", dest="filter_metric", choices=CONFIDENCE_METRICS, default=None,
+                        help="Rank models by this confidence_*.json metric before any structural parsing "
+                             "(complex_pde/complex_ipde: lower is better)")
+    parser.add_argument("--top_k", "--top-k", dest="top_k", type=int, default=None, help="Keep only the k best-ranked models per folder")
+    parser.add_argument("--min_confidence", "--min-confidence", dest="min_confidence", type=float, default=None,
+                        help="Keep only models whose metric passes this threshold (an upper bound for PDE metrics)")
+
+
+def model_filter_from_args(args):
+    """Builds the model_filter dict from add_model_filter_arguments() options, or None if unfiltered."""
+    if args.filter_metric is None:
+        if args.top_k is not None or args.min_confidence is not None:
+            raise ValueError("--top_k/--min_confidence require --filter_metric")
+        return None
+    if args.top_k is None and args.min_confidence is None:
+        raise ValueError("--filter_metric requires --top_k and/or --min_confidence")
+    return {'metric': args.filter_metric, 'top_k': args.top_k, 'threshold': args.min_confidence}
@@ -59,3 +59,37 @@ mkdir "$analyzed_data_path_5HT"
 
 sbatch --wait "$repo_path/analysis.sh" $models_path_DOP $analyzed_data_path_DOP
 sbatch --wait "$repo_path/analysis.sh" $models_path_5HT $analyzed_data_path_5HT
+
+# Alternative: both ligands in one pass on a shared worker pool, with selectivity deltas/ratios
+# python3 "$repo_path/batch_selectivity.py" \
+#     --roots DOP="$models_path_DOP" 5HT="$models_path_5HT" \
+#     --output_dir "$analyzed_data_path/selectivity" \
+#     --res1 40 --res2 389 --chain A
+
+# Alternative: the same workflow as one make-style Python pipeline (concurrent analyzers,
+# up-to-date stages skipped, per-stage report)
+# python3 "$repo_path/run_pipeline.py" \
+#     --data_csv "$data_path" \
+#     --molecules '{"DOP": "C1=CC(=C(C=C1CCN)O)O", "5HT": "C1=CC2=C(C=C1O)C(=CN2)CCN"}' \
+#     --project_dir "$project_path/pipeline" \
+#     --num_models 25 --recycles 0
+
+# Alternative: reuse earlier predictions of identical (sequence, ligand, settings) jobs from a
+# content-addressed store, predict only the rest and link a predictions/ tree for every Tag
+# store_path="$project_path/prediction_store"
+# python3 csv2yamls_w_molecules.py "$data_path" --output-dir "$project_path/iDopa_DOP" \
+#     --molecules '{"DOP": "C1=CC(=C(C=C1CCN)O)O"}' --cache "$store_path" --num-models 25 --recycles 0
+# sbatch --wait runBzprediction.sh --input-dir "$project_path/iDopa_DOP" --output-dir "$project_path/1-Models_Bz2" --num-models 25 --recycles 0
+# python3 "$repo_path/prediction_cache.py" ingest --manifest "$project_path/iDopa_DOP_cache_manifest.csv" \
+#     --predictions_dir "$models_path_DOP" --store "$store_path"
+# python3 "$repo_path/prediction_cache.py" materialize --manifest "$project_path/iDopa_DOP_cache_manifest.csv" \
+#     --store "$store_path" --output_dir "$project_path/1-Models_Bz2/cached_iDopa_DOP/predictions"
+
+# Alternative: overlap analysis with prediction by submitting Boltz without --wait and
+# featurizing each variant folder as soon as all of its models are written
+# sbatch runBzprediction.sh --input-dir "$project_path/iDopa_DOP" --output-dir "$project_path/1-Models_Bz2" --num-models 25 --recycles 0
+# python3 "$repo_path/watch_predictions.py" \
+#     --input_dir "$models_path_DOP" \
+#     --output_dir "$analyzed_data_path_DOP" \
+#     --targets "$project_path/iDopa_DOP" \
+#     --num_models 25
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed store of Boltz2 prediction folders.
+
+A prediction is keyed by the SHA-256 of (sequence, SMILES, num models,
+recycles, potentials flag, output format, MSA server and pairing strategy), so
+the same protein/ligand job predicted for any library is found again whatever its Tag. The store holds one folder per key:
+
+    <store>/<key[:2]>/<key>/   prediction files + meta.json (written last)
+
+Workflow:
+    1. csv2yamls_w_molecules.py --cache <store> writes YAMLs only for keys that
+       are not stored yet, plus a manifest of every requested name and its key
+    2. runBzprediction.sh predicts the (possibly much smaller) YAML folder
+    3. prediction_cache.py ingest hardlinks (or copies) the new prediction folders into the store
+    4. prediction_cache.py materialize links a predictions/<Tag_LIG> folder for
+       every manifest entry, renaming files to the requested name, so the
+       analysis scripts run on it unchanged
+"""
+import os
+import csv
+import json
+import shutil
+import hashlib
+import argparse
+
+from fast_structure import is_structure_file
+
+KEY_VERSION = 2
+MANIFEST_FIELDS = ['name', 'key', 'status']
+META_FILE = 'meta.json'
+
+
+# Boltz defaults of the settings that change a prediction without appearing in its YAML
+DEFAULT_OUTPUT_FORMAT = 'pdb'
+DEFAULT_MSA_SERVER_URL = 'https://api.colabfold.com'
+DEFAULT_MSA_PAIRING_STRATEGY = 'greedy'
+
+
+def prediction_key(sequence, smiles, num_models, recycles, use_potentials=True, output_format=DEFAULT_OUTPUT_FORMAT,
+                   msa_server_url=DEFAULT_MSA_SERVER_URL, msa_pairing_strategy=DEFAULT_MSA_PAIRING_STRATEGY):
+    """SHA-256 hex key of one prediction job; whitespace and case of the sequence are ignored."""
+    payload = {
+        'version': KEY_VERSION,
+        'sequence': ''.join(sequence.split()).upper(),
+        'smiles': smiles.strip(),
+        'num_models': int(num_models),
+        'recycles': int(recycles),
+        'use_potentials': bool(use_potentials),
+        'output_format': output_format,
+        'msa_server_url': msa_server_url.rstrip('/'),
+        'msa_pairing_strategy': msa_pairing_strategy,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def store_path(store, key):
+    return os.path.join(store, key[:2], key)
+
+
+def is_cached(store, key):
+    """True once the entry is complete (meta.json is written after every file)."""
+    return os.path.exists(os.path.join(store_path(store, key), META_FILE))
+
+
+def default_manifest_path(yaml_dir):
+    """Manifest next to (not inside) the YAML folder, which Boltz expects to hold only inputs."""
+    return os.path.normpath(yaml_dir) + "_cache_manifest.csv"
+
+
+def write_manifest(rows, manifest_path):
+    with open(manifest_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, newline='') as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def link_or_copy(src, dst, mode):
+    """Places `src` at `dst` as a symlink, a hardlink (copy if across filesystems) or a copy."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def ingest_folder(folder, store, key, mode='hardlink'):
+    """
+    Adds one Boltz prediction folder to the store under `key`. Files keep their
+    names; the folder name they were predicted under is recorded in meta.json.
+    """
+    files = sorted(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)))
+    entry = store_path(store, key)
+    tmp_entry = entry + ".tmp"
+    if os.path.exists(tmp_entry):
+        shutil.rmtree(tmp_entry)
+    os.makedirs(tmp_entry)
+    for name in files:
+        link_or_copy(os.path.join(folder, name), os.path.join(tmp_entry, name), mode)
+    with open(os.path.join(tmp_entry, META_FILE), 'w') as f:
+        json.dump({'key': key, 'stem': os.path.basename(os.path.normpath(folder)), 'files': files}, f, indent=2)
+    if os.path.exists(entry):
+        shutil.rmtree(entry)
+    os.replace(tmp_entry, entry)
+
+
+def ingest_predictions(manifest_path, predictions_dir, store, mode='hardlink'):
+    """Stores every manifest entry that was sent to prediction and whose folder is now complete."""
+    added, missing = 0, []
+    for row in read_manifest(manifest_path):
+        if row['status'] != 'predict' or is_cached(store, row['key']):
+            continue
+        folder = os.path.join(predictions_dir, row['name'])
+        if not os.path.isdir(folder) or not any(is_structure_file(f) for f in os.listdir(folder)):
+            missing.append(row['name'])
+            continue
+        ingest_folder(folder, store, row['key'], mode)
+        added += 1
+        print(f"Stored {row['name']} -> {row['key'][:12]}")
+    print(f"Ingested {added} prediction folders into {store}")
+    if missing:
+        print(f"[WARN] {len(missing)} predicted names have no prediction folder yet: {', '.join(missing)}")
+    return added, missing
+
+
+def materialize(manifest_path, store, output_dir, mode='symlink'):
+    """
+    Creates output_dir/<name> for every manifest entry found in the store, with
+    each file linked under the requested name (e.g. confidence_<stem>_model_0.json
+    -> confidence_<name>_model_0.json).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done, missing = 0, []
+    for row in read_manifest(manifest_path):
+        entry = store_path(store, row['key'])
+        if not is_cached(store, row['key']):
+            missing.append(row['name'])
+            continue
+        with open(os.path.join(entry, META_FILE)) as f:
+            meta = json.load(f)
+        target = os.path.join(output_dir, row['name'])
+        os.makedirs(target, exist_ok=True)
+        for name in meta['files']:
+            link_or_copy(os.path.join(entry, name), os.path.join(target, name.replace(meta['stem'], row['name'], 1)), mode)
+        done += 1
+    print(f"Materialized {done} prediction folders in {output_dir}")
+    if missing:
+        print(f"[WARN] {len(missing)} names are not in the store yet: {', '.join(missing)}")
+    return done, missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed Boltz2 prediction store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Store the prediction folders of newly predicted manifest entries")
+    ingest.add_argument("--predictions_dir", required=True, help="Boltz predictions/ folder of the run")
+    ingest.add_argument("--mode", choices=["hardlink", "copy"], default="hardlink",
+                        help="How files enter the store (default: hardlink, copy across filesystems)")
+
+    mat = subparsers.add_parser("materialize", help="Link a predictions/<name> tree for every manifest entry")
+    mat.add_argument("--output_dir", required=True, help="predictions/ folder to create for the analysis scripts")
+    mat.add_argument("--mode", choices=["symlink", "hardlink", "copy"], default="symlink",
+                     help="How files are placed in the tree (default: symlink)")
+
+    for sub in (ingest, mat):
+        sub.add_argument("--manifest", required=True, help="Manifest CSV written by csv2yamls_w_molecules.py --cache")
+        sub.add_argument("--store", required=True, help="Prediction store folder")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest_predictions(args.manifest, args.predictions_dir, args.store, args.mode)
+    else:
+        _, missing = materialize(args.manifest, args.store, args.output_dir, args.mode)
+        raise SystemExit(1 if missing else 0)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import csv
+import sys
+import argparse
+import subprocess
+
+from sharding import SHARD_SUFFIX_RE
+from memory_budget import parse_memory_size
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Partial outputs written by the sharded analyzers -> columns identifying one prediction folder.
+# The long-format tables (pose modes, residue profiles) hold several rows per folder.
+SHARDED_OUTPUTS = {
+    "overall_folder_summary.csv": ["Tag"],
+    "composite_variances.csv": ["Tag"],
+    "affinities.csv": ["Tag"],
+    "openess.csv": ["Tag"],
+    "ligand_burial_summary.csv": ["Tag"],
+    "interface_confidence.csv": ["Tag"],
+    "ligand_pose_summary.csv": ["Tag"],
+    "ligand_pose_modes.csv": ["Tag"],
+    "residue_profiles.csv": ["Tag", "Ligand"],
+    "residue_profiles.parquet": ["Tag", "Ligand"],
+}
+# Outputs of analysis.sh, which must be complete; the others are reduced only if their analyzer was run
+REQUIRED_OUTPUTS = ["overall_folder_summary.csv", "composite_variances.csv", "affinities.csv", "openess.csv"]
+
+# Merge chain of analysis.sh: (primary, secondary, output, columns_to_merge)
+ANALYSIS_MERGES = [
+    ("overall_folder_summary.csv", "composite_variances.csv", "volumes_variances.csv",
+     ["variance_avg", "variance_pLDDT_w", "complex_PDE_avg", "complex_PDE_var",
+      "complex_PDE_min", "complex_PDE_max", "PAE_avg", "PDE_avg"]),
+    ("volumes_variances.csv", "affinities.csv", "volumes_variances_affinities.csv",
+     ["affinity_pred_value", "affinity_probability_binary"]),
+    ("volumes_variances_affinities.csv", "openess.csv", "volumes_variances_affinities_openess.csv",
+     ["openess_avg", "openess_min", "openess_max", "openess_range"]),
+]
+
+
+def analyzer_commands(input_dir, output_dir, shard_spec=None, res1=40, res2=389, chain="A", max_memory=None):
+    """The analyzer invocations of analysis.sh step 1, for one shard or (shard_spec None) the whole folder."""
+    python = sys.executable
+    shard_args = ["--shard", shard_spec] if shard_spec else []
+    # Only the structural analyzers take a memory budget; affinities and openness are small
+    memory_args = ["--max_memory", str(max_memory)] if max_memory else []
+    return [
+        [python, os.path.join(SCRIPT_DIR, "batch_LigOverlapVol.py"),
+         "--input_dir", input_dir, "--output_dir", output_dir] + shard_args + memory_args,
+        [python, os.path.join(SCRIPT_DIR, "batch_distanceMaps_variance.py"),
+         "--input_dir", input_dir, "--output_dir", output_dir] + shard_args + memory_args,
+        [python, os.path.join(SCRIPT_DIR, "getAffinities.py"),
+         "--input-dir", input_dir, "--output-csv", os.path.join(output_dir, "affinities.csv")] + shard_args,
+        [python, os.path.join(SCRIPT_DIR, "getOpenessDistances.py"),
+         "--parent-folder", input_dir, "--res1", str(res1), "--res2", str(res2), "--chain", chain,
+         "--output-csv", os.path.join(output_dir, "openess.csv")] + shard_args,
+    ]
+
+
+def run_shards_locally(input_dir, output_dir, num_shards, max_memory=None):
+    """
+    Runs every shard of every analyzer as a local subprocess, like a SLURM array
+    would. A `max_memory` budget (bytes) is split evenly between the concurrent shards.
+    """
+    shard_memory = max_memory // num_shards if max_memory else None
+    os.makedirs(output_dir, exist_ok=True)
+    log_dir = os.path.join(output_dir, "shard_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    procs = []
+    for index in range(num_shards):
+        log_path = os.path.join(log_dir, f"shard-{index}-of-{num_shards}.log")
+        log = open(log_path, "w")
+        # Analyzers of one shard run sequentially, shards run concurrently
+        script = " && ".join(subprocess.list2cmdline(cmd) for cmd in
+                             analyzer_commands(input_dir, output_dir, f"{index}/{num_shards}", max_memory=shard_memory))
+        procs.append((index, log, subprocess.Popen(script, shell=True, stdout=log, stderr=subprocess.STDOUT)))
+        print(f"[INFO] Started shard {index}/{num_shards} (log: {log_path})")
+
+    failed = []
+    for index, log, proc in procs:
+        proc.wait()
+        log.close()
+        if proc.returncode != 0:
+            failed.append(index)
+    if failed:
+        raise RuntimeError(f"Shards {failed} failed, see logs in {log_dir}")
+    print(f"[INFO] All {num_shards} shards finished.")
+
+
+def find_partials(output_dir, output_name):
+    """Maps shard index -> list of (path, N) for every partial file of `output_name`."""
+    stem, ext = os.path.splitext(output_name)
+    partials = {}
+    for name in os.listdir(output_dir):
+        if not (name.startswith(stem + ".shard-") and name.endswith(ext)):
+            continue
+        match = SHARD_SUFFIX_RE.search(name[:-len(ext)])
+        if match:
+            index, count = int(match.group(1)), int(match.group(2))
+            partials.setdefault(index, []).append((os.path.join(output_dir, name), count))
+    return partials
+
+
+def check_partials(output_name, partials, num_shards):
+    """Raises ValueError if shards are missing, come from a different N, or are duplicated."""
+    problems = []
+    counts = {count for files in partials.values() for _, count in files}
+    if counts - {num_shards}:
+        problems.append(f"partials from other shard counts {sorted(counts - {num_shards})}")
+    missing = [i for i in range(num_shards) if not any(c == num_shards for _, c in partials.get(i, []))]
+    if missing:
+        problems.append(f"missing shards {missing}")
+    if problems:
+        raise ValueError(f"{output_name}: " + "; ".join(problems))
+
+
+def check_new_keys(output_name, keys, index, seen):
+    """Records the folder keys of shard `index`, raising ValueError if another shard already had one of them."""
+    for key in keys:
+        if seen.setdefault(key, index) != index:
+            raise ValueError(f"{output_name}: {'/'.join(key)} appears in shards {seen[key]} and {index}")
+
+
+def reduce_output(output_dir, output_name, num_shards, key_columns=("Tag",)):
+    """
+    Concatenates the partials of one output into its final CSV (or Parquet
+    table), checking that no folder, identified by `key_columns`, comes from two shards.
+    """
+    partials = find_partials(output_dir, output_name)
+    check_partials(output_name, partials, num_shards)
+    if output_name.endswith(".parquet"):
+        return reduce_parquet_output(output_dir, output_name, num_shards, partials, key_columns)
+
+    header, rows, seen = None, [], {}
+    for index in range(num_shards):
+        path = partials[index][0][0]
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            part_header = next(reader, None)
+            if part_header is None:
+                continue
+            if header is None:
+                header = part_header
+                key_idx = [header.index(column) for column in key_columns]
+            elif part_header != header:
+                raise ValueError(f"{output_name}: header of shard {index} differs from the other shards")
+            part_rows = list(reader)
+            check_new_keys(output_name, {tuple(row[i] for i in key_idx) for row in part_rows}, index, seen)
+            rows.extend(part_rows)
+
+    # Stable sort, so the rows of one folder keep their order
+    if header is not None:
+        rows.sort(key=lambda row: [row[i] for i in key_idx])
+    final_path = os.path.join(output_dir, output_name)
+    with open(final_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header or [])
+        writer.writerows(rows)
+    print(f"[INFO] {output_name}: {len(seen)} folders ({len(rows)} rows) from {num_shards} shards -> {final_path}")
+    return final_path
+
+
+def reduce_parquet_output(output_dir, output_name, num_shards, partials, key_columns):
+    """Parquet version of reduce_output; the column dtypes of the first shard are kept (requires pandas with pyarrow)."""
+    import pandas as pd
+
+    frames, seen = [], {}
+    for index in range(num_shards):
+        df = pd.read_parquet(partials[index][0][0])
+        if frames and list(df.columns) != list(frames[0].columns):
+            raise ValueError(f"{output_name}: columns of shard {index} differ from the other shards")
+        keys = {tuple(str(v) for v in key) for key in df[list(key_columns)].itertuples(index=False)}
+        check_new_keys(output_name, keys, index, seen)
+        frames.append(df)
+
+    # Categorical columns with different categories per shard come back as object; their categories are re-inferred
+    dtypes = {name: 'category' if isinstance(dtype, pd.CategoricalDtype) else dtype
+              for name, dtype in frames[0].dtypes.items()}
+    df = pd.concat(frames, ignore_index=True).astype(dtypes)
+    df = df.sort_values(list(key_columns), kind="stable")
+    final_path = os.path.join(output_dir, output_name)
+    df.to_parquet(final_path, index=False)
+    print(f"[INFO] {output_name}: {len(seen)} folders ({len(df)} rows) from {num_shards} shards -> {final_path}")
+    return final_path
+
+
+def reduce_all_outputs(output_dir, num_shards):
+    """Reduces the analysis.sh outputs and every other sharded output that has partials in `output_dir`."""
+    for output_name, key_columns in SHARDED_OUTPUTS.items():
+        if output_name not in REQUIRED_OUTPUTS and not find_partials(output_dir, output_name):
+            continue
+        reduce_output(output_dir, output_name, num_shards, key_columns)
+
+
+def merge_analysis_tables(output_dir):
+    """Runs the merge chain of analysis.sh step 2 and returns the final merged CSV."""
+    from merge_csv_tags import merge_csv_files
+
+    for primary, secondary, output, columns in ANALYSIS_MERGES:
+        merge_csv_files(os.path.join(output_dir, primary), os.path.join(output_dir, secondary),
+                        os.path.join(output_dir, output), "Tag", columns)
+    return os.path.join(output_dir, ANALYSIS_MERGES[-1][2])
+
+
+def clean_tag_suffixes(csv_path):
+    """analysis.sh step 3: moves the _DOP/_5HT suffix of Tag into a Ligand column, writing *_clean.csv."""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    df["Ligand"] = df["Tag"].str.extract(r"_(DOP|5HT)$", expand=False)
+    df["Tag"] = df["Tag"].str.replace(r"_(DOP|5HT)$", "", regex=True)
+    out = re.sub(r"\.csv$", "_clean.csv", csv_path)
+    df.to_csv(out, index=False)
+    print(f"[INFO] Cleaned tag suffixes -> {out}")
+    return out
+
+
+def merge_final_tables(output_dir):
+    """Runs the merge and Tag-cleaning steps of analysis.sh on the reduced CSVs."""
+    return clean_tag_suffixes(merge_analysis_tables(output_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge --shard partial outputs into the final analysis.sh CSVs.")
+    parser.add_argument("--output_dir", required=True, help="Folder holding the *.shard-i-of-N.csv partial outputs")
+    parser.add_argument("--num_shards", type=int, required=True, help="Number of shards N the analyzers were run with")
+    parser.add_argument("--input_dir", default=None, help="Predictions folder; required with --run_local")
+    parser.add_argument("--run_local", action="store_true", help="Run all shards as local subprocesses before reducing")
+    parser.add_argument("--no_merge", action="store_true", help="Only reduce the partials, skip the merge/clean steps")
+    parser.add_argument("--max_memory", "--max-memory", dest="max_memory", default=None,
+                        help="Total memory budget of --run_local, e.g. 32G, split between the shards (default: no limit)")
+    args = parser.parse_args()
+
+    if args.run_local:
+        if not args.input_dir:
+            parser.error("--run_local requires --input_dir")
+        max_memory = parse_memory_size(args.max_memory) if args.max_memory else None
+        run_shards_locally(args.input_dir, args.output_dir, args.num_shards, max_memory)
+
+    try:
+        reduce_all_outputs(args.output_dir, args.num_shards)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    if not args.no_merge:
+        merge_final_tables(args.output_dir)
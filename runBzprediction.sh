@@ -13,7 +13,8 @@
 #     --input-dir /path/to/input \
 #     --output-dir /path/to/output \
 #     --num-models 25 \
-#     --recycles 0
+#     --recycles 0 \
+#     --output-format pdb     # or mmcif; the analysis scripts read both
 # ============================================================
 
 INPUT_DIR=""
@@ -21,9 +22,10 @@ OUT_DIR=""
 #By default 25 models 0 recycles
 NUM_MODELS=25
 RECYCLES=0
+OUTPUT_FORMAT="pdb"
 
 usage() {
-  echo "Usage: sbatch [sbatch options] $0 --input-dir <dir> --output-dir <dir> [--num-models 25] [--recycles 0]"
+  echo "Usage: sbatch [sbatch options] $0 --input-dir <dir> --output-dir <dir> [--num-models 25] [--recycles 0] [--output-format pdb|mmcif]"
   exit 1
 }
 
@@ -37,6 +39,8 @@ while [[ $# -gt 0 ]]; do
       NUM_MODELS="${2:-}"; shift 2 ;;
     --recycles)
       RECYCLES="${2:-}"; shift 2 ;;
+    --output-format)
+      OUTPUT_FORMAT="${2:-}"; shift 2 ;;
     -*|--*)
       echo "Unknown option: $1"; usage ;;
     *)
@@ -46,6 +50,12 @@ done
 
 [[ -z "$INPUT_DIR" || -z "$OUT_DIR" ]] && usage
 
+# With csv2yamls_w_molecules.py --cache every job may already be in the prediction store
+if ! compgen -G "$INPUT_DIR/*.y*ml" > /dev/null; then
+  echo "No YAML files in $INPUT_DIR, nothing to predict."
+  exit 0
+fi
+
 # -------------------------
 # Environment setup
 # -------------------------
@@ -68,9 +78,10 @@ echo "  Input dir   : $INPUT_DIR"
 echo "  Output dir  : $OUT_DIR"
 echo "  Num models  : $NUM_MODELS"
 echo "  Recycles    : $RECYCLES"
+echo "  Format      : $OUTPUT_FORMAT"
 
 CUDA_VISIBLE_DEVICES="${CUDA_VISIBLE_DEVICES:-0}" boltz predict "$INPUT_DIR" \
-  --output_format pdb \
+  --output_format "$OUTPUT_FORMAT" \
   --use_msa_server \
   --out_dir "$OUT_DIR" \
   --diffusion_samples "$NUM_MODELS" \
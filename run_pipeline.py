@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency-aware runner for the whole workflow of pipeline_draft0.sh and
+analysis.sh, per ligand:
+
+    yamls -> predict -> {overlap volume, composite variance, affinities, openness} -> merge -> clean
+
+Stages declare their inputs, outputs and upstream stages. A stage is skipped
+when its outputs exist and its stamp (pipeline_stamps/<stage>.done, written on
+success) is newer than every input, make-style; upstream stamps count as
+inputs, so a rerun stage invalidates everything below it. Independent stages
+(the four analyzers, and different ligands) run concurrently. After the first
+failure no new stage is started, and a per-stage report is printed.
+
+Prediction is pluggable (--predictor): submit runBzprediction.sh with sbatch,
+run any local command template (e.g. a stub that writes test folders), or use
+predictions that already exist.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from csv2yamls_w_molecules import load_molecules
+from reduce_shards import SCRIPT_DIR, analyzer_commands, clean_tag_suffixes, merge_analysis_tables
+
+ANALYZER_STAGES = [
+    ("overlap_volume", ["overall_folder_summary.csv"]),
+    ("composite_variance", ["composite_variances.csv"]),
+    ("affinities", ["affinities.csv"]),
+    ("openess", ["openess.csv"]),
+]
+PREDICTORS = ("sbatch", "command", "existing")
+
+
+def make_stage(name, inputs, outputs, after=(), command=None, func=None):
+    """A stage runs either `command` (argv list, logged to a file) or `func()` in-process."""
+    return {'name': name, 'inputs': list(inputs), 'outputs': list(outputs), 'after': list(after),
+            'command': command, 'func': func}
+
+
+def prediction_command(predictor, yaml_dir, models_dir, num_models, recycles, predict_command=None):
+    if predictor == "sbatch":
+        return ["sbatch", "--wait", os.path.join(SCRIPT_DIR, "runBzprediction.sh"),
+                "--input-dir", yaml_dir, "--output-dir", models_dir,
+                "--num-models", str(num_models), "--recycles", str(recycles)]
+    if predictor == "command":
+        if not predict_command:
+            raise ValueError("--predictor command requires --predict_command")
+        command = predict_command.format(input_dir=yaml_dir, output_dir=models_dir, num_models=num_models,
+                                         recycles=recycles, ligand=os.path.basename(yaml_dir))
+        return ["bash", "-c", command]
+    return None
+
+
+def build_stages(data_csv, molecules, project_dir, predictor="sbatch", predict_command=None,
+                 num_models=25, recycles=0, res1=40, res2=389, chain="A", molecules_arg=None):
+    """
+    Declares the stages for every ligand. Layout under `project_dir`:
+    yamls/<LIG>/, models/boltz_results_<LIG>/predictions/ and analysis/<LIG>/.
+    """
+    stages = []
+    for ligand, smiles in molecules.items():
+        yaml_dir = os.path.join(project_dir, "yamls", ligand)
+        models_dir = os.path.join(project_dir, "models")
+        predictions_dir = os.path.join(models_dir, f"boltz_results_{ligand}", "predictions")
+        analysis_dir = os.path.join(project_dir, "analysis", ligand)
+        yaml_inputs = [data_csv] + ([molecules_arg] if molecules_arg and os.path.isfile(molecules_arg) else [])
+
+        stages.append(make_stage(
+            f"{ligand}:yamls", yaml_inputs, [yaml_dir],
+            command=[sys.executable, os.path.join(SCRIPT_DIR, "csv2yamls_w_molecules.py"), data_csv,
+                     "--output-dir", yaml_dir, "--molecules", json.dumps({ligand: smiles})]))
+
+        command = prediction_command(predictor, yaml_dir, models_dir, num_models, recycles, predict_command)
+        if command is None:
+            # Existing predictions: nothing to run, but the folder must be there
+            stages.append(make_stage(f"{ligand}:predict", [], [predictions_dir], after=[f"{ligand}:yamls"],
+                                     func=lambda path=predictions_dir: check_exists(path)))
+        else:
+            stages.append(make_stage(f"{ligand}:predict", [], [predictions_dir], after=[f"{ligand}:yamls"],
+                                     command=command))
+
+        analyzer_names = []
+        for (name, outputs), cmd in zip(ANALYZER_STAGES,
+                                        analyzer_commands(predictions_dir, analysis_dir, None, res1, res2, chain)):
+            analyzer_names.append(f"{ligand}:{name}")
+            stages.append(make_stage(analyzer_names[-1], [], [os.path.join(analysis_dir, o) for o in outputs],
+                                     after=[f"{ligand}:predict"], command=cmd))
+
+        merged = os.path.join(analysis_dir, "volumes_variances_affinities_openess.csv")
+        stages.append(make_stage(f"{ligand}:merge", [], [merged], after=analyzer_names,
+                                 func=lambda path=analysis_dir: merge_analysis_tables(path)))
+        stages.append(make_stage(f"{ligand}:clean", [], [merged.replace(".csv", "_clean.csv")],
+                                 after=[f"{ligand}:merge"], func=lambda path=merged: clean_tag_suffixes(path)))
+    return stages
+
+
+def check_exists(path):
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Predictions folder not found: {path}")
+
+
+def newest_mtime(path):
+    """Modification time of a file, or of the newest entry under a directory."""
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    newest = os.path.getmtime(path)
+    for root, dirs, files in os.walk(path):
+        for name in files + dirs:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+            except OSError:
+                pass
+    return newest
+
+
+def stamp_path(stamp_dir, stage):
+    return os.path.join(stamp_dir, stage['name'].replace(':', '__') + ".done")
+
+
+def is_up_to_date(stage, stamp_dir, stamps_by_name):
+    """True if the stage's outputs exist and its stamp is newer than its inputs and upstream stamps."""
+    stamp = stamp_path(stamp_dir, stage)
+    if not os.path.exists(stamp) or not all(os.path.exists(p) for p in stage['outputs']):
+        return False
+    stamp_time = os.path.getmtime(stamp)
+    inputs = stage['inputs'] + [stamps_by_name[name] for name in stage['after']]
+    for path in inputs:
+        if not os.path.exists(path) or newest_mtime(path) > stamp_time:
+            return False
+    return True
+
+
+def missing_outputs(stage, start):
+    """Outputs that do not exist, or output files not rewritten since `start` (folders only need to exist)."""
+    return [p for p in stage['outputs']
+            if not os.path.exists(p) or (os.path.isfile(p) and os.path.getmtime(p) < start - 1)]
+
+
+def run_stage(stage, log_dir):
+    """Runs one stage; returns (ok, seconds, message)."""
+    start = time.time()
+    message = ""
+    try:
+        # Concurrent stages share output folders (e.g. analysis/<LIG>), so their parents are created up front
+        for path in stage['outputs']:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if stage['command'] is not None:
+            message = os.path.join(log_dir, stage['name'].replace(':', '__') + ".log")
+            with open(message, "w") as log:
+                proc = subprocess.run(stage['command'], stdout=log, stderr=subprocess.STDOUT)
+            if proc.returncode != 0:
+                return False, time.time() - start, f"exit code {proc.returncode}, see {message}"
+        else:
+            stage['func']()
+    except Exception as e:
+        return False, time.time() - start, f"{type(e).__name__}: {e}"
+    # Several scripts report errors and return normally, so the outputs are checked too
+    missing = missing_outputs(stage, start)
+    if missing:
+        return False, time.time() - start, f"outputs not written: {', '.join(missing)} {message}".rstrip()
+    return True, time.time() - start, message
+
+
+def run_pipeline(stages, work_dir, workers=4, force=False, dry_run=False):
+    """
+    Runs the stage graph with up to `workers` concurrent stages.
+
+    Returns:
+        dict: stage name -> (status, seconds, message), status one of done,
+        skipped, planned (dry run), failed, blocked (an upstream stage failed) or not run.
+    """
+    stamp_dir = os.path.join(work_dir, "pipeline_stamps")
+    log_dir = os.path.join(work_dir, "pipeline_logs")
+    os.makedirs(stamp_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    by_name = {s['name']: s for s in stages}
+    stamps_by_name = {name: stamp_path(stamp_dir, s) for name, s in by_name.items()}
+    for stage in stages:
+        unknown = [d for d in stage['after'] if d not in by_name]
+        if unknown:
+            raise ValueError(f"Stage {stage['name']} depends on unknown stages {unknown}")
+
+    report = {}
+    pending = [s['name'] for s in stages]
+    running = {}
+    failed = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            n_pending = len(pending)
+            for name in list(pending):
+                stage = by_name[name]
+                if any(report.get(d, ('',))[0] in ('failed', 'blocked') for d in stage['after']):
+                    report[name] = ('blocked', 0.0, "upstream stage failed")
+                    pending.remove(name)
+                    continue
+                if failed or not all(report.get(d, ('',))[0] in ('done', 'skipped', 'planned') for d in stage['after']):
+                    continue
+                pending.remove(name)
+                # A stage is only current if nothing above it was rerun in this invocation
+                upstream_rerun = any(report[d][0] in ('done', 'planned') for d in stage['after'])
+                if not force and not upstream_rerun and is_up_to_date(stage, stamp_dir, stamps_by_name):
+                    report[name] = ('skipped', 0.0, "up to date")
+                    print(f"[SKIP] {name}: up to date")
+                    continue
+                if dry_run:
+                    report[name] = ('planned', 0.0, "would run")
+                    print(f"[PLAN] {name}: would run")
+                    continue
+                print(f"[RUN]  {name}")
+                running[pool.submit(run_stage, stage, log_dir)] = name
+
+            if not running:
+                if pending and failed:
+                    for name in pending:
+                        report[name] = ('not run', 0.0, "pipeline stopped after a failure")
+                    pending = []
+                if not pending:
+                    break
+                if len(pending) == n_pending:
+                    raise ValueError(f"Stages {pending} can never run (dependency cycle)")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                ok, seconds, message = future.result()
+                if ok:
+                    with open(stamps_by_name[name], "w") as f:
+                        f.write(time.strftime("%Y-%m-%d %H:%M:%S\n"))
+                    report[name] = ('done', seconds, message)
+                    print(f"[DONE] {name} ({seconds:.1f}s)")
+                else:
+                    failed = True
+                    if os.path.exists(stamps_by_name[name]):
+                        os.remove(stamps_by_name[name])
+                    report[name] = ('failed', seconds, message)
+                    print(f"[FAIL] {name}: {message}")
+    return report
+
+
+def print_report(stages, report):
+    print("\n=== Pipeline report ===")
+    width = max(len(s['name']) for s in stages)
+    for stage in stages:
+        status, seconds, message = report.get(stage['name'], ('not run', 0.0, ''))
+        print(f"  {stage['name']:<{width}}  {status:<8} {seconds:7.1f}s  {message}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run YAML generation, prediction, analysis, merge and clean as one pipeline.")
+    parser.add_argument("--data_csv", required=True, help="Library CSV with Tag and sequence columns")
+    parser.add_argument("--molecules", required=True, help="JSON string or file of {ligand: SMILES}")
+    parser.add_argument("--project_dir", required=True, help="Folder for yamls/, models/, analysis/ and the pipeline state")
+    parser.add_argument("--predictor", choices=PREDICTORS, default="sbatch",
+                        help="sbatch: submit runBzprediction.sh and wait; command: run --predict_command; "
+                             "existing: use predictions already in models/ (default: sbatch)")
+    parser.add_argument("--predict_command", default=None,
+                        help="Command template for --predictor command, with {input_dir} {output_dir} {ligand} "
+                             "{num_models} {recycles}; it must write <output_dir>/boltz_results_<ligand>/predictions")
+    parser.add_argument("--num_models", type=int, default=25, help="Diffusion samples (default: 25)")
+    parser.add_argument("--recycles", type=int, default=0, help="Recycling steps (default: 0)")
+    parser.add_argument("--res1", type=int, default=40, help="First openness residue (default: 40)")
+    parser.add_argument("--res2", type=int, default=389, help="Second openness residue (default: 389)")
+    parser.add_argument("--chain", default="A", help="Protein chain ID (default: A)")
+    parser.add_argument("--workers", type=int, default=4, help="Stages run concurrently (default: 4)")
+    parser.add_argument("--force", action="store_true", help="Rerun every stage even if it is up to date")
+    parser.add_argument("--dry_run", action="store_true", help="Only print which stages would run")
+    args = parser.parse_args()
+
+    stages = build_stages(args.data_csv, load_molecules(args.molecules), args.project_dir, args.predictor,
+                          args.predict_command, args.num_models, args.recycles, args.res1, args.res2, args.chain,
+                          molecules_arg=args.molecules)
+    report = run_pipeline(stages, args.project_dir, args.workers, args.force, args.dry_run)
+    print_report(stages, report)
+    raise SystemExit(1 if any(status in ('failed', 'blocked', 'not run') for status, _, _ in report.values()) else 0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic Tag sharding shared by the analysis scripts (--shard i/N).
+
+Each Tag is assigned to shard crc32(Tag) % N, so the assignment does not depend
+on which other folders exist or on the order os.listdir returns them. Shard
+indices are 0-based to match SLURM array task IDs (--array=0-<N-1>).
+"""
+import os
+import re
+import csv
+import zlib
+import numpy as np
+
+SHARD_SUFFIX_RE = re.compile(r'\.shard-(\d+)-of-(\d+)$')
+
+
+def parse_shard(spec):
+    """Parses 'i/N' into (i, N); None or '' means no sharding."""
+    if not spec:
+        return None
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"--shard must look like i/N (e.g. 0/8), got '{spec}'")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"--shard index must be in [0, N), got '{spec}'")
+    return index, count
+
+
+def shard_of(tag, count):
+    return zlib.crc32(tag.encode('utf-8')) % count
+
+
+def select_shard(tags, shard):
+    """Tags belonging to `shard` ((i, N) or None for all tags)."""
+    if shard is None:
+        return list(tags)
+    index, count = shard
+    return [tag for tag in tags if shard_of(tag, count) == index]
+
+
+def shard_output_path(path, shard):
+    """'out/openess.csv' -> 'out/openess.shard-2-of-8.csv' (unchanged when not sharded)."""
+    if shard is None:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def add_shard_argument(parser):
+    parser.add_argument("--shard", default=None,
+                        help="Process only shard i of N (0-based, e.g. 3/16) and write *.shard-i-of-N partial "
+                             "outputs for reduce_shards.py")
+
+
+def write_rows(rows, fieldnames, output_filepath):
+    """Writes dict rows as a CSV (typically to a shard_output_path), floats with three decimals."""
+    with open(output_filepath, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: f"{v:.3f}" if isinstance(v, (float, np.floating)) else v for k, v in row.items()})
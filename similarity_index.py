@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-variant similarity index over ensemble feature vectors.
+
+Every prediction folder is described by
+- its ensemble distance maps: the condensed mean and standard deviation over
+  models of the CA distance map, compressed to a few components by a seeded
+  random projection (default, needs no refit) or a PCA fitted at build time
+- the scalar features of the analysis CSVs (overlap volume, composite variances,
+  openness, affinity), z-scored with the statistics of the build set
+
+Both blocks are scaled to unit average norm and concatenated. The index is
+persisted as one .npz; `update` projects new folders with the stored
+projection and statistics, so existing vectors never change.
+"""
+import os
+import csv
+import argparse
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import pdist
+
+from fast_structure import list_structure_files, read_structure, select_atoms
+from model_filter import add_model_filter_arguments, describe_filter, model_filter_from_args, select_models
+
+INDEX_VERSION = 2
+
+# (analysis CSV, columns) read by Tag, under the names analysis.sh writes
+SCALAR_SOURCES = [
+    ("overall_folder_summary.csv", ["overlap_volume", "overlap_w_pos_volume", "ligand_pLDDT_avg"]),
+    ("composite_variances.csv", ["variance_avg", "variance_pLDDT_w", "complex_PDE_avg"]),
+    ("openess.csv", ["openess_avg", "openess_range"]),
+    ("affinities.csv", ["affinity_pred_value", "affinity_probability_binary"]),
+]
+SCALAR_FEATURES = [column for _, columns in SCALAR_SOURCES for column in columns]
+
+
+def ensemble_map_features(folder, chain_id="A", model_filter=None):
+    """
+    Condensed mean and standard deviation over models of the CA distance map.
+
+    Returns:
+        np.ndarray or None: float32 vector of length 2 * N(N-1)/2, or None if no model could be read.
+    """
+    pdb_files, _ = select_models(folder, list_structure_files(folder), model_filter)
+    maps = []
+    for pdb_file in pdb_files:
+        atoms = read_structure(os.path.join(folder, pdb_file))
+        coords = atoms['coord'][select_atoms(atoms, record='ATOM', name='CA', chain=chain_id)]
+        if maps and len(pdist(coords)) != len(maps[0]):
+            print(f"  Skipping {pdb_file}: CA count differs from first model.")
+            continue
+        if len(coords) > 1:
+            maps.append(pdist(coords).astype(np.float32))
+    if not maps:
+        return None
+    maps = np.stack(maps)
+    return np.concatenate([maps.mean(axis=0), maps.std(axis=0)])
+
+
+def read_scalar_features(analysis_dir):
+    """Maps Tag -> float vector of SCALAR_FEATURES from the analysis CSVs (NaN where missing)."""
+    values = {}
+    for name, columns in SCALAR_SOURCES:
+        path = os.path.join(analysis_dir, name)
+        if not os.path.exists(path):
+            print(f"[WARN] {path} not found, its features are left empty.")
+            continue
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                features = values.setdefault(row['Tag'], {})
+                for column in columns:
+                    try:
+                        features[column] = float(row.get(column, 'NA'))
+                    except (TypeError, ValueError):
+                        pass
+    return {tag: np.array([f.get(c, np.nan) for c in SCALAR_FEATURES]) for tag, f in values.items()}
+
+
+def random_projection_matrix(n_features, n_components, seed):
+    """Gaussian projection matrix, regenerated from its seed instead of being stored."""
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n_features, n_components), dtype=np.float32) / np.sqrt(n_components)
+
+
+def fit_pca(maps, n_components):
+    """Mean and leading principal axes (n_components, D) of the rows of `maps`, via the (n, n) Gram matrix."""
+    mean = maps.mean(axis=0)
+    centered = maps - mean
+    eigvals, eigvecs = np.linalg.eigh(centered @ centered.T)
+    order = np.argsort(eigvals)[::-1][:n_components]
+    order = order[eigvals[order] > 1e-9 * max(eigvals.max(), 1e-12)]
+    components = (centered.T @ eigvecs[:, order]) / np.sqrt(eigvals[order])
+    return mean, components.T.astype(np.float32)
+
+
+def project_maps(index, maps):
+    """Projects (n, D) ensemble map features with the projection stored in `index`."""
+    if str(index['method']) == 'pca':
+        return (maps - index['pca_mean']) @ index['pca_components'].T
+    projection = random_projection_matrix(maps.shape[1], int(index['n_components']), int(index['seed']))
+    return maps @ projection - index['projection_mean']
+
+
+def featurize_tags(tags, input_dir, scalars, n_map_features, chain_id, model_filter):
+    """Map features (None where missing or of another size) and scalar features of `tags`."""
+    maps, scalar_rows = [], []
+    for tag in tags:
+        print(f"Featurizing {tag}...")
+        features = ensemble_map_features(os.path.join(input_dir, tag), chain_id, model_filter)
+        if features is None or (n_map_features is not None and len(features) != n_map_features):
+            print(f"  No distance maps matching the index size for {tag}, structure block left at the library mean.")
+            features = None
+        maps.append(features)
+        scalar_rows.append(scalars.get(tag, np.full(len(SCALAR_FEATURES), np.nan)))
+    return maps, np.array(scalar_rows, dtype=np.float64).reshape(len(tags), len(SCALAR_FEATURES))
+
+
+def fill_missing_maps(maps, n_features):
+    """Stacks the map features, zero-filling missing rows; their embeddings are set to 0 (the mean) after projection."""
+    missing = np.array([m is None for m in maps])
+    stacked = np.stack([np.zeros(n_features, dtype=np.float32) if m is None else m for m in maps])
+    return stacked, missing
+
+
+def scalar_statistics(scalar_values):
+    """Column means and standard deviations ignoring NaN; features missing everywhere get mean 0, std 1."""
+    present = ~np.isnan(scalar_values)
+    counts = present.sum(axis=0)
+    filled = np.where(present, scalar_values, 0.0)
+    mean = np.divide(filled.sum(axis=0), counts, out=np.zeros(scalar_values.shape[1]), where=counts > 0)
+    sq = np.where(present, (scalar_values - mean) ** 2, 0.0).sum(axis=0)
+    std = np.sqrt(np.divide(sq, counts, out=np.ones(scalar_values.shape[1]), where=counts > 0))
+    return mean, std
+
+
+def structure_folders(input_dir):
+    return sorted(e.name for e in os.scandir(input_dir) if e.is_dir() and list_structure_files(e.path))
+
+
+def build_index(input_dir, analysis_dir, method="random", n_components=32, seed=0, chain_id="A", model_filter=None):
+    """Featurizes every prediction folder and returns the index as a dict of arrays."""
+    tags = structure_folders(input_dir)
+    if not tags:
+        raise ValueError(f"No prediction folders with structures found in {input_dir}")
+    scalars = read_scalar_features(analysis_dir)
+    maps, scalar_values = featurize_tags(tags, input_dir, scalars, None, chain_id, model_filter)
+    sizes = {len(m) for m in maps if m is not None}
+    if not sizes:
+        raise ValueError(f"No distance maps found in {input_dir}: no selected model has chain {chain_id} CA atoms")
+    if len(sizes) > 1:
+        raise ValueError(f"Distance map sizes differ between folders ({sorted(sizes)}); build one index per construct length")
+    n_map_features = sizes.pop()
+    maps, missing = fill_missing_maps(maps, n_map_features)
+
+    index = {
+        'version': np.array(INDEX_VERSION), 'method': np.array(method), 'seed': np.array(seed),
+        'chain': np.array(chain_id), 'n_map_features': np.array(n_map_features),
+        'model_filter': np.array(describe_filter(model_filter)),
+    }
+    if method == 'pca':
+        index['pca_mean'], index['pca_components'] = fit_pca(maps[~missing].astype(np.float64), n_components)
+        index['n_components'] = np.array(len(index['pca_components']))
+    else:
+        index['n_components'] = np.array(n_components)
+        # project_maps subtracts projection_mean, so it is zero while the build set mean is computed
+        index['projection_mean'] = np.zeros(n_components, dtype=np.float32)
+        index['projection_mean'] = project_maps(index, maps[~missing]).mean(axis=0)
+
+    embeddings = project_maps(index, maps)
+    embeddings[missing] = 0.0
+    index['structure_scale'] = np.array(np.sqrt(np.mean(np.sum(embeddings[~missing] ** 2, axis=1))) or 1.0)
+    index['scalar_mean'], index['scalar_std'] = scalar_statistics(scalar_values)
+    index['scalar_names'] = np.array(SCALAR_FEATURES)
+    index['tags'] = np.array(tags)
+    index['embeddings'] = embeddings.astype(np.float32)
+    index['scalars'] = scalar_values
+    print(f"Built {method} index of {len(tags)} folders: {int(index['n_components'])} structure components, "
+          f"{len(SCALAR_FEATURES)} scalar features")
+    return index
+
+
+def update_index(index, input_dir, analysis_dir, model_filter=None):
+    """
+    Appends folders not yet in the index, projected with its stored projection
+    and statistics. The model filter must be the one the index was built with.
+    """
+    if describe_filter(model_filter) != str(index['model_filter']):
+        raise ValueError(f"Index was built with model filter '{index['model_filter']}', "
+                         f"update requested with '{describe_filter(model_filter)}'; use the same filter or rebuild")
+    known = set(index['tags'].tolist())
+    new_tags = [tag for tag in structure_folders(input_dir) if tag not in known]
+    if not new_tags:
+        print("Index is up to date.")
+        return index
+    scalars = read_scalar_features(analysis_dir)
+    maps, scalar_values = featurize_tags(new_tags, input_dir, scalars, int(index['n_map_features']),
+                                         str(index['chain']), model_filter)
+    maps, missing = fill_missing_maps(maps, int(index['n_map_features']))
+    embeddings = project_maps(index, maps)
+    embeddings[missing] = 0.0
+
+    index = dict(index)
+    index['tags'] = np.concatenate([index['tags'], np.array(new_tags)])
+    index['embeddings'] = np.concatenate([index['embeddings'], embeddings.astype(np.float32)])
+    index['scalars'] = np.concatenate([index['scalars'], scalar_values])
+    print(f"Added {len(new_tags)} folders, index now holds {len(index['tags'])}")
+    return index
+
+
+def index_vectors(index, structure_weight=1.0):
+    """Combined search vectors: scaled structure embeddings next to z-scored scalar features (NaN -> mean)."""
+    std = np.where(index['scalar_std'] > 0, index['scalar_std'], 1.0)
+    scalars = np.nan_to_num((index['scalars'] - index['scalar_mean']) / std)
+    scalars /= np.sqrt(max(scalars.shape[1], 1))
+    structure = index['embeddings'] / float(index['structure_scale'])
+    return np.hstack([structure_weight * structure, scalars])
+
+
+def save_index(index, path):
+    np.savez(path, **index)
+    print(f"Index saved to: {path}")
+
+
+def load_index(path):
+    with np.load(path) as data:
+        index = {k: data[k] for k in data.files}
+    if int(index['version']) != INDEX_VERSION:
+        raise ValueError(f"{path} was written by index version {int(index['version'])}, expected {INDEX_VERSION}; rebuild it")
+    return index
+
+
+def nearest_neighbors(index, tags=None, k=10, structure_weight=1.0):
+    """
+    k nearest folders of each of `tags` (default: every folder in the index).
+
+    Returns:
+        list: (Tag, rank, neighbor Tag, distance) rows, closest first, the query itself excluded.
+    """
+    vectors = index_vectors(index, structure_weight)
+    all_tags = index['tags'].tolist()
+    positions = {tag: i for i, tag in enumerate(all_tags)}
+    if tags is None:
+        tags = all_tags
+    missing = [tag for tag in tags if tag not in positions]
+    if missing:
+        raise KeyError(f"Tags not in the index: {', '.join(missing)}")
+
+    k = min(k, len(all_tags) - 1)
+    if k < 1:
+        return []
+    query = [positions[tag] for tag in tags]
+    distances, neighbors = cKDTree(vectors).query(vectors[query], k=k + 1)
+    rows = []
+    for tag, q, dists, idx in zip(tags, query, distances, neighbors):
+        hits = [(d, j) for d, j in zip(dists, idx) if j != q][:k]
+        rows.extend((tag, rank, all_tags[j], d) for rank, (d, j) in enumerate(hits, start=1))
+    return rows
+
+
+def write_neighbors_csv(rows, output_csv):
+    with open(output_csv, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Tag", "rank", "neighbor_Tag", "distance"])
+        writer.writerows((tag, rank, neighbor, f"{dist:.3f}") for tag, rank, neighbor, dist in rows)
+    print(f"Neighbors written to: {output_csv}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, update and query a cross-variant similarity index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Featurize every prediction folder into a new index")
+    update = subparsers.add_parser("update", help="Add prediction folders that are not yet in the index")
+    for sub in (build, update):
+        sub.add_argument("--input_dir", required=True, help="Boltz predictions folder (folder of folders)")
+        sub.add_argument("--analysis_dir", required=True, help="Folder with the analysis.sh output CSVs")
+        sub.add_argument("--index", required=True, help="Index .npz path")
+        add_model_filter_arguments(sub)
+    build.add_argument("--method", choices=["random", "pca"], default="random",
+                       help="Distance map compression: seeded random projection or PCA fitted on the build set (default: random)")
+    build.add_argument("--n_components", type=int, default=32, help="Structure components (default: 32)")
+    build.add_argument("--seed", type=int, default=0, help="Random projection seed (default: 0)")
+    build.add_argument("--chain", default="A", help="Protein chain ID (default: A)")
+
+    query = subparsers.add_parser("query", help="Nearest neighbors of one or more Tags, or of every Tag with --all")
+    query.add_argument("--index", required=True, help="Index .npz path")
+    query.add_argument("--tag", nargs='+', default=None, help="Folder names to query")
+    query.add_argument("--all", action="store_true", help="Query every folder in the index")
+    query.add_argument("-k", type=int, default=10, help="Neighbors per query (default: 10)")
+    query.add_argument("--structure_weight", type=float, default=1.0,
+                       help="Weight of the distance map block relative to the scalar features (default: 1)")
+    query.add_argument("--output_csv", default=None, help="Write Tag,rank,neighbor_Tag,distance rows here instead of printing")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        save_index(build_index(args.input_dir, args.analysis_dir, args.method, args.n_components, args.seed,
+                               args.chain, model_filter_from_args(args)), args.index)
+    elif args.command == "update":
+        save_index(update_index(load_index(args.index), args.input_dir, args.analysis_dir,
+                                model_filter_from_args(args)), args.index)
+    else:
+        if not args.all and not args.tag:
+            parser.error("query needs --tag or --all")
+        rows = nearest_neighbors(load_index(args.index), None if args.all else args.tag, args.k, args.structure_weight)
+        if args.output_csv:
+            write_neighbors_csv(rows, args.output_csv)
+        else:
+            for tag, rank, neighbor, dist in rows:
+                print(f"{tag}\t{rank}\t{neighbor}\t{dist:.3f}")
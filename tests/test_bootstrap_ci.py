@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Count-matrix bootstrap and jackknife formulas of bootstrap_ci.py against explicit resampling."""
+import numpy as np
+import pytest
+from scipy import stats
+
+from batch_distanceMaps_variance import composite_variance
+from bootstrap_ci import (
+    bootstrap_composite_variance, bootstrap_mean, jackknife_ci, jackknife_ci_columns, jackknife_union_volume,
+    resample_counts, union_membership
+)
+
+
+def resampled_indices(count_row):
+    """The model indices of one resample, e.g. counts [2, 0, 1] -> [0, 0, 2]."""
+    return np.repeat(np.arange(len(count_row)), count_row.astype(int))
+
+
+def test_resample_counts_are_multinomial_draws():
+    counts = resample_counts(7, 200, seed=3)
+    assert counts.shape == (200, 7)
+    np.testing.assert_array_equal(counts.sum(axis=1), 7)
+    assert np.all(counts == np.round(counts)) and counts.min() >= 0
+    np.testing.assert_array_equal(counts, resample_counts(7, 200, seed=3))
+    assert not np.array_equal(counts, resample_counts(7, 200, seed=4))
+
+
+def test_bootstrap_mean_matches_explicit_resampling():
+    values = np.random.default_rng(0).normal(size=6)
+    counts = resample_counts(6, 50, seed=1)
+    expected = [values[resampled_indices(row)].mean() for row in counts]
+    np.testing.assert_allclose(bootstrap_mean(values, counts), expected)
+
+
+@pytest.mark.parametrize("chunk", [None, 7])
+def test_bootstrap_composite_variance_matches_explicit_resampling(chunk):
+    rng = np.random.default_rng(1)
+    matrices = [rng.uniform(0, 1, (6, 5)).astype(np.float32) for _ in range(5)]
+    counts = resample_counts(5, 40, seed=2)
+    expected = [composite_variance([matrices[i] for i in resampled_indices(row)]) for row in counts]
+    np.testing.assert_allclose(bootstrap_composite_variance(matrices, counts, chunk), expected, rtol=1e-9, atol=1e-12)
+    # All-ones counts are the original ensemble
+    np.testing.assert_allclose(bootstrap_composite_variance(matrices, np.ones((1, 5)), chunk),
+                               composite_variance(matrices), rtol=1e-9)
+
+
+@pytest.mark.parametrize("chunk_points", [None, 13])
+def test_union_membership(chunk_points):
+    points = np.random.default_rng(2).uniform(-3, 3, (100, 3))
+    coords = [np.array([[0.0, 0.0, 0.0], [1.5, 0.0, 0.0]]), np.array([[0.0, 1.0, 1.0]])]
+    radii = [np.array([1.7, 1.5]), np.array([1.2])]
+    membership = union_membership(coords, radii, points, chunk_points)
+    for m in range(2):
+        d = np.linalg.norm(points[:, np.newaxis, :] - coords[m][np.newaxis], axis=2)
+        np.testing.assert_array_equal(membership[m], np.any(d <= radii[m], axis=1))
+
+
+def test_jackknife_union_volume_matches_brute_force_leave_one_out():
+    membership = np.random.default_rng(3).uniform(size=(6, 500)) < 0.15
+    full, loo = jackknife_union_volume(membership, box_volume=8.0)
+    assert full == pytest.approx(np.any(membership, axis=0).mean() * 8.0)
+    expected = [np.any(np.delete(membership, m, axis=0), axis=0).mean() * 8.0 for m in range(6)]
+    np.testing.assert_allclose(loo, expected)
+
+
+def test_jackknife_ci_formula():
+    # For a mean, the leave-one-out standard error reduces to the usual s / sqrt(n)
+    values = np.random.default_rng(4).normal(size=10)
+    loo = (values.sum() - values) / (len(values) - 1)
+    low, high = jackknife_ci(values.mean(), loo, level=0.9)
+    half_width = stats.t.ppf(0.95, 9) * values.std(ddof=1) / np.sqrt(10)
+    assert low == pytest.approx(values.mean() - half_width)
+    assert high == pytest.approx(values.mean() + half_width)
+
+
+def test_jackknife_ci_columns():
+    assert jackknife_ci_columns('overlap_volume', 10.0, np.array([9.5])) == \
+        {'overlap_volume_ci_low': 'NA', 'overlap_volume_ci_high': 'NA'}
+    columns = jackknife_ci_columns('overlap_volume', 10.0, np.array([10.0, 10.0, 10.0]))
+    assert columns == {'overlap_volume_ci_low': '10.000', 'overlap_volume_ci_high': '10.000'}
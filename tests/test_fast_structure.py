@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""fast_structure readers against Bio.PDB on a small Boltz-style PDB and mmCIF."""
+import numpy as np
+import pytest
+
+from fast_structure import read_cif_atoms, read_pdb_atoms
+
+PDB = pytest.importorskip("Bio.PDB")
+
+# (record, name, resname, chain, resnum, x, y, z, pLDDT x 100, element); the ligand has primed atom names
+ATOMS = [
+    ('ATOM', 'N', 'MET', 'A', 1, 10.104, -3.221, 4.507, 71.25, 'N'),
+    ('ATOM', 'CA', 'MET', 'A', 1, 11.532, -3.004, 4.790, 72.40, 'C'),
+    ('ATOM', 'C', 'MET', 'A', 1, 12.011, -1.611, 4.372, 73.02, 'C'),
+    ('ATOM', 'O', 'MET', 'A', 1, 11.284, -0.824, 3.771, 70.88, 'O'),
+    ('ATOM', 'N', 'SER', 'A', 2, 13.275, -1.342, 4.683, 88.10, 'N'),
+    ('ATOM', 'CA', 'SER', 'A', 2, 13.870, -0.041, 4.378, 89.55, 'C'),
+    ('ATOM', 'C', 'SER', 'A', 2, 15.386, -0.130, 4.239, 90.12, 'C'),
+    ('ATOM', 'O', 'SER', 'A', 2, 16.004, -1.176, 4.432, 87.64, 'O'),
+    ('HETATM', "C1'", 'LIG', 'B', 1, 14.520, 2.318, 7.905, 65.31, 'C'),
+    ('HETATM', "C2'", 'LIG', 'B', 1, 15.944, 2.701, 8.260, 64.97, 'C'),
+    ('HETATM', "O5'", 'LIG', 'B', 1, 13.702, 3.405, 7.488, 66.02, 'O'),
+    ('HETATM', 'N1', 'LIG', 'B', 1, 16.811, 1.598, 8.702, 63.40, 'N'),
+]
+
+CIF_ITEMS = ['group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_alt_id', 'label_comp_id',
+             'label_asym_id', 'label_entity_id', 'label_seq_id', 'pdbx_PDB_ins_code', 'Cartn_x', 'Cartn_y',
+             'Cartn_z', 'occupancy', 'B_iso_or_equiv', 'auth_seq_id', 'auth_asym_id', 'pdbx_PDB_model_num']
+
+
+def write_pdb(path):
+    lines = []
+    for serial, (record, name, resname, chain, resnum, x, y, z, b, element) in enumerate(ATOMS, 1):
+        padded = name if len(name) == 4 else f" {name:<3}"
+        lines.append(f"{record:<6}{serial:>5} {padded} {resname:>3} {chain}{resnum:>4}    "
+                     f"{x:>8.3f}{y:>8.3f}{z:>8.3f}{1.0:>6.2f}{b:>6.2f}          {element:>2}")
+    path.write_text("\n".join(lines + ["END"]) + "\n")
+
+
+def write_cif(path, spaced_value=False):
+    """mmCIF as Boltz writes it: primed names quoted, e.g. "C1'". With `spaced_value` one column holds 'lig 1'."""
+    lines = ["data_model", "#", "loop_"] + [f"_atom_site.{item}" for item in CIF_ITEMS]
+    for serial, (record, name, resname, chain, resnum, x, y, z, b, element) in enumerate(ATOMS, 1):
+        entity = "'lig 1'" if spaced_value and record == 'HETATM' else ('1' if record == 'ATOM' else '2')
+        atom_id = f'"{name}"' if "'" in name else name
+        lines.append(f"{record} {serial} {element} {atom_id} . {resname} {chain} {entity} {resnum} ? "
+                     f"{x:.3f} {y:.3f} {z:.3f} 1.00 {b:.2f} {resnum} {chain} 1")
+    path.write_text("\n".join(lines + ["#"]) + "\n")
+
+
+def biopython_atoms(structure):
+    model = next(iter(structure))
+    return [(atom.get_id(), atom.get_parent().get_resname(), atom.get_parent().get_parent().id,
+             atom.get_parent().id[1], atom.get_parent().id[0] != ' ', atom.coord, atom.bfactor, atom.element)
+            for atom in model.get_atoms()]
+
+
+def assert_matches_biopython(atoms, reference):
+    assert len(atoms) == len(reference)
+    assert list(atoms['name']) == [r[0] for r in reference]
+    assert list(atoms['resname']) == [r[1] for r in reference]
+    assert list(atoms['chain']) == [r[2] for r in reference]
+    assert list(atoms['resnum']) == [r[3] for r in reference]
+    assert list(atoms['record'] == 'HETATM') == [r[4] for r in reference]
+    np.testing.assert_allclose(atoms['coord'], np.array([r[5] for r in reference]), atol=1e-3)
+    np.testing.assert_allclose(atoms['bfactor'], [r[6] for r in reference], atol=1e-3)
+    assert list(atoms['element']) == [r[7] for r in reference]
+
+
+def test_read_pdb_atoms_matches_biopython(tmp_path):
+    path = tmp_path / "sample_model_0.pdb"
+    write_pdb(path)
+    atoms = read_pdb_atoms(str(path))
+    assert_matches_biopython(atoms, biopython_atoms(PDB.PDBParser(QUIET=True).get_structure("s", str(path))))
+    assert "C1'" in atoms['name']
+
+
+@pytest.mark.parametrize("spaced_value", [False, True])
+def test_read_cif_atoms_matches_biopython(tmp_path, spaced_value):
+    path = tmp_path / "sample_model_0.cif"
+    write_cif(path, spaced_value)
+    atoms = read_cif_atoms(str(path))
+    assert_matches_biopython(atoms, biopython_atoms(PDB.MMCIFParser(QUIET=True).get_structure("s", str(path))))
+    assert list(atoms['name'][-4:]) == ["C1'", "C2'", "O5'", 'N1']
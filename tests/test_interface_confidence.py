@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Row reads of batch_interfaceConfidence.py from stored and compressed .npz members against a full load."""
+import numpy as np
+import pytest
+
+import batch_interfaceConfidence
+from batch_interfaceConfidence import interface_values, read_npz_rows
+
+ROWS = [211, 0, 57, 299, 58, 3]
+
+
+def write_npz(path, compressed, matrix, key="pae"):
+    (np.savez_compressed if compressed else np.savez)(path, **{key: matrix, "other": np.arange(5)})
+    return str(path)
+
+
+@pytest.fixture(params=[False, True], ids=["stored", "compressed"])
+def compressed(request):
+    return request.param
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_rows_match_full_load(tmp_path, monkeypatch, compressed, dtype):
+    matrix = np.random.default_rng(0).uniform(0, 30, (300, 300)).astype(dtype)
+    path = write_npz(tmp_path / "pae_P_DOP_model_0.npz", compressed, matrix)
+    with np.load(path) as npz:
+        full = npz["pae"]
+
+    # C-ordered members are read without loading the whole matrix
+    monkeypatch.setattr(batch_interfaceConfidence.np, "load", None)
+    block, shape = read_npz_rows(path, "pae", ROWS)
+    assert shape == (300, 300)
+    assert block.dtype == dtype
+    np.testing.assert_array_equal(block, full[ROWS])
+    assert read_npz_rows(path, "pae", [])[0].shape == (0, 300)
+
+
+def test_fortran_ordered_member_falls_back_to_full_load(tmp_path, compressed):
+    matrix = np.asfortranarray(np.random.default_rng(1).uniform(size=(40, 30)))
+    path = write_npz(tmp_path / "pde_P_DOP_model_0.npz", compressed, matrix, key="pde")
+    block, shape = read_npz_rows(path, "pde", [5, 2, 39])
+    assert shape == (40, 30)
+    np.testing.assert_array_equal(block, matrix[[5, 2, 39]])
+
+
+def test_out_of_range_rows_and_missing_keys(tmp_path, compressed):
+    path = write_npz(tmp_path / "pae.npz", compressed, np.zeros((10, 10), dtype=np.float32))
+    with pytest.raises(ValueError, match="row 10"):
+        read_npz_rows(path, "pae", [2, 10])
+    with pytest.raises(KeyError):
+        read_npz_rows(path, "pde", [0])
+
+
+def test_interface_values_are_the_pocket_ligand_blocks(tmp_path, compressed):
+    matrix = np.random.default_rng(2).uniform(0, 30, (50, 50)).astype(np.float32)
+    path = write_npz(tmp_path / "pae.npz", compressed, matrix)
+    pocket, ligand = np.array([30, 4, 17]), np.array([45, 46, 47, 48, 49])
+    values = interface_values(path, "pae", pocket, ligand, 50)
+    expected = np.concatenate([matrix[np.ix_(pocket, ligand)].ravel(), matrix[np.ix_(ligand, pocket)].ravel()])
+    np.testing.assert_array_equal(values, expected.astype(np.float64))
+    assert interface_values(path, "pae", pocket, ligand, 60) is None
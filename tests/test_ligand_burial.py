@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Shrake-Rupley SASA of batch_ligandBurial.py against analytic sphere areas."""
+import numpy as np
+import pytest
+
+from batch_ligandBurial import PROBE_RADIUS, atom_sasa, sphere_points
+
+
+def test_sphere_points_are_unit_and_balanced():
+    points = sphere_points(500)
+    np.testing.assert_allclose(np.linalg.norm(points, axis=1), 1.0)
+    np.testing.assert_allclose(points.mean(axis=0), 0.0, atol=1e-2)
+
+
+@pytest.mark.parametrize("radius, probe", [(1.7, PROBE_RADIUS), (1.55, PROBE_RADIUS), (1.8, 0.0)])
+def test_isolated_atom_is_fully_exposed(radius, probe):
+    coords, radii = np.array([[3.0, -1.0, 2.0]]), np.array([radius])
+    sasa = atom_sasa(coords, radii, coords, radii, probe)
+    np.testing.assert_allclose(sasa, [4 * np.pi * (radius + probe) ** 2])
+
+
+def test_overlapping_pair_matches_spherical_caps():
+    """Each expanded sphere loses the cap inside the other one, of area 2 pi R h."""
+    coords = np.array([[0.0, 0.0, 0.0], [3.0, 0.0, 0.0]])
+    radii = np.array([1.7, 1.52])
+    sasa = atom_sasa(coords, radii, coords, radii, unit_points=sphere_points(4000))
+
+    d = 3.0
+    expanded = radii + PROBE_RADIUS
+    expected = []
+    for own, other in (expanded, expanded[::-1]):
+        cap_height = own - (d ** 2 + own ** 2 - other ** 2) / (2 * d)
+        expected.append(4 * np.pi * own ** 2 - 2 * np.pi * own * cap_height)
+    np.testing.assert_allclose(sasa, expected, rtol=5e-3)
+
+
+def test_buried_atom_has_no_surface():
+    # A small atom at the centre of a tight shell of neighbours
+    shell = 1.5 * np.vstack([np.eye(3), -np.eye(3)])
+    env_coords = np.vstack([[[0.0, 0.0, 0.0]], shell])
+    env_radii = np.full(len(env_coords), 1.7)
+    sasa = atom_sasa(env_coords[:1], env_radii[:1], env_coords, env_radii)
+    assert sasa[0] == 0.0
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Symmetry-aware pose RMSD and binding-mode clustering of batch_ligandPoses.py on p-xylene."""
+import numpy as np
+
+from batch_ligandPoses import bond_graph, ligand_automorphisms, pose_modes, pose_rmsd_matrix
+from fast_structure import ATOM_DTYPE
+
+# Ring carbons C1-C6, methyl carbons C7 (on C1) and C8 (on C4)
+ANGLES = np.deg2rad([0, 60, 120, 180, 240, 300])
+XYLENE = np.vstack([
+    np.column_stack([1.39 * np.cos(ANGLES), 1.39 * np.sin(ANGLES), np.zeros(6)]),
+    [[2.90, 0.0, 0.0], [-2.90, 0.0, 0.0]],
+])
+# The same molecule with its atoms named after a flip about the C7-C8 axis
+FLIP = [0, 5, 4, 3, 2, 1, 6, 7]
+
+
+def ligand(coords, plddt=80.0):
+    atoms = np.zeros(len(coords), dtype=ATOM_DTYPE)
+    atoms['record'], atoms['resname'], atoms['chain'], atoms['resnum'] = 'HETATM', 'LIG', 'B', 1
+    atoms['name'] = [f"C{i}" for i in range(1, len(coords) + 1)]
+    atoms['element'] = 'C'
+    atoms['coord'] = coords
+    atoms['bfactor'] = plddt
+    return atoms
+
+
+def xylene_automorphisms():
+    atoms = ligand(XYLENE)
+    return ligand_automorphisms(list(atoms['element']), bond_graph(atoms))
+
+
+def test_xylene_automorphisms():
+    adjacency = bond_graph(ligand(XYLENE))
+    assert adjacency.sum() == 2 * 8
+    perms = xylene_automorphisms()
+    # Identity, the two mirror flips and the 180 degree rotation of the ring
+    assert len(perms) == 4
+    assert perms[0].tolist() == list(range(8))
+    assert FLIP in perms.tolist()
+    for perm in perms:
+        np.testing.assert_array_equal(adjacency[np.ix_(perm, perm)], adjacency)
+
+
+def test_permuted_symmetric_ligand_has_zero_rmsd():
+    poses = np.stack([XYLENE, XYLENE[FLIP]])
+    plain = pose_rmsd_matrix(poses)
+    assert plain[0, 1] > 1.0
+    corrected = pose_rmsd_matrix(poses, xylene_automorphisms())
+    np.testing.assert_allclose(corrected, 0.0, atol=1e-6)
+
+
+def test_rmsd_matrix_matches_explicit_minimum():
+    rng = np.random.default_rng(0)
+    poses = np.stack([XYLENE[perm] + rng.normal(0, 0.3, XYLENE.shape) for perm in [list(range(8)), FLIP] * 3])
+    perms = xylene_automorphisms()
+    rmsd = pose_rmsd_matrix(poses, perms)
+    np.testing.assert_array_equal(rmsd, rmsd.T)
+    for i in range(len(poses)):
+        for j in range(len(poses)):
+            expected = 0.0 if i == j else min(
+                np.sqrt(np.mean(np.sum((poses[i] - poses[j][perm]) ** 2, axis=1))) for perm in perms)
+            np.testing.assert_allclose(rmsd[i, j], expected, atol=1e-6)
+
+
+def test_relabelled_poses_share_a_binding_mode():
+    rng = np.random.default_rng(1)
+    shifted = XYLENE + [0.0, 0.0, 6.0]
+    # Models 0-3 bind at the origin (half of them with flipped atom names), models 4-5 six Angstrom above
+    coords = [XYLENE, XYLENE[FLIP], XYLENE, XYLENE[FLIP], shifted, shifted[FLIP]]
+    ligands = [ligand(c + rng.normal(0, 0.1, c.shape), plddt=90.0 if i < 4 else 60.0) for i, c in enumerate(coords)]
+    modes, rmsd = pose_modes(ligands, [str(i) for i in range(6)])
+
+    assert [mode['members'] for mode in modes] == ["0;1;2;3", "4;5"]
+    assert modes[0]['occupancy'] == 4 / 6
+    assert modes[0]['pLDDT_avg'] == 0.9 and modes[1]['pLDDT_avg'] == 0.6
+    assert modes[0]['intra_RMSD_avg'] < 0.5
+    assert rmsd.shape == (6, 6)
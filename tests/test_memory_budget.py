@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""--max-memory plans of memory_budget.py sized against the budget."""
+import pytest
+
+from memory_budget import BASELINE_BYTES, DEFAULT_MC_POINTS, distance_map_bytes, parse_memory_size, plan_memory
+
+MiB = 1024 ** 2
+# A 400-residue receptor with a 10-atom ligand and 25 models per folder
+DIMS = {'residues': 400, 'ligand_atoms': 10, 'models': 25, 'tokens': 410, 'folders': 100}
+
+
+def peak_bytes(plan):
+    return plan['workers'] * max(plan['stage_bytes'].values()) + BASELINE_BYTES
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("8G", 8 * 1024 ** 3), ("512M", 512 * MiB), ("1.5GB", int(1.5 * 1024 ** 3)), ("2gib", 2 * 1024 ** 3),
+    ("64K", 64 * 1024), ("1048576", MiB),
+])
+def test_parse_memory_size(text, expected):
+    assert parse_memory_size(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "lots", "8X", "-1G"])
+def test_parse_memory_size_rejects(text):
+    with pytest.raises(ValueError):
+        parse_memory_size(text)
+
+
+def test_generous_budget_keeps_full_precision_and_sizes():
+    plan = plan_memory(64 * 1024 ** 3, DIMS, workers=4)
+    assert plan['fits'] and plan['workers'] == 4
+    assert plan['dist_dtype'] == 'float64'
+    assert plan['variance_chunk'] == DIMS['residues'] ** 2
+    assert plan['mc_chunk_points'] == DEFAULT_MC_POINTS
+    assert peak_bytes(plan) <= plan['max_memory']
+
+
+def test_tight_budget_falls_back_to_float32():
+    # The float64 distance maps alone exceed what is left after the baseline
+    max_memory = BASELINE_BYTES + 100 * MiB
+    assert distance_map_bytes(DIMS, 8) > 100 * MiB > distance_map_bytes(DIMS, 4)
+    plan = plan_memory(max_memory, DIMS, workers=1)
+    assert plan['fits'] and plan['dist_dtype'] == 'float32'
+    assert plan['variance_chunk'] < DIMS['residues'] ** 2
+    assert plan['mc_chunk_points'] < DEFAULT_MC_POINTS
+    assert peak_bytes(plan) <= max_memory
+
+
+def test_workers_are_lowered_to_fit():
+    max_memory = BASELINE_BYTES + 300 * MiB
+    plan = plan_memory(max_memory, DIMS, workers=16)
+    assert plan['fits'] and 1 <= plan['workers'] < 16
+    assert peak_bytes(plan) <= max_memory
+    assert plan_memory(max_memory, DIMS, workers=plan['workers'] + 1)['workers'] == plan['workers']
+
+
+@pytest.mark.parametrize("max_memory", [400 * MiB, 1024 * MiB, 3 * 1024 ** 3, 20 * 1024 ** 3])
+@pytest.mark.parametrize("n_boot", [0, 2000])
+def test_plans_that_fit_stay_within_budget(max_memory, n_boot):
+    plan = plan_memory(max_memory, DIMS, workers=8, n_boot=n_boot)
+    assert plan['fits']
+    assert peak_bytes(plan) <= max_memory
+
+
+def test_bootstrap_counts_add_to_the_distance_stage():
+    plain = plan_memory(64 * 1024 ** 3, DIMS, workers=1)
+    with_boot = plan_memory(64 * 1024 ** 3, DIMS, workers=1, n_boot=1000)
+    assert with_boot['stage_bytes']['distance_maps'] - plain['stage_bytes']['distance_maps'] == 2 * 1000 * 25 * 8
+
+
+def test_budget_below_baseline_uses_smallest_plan():
+    plan = plan_memory(200 * MiB, DIMS, workers=8)
+    assert not plan['fits']
+    assert plan['workers'] == 1 and plan['dist_dtype'] == 'float32'
+    assert plan['variance_chunk'] == DIMS['residues']
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Confidence ranking, top-k and threshold selection of model_filter.py."""
+import json
+
+import pytest
+
+from model_filter import describe_filter, model_label, select_models
+
+# model index -> confidence_<stem>.json; model 4 has no confidence file
+CONFIDENCES = {
+    0: {'confidence_score': 0.62, 'complex_pde': 1.10},
+    1: {'confidence_score': 0.91, 'complex_pde': 0.40},
+    2: {'confidence_score': 0.55, 'complex_pde': 1.90},
+    3: {'confidence_score': 0.78, 'complex_pde': 0.75},
+    10: {'confidence_score': 0.84, 'complex_pde': 0.60},
+}
+STRUCTURE_FILES = [f"P_DOP_model_{i}.pdb" for i in (0, 1, 2, 3, 4, 10)]
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for i, scores in CONFIDENCES.items():
+        (tmp_path / f"confidence_P_DOP_model_{i}.json").write_text(json.dumps(scores))
+    return str(tmp_path)
+
+
+def used(folder, model_filter):
+    return select_models(folder, STRUCTURE_FILES, model_filter)[1]['models_used']
+
+
+def test_no_filter_keeps_every_model(folder):
+    selected, selection = select_models(folder, STRUCTURE_FILES, None)
+    assert selected == STRUCTURE_FILES
+    assert selection == {'models_used': '0;1;2;3;4;10', 'model_selection': 'all'}
+
+
+def test_top_k_keeps_best_ranked_models(folder):
+    selected, _ = select_models(folder, STRUCTURE_FILES, {'metric': 'confidence_score', 'top_k': 3, 'threshold': None})
+    assert selected == ["P_DOP_model_1.pdb", "P_DOP_model_3.pdb", "P_DOP_model_10.pdb"]
+    assert used(folder, {'metric': 'confidence_score', 'top_k': 3, 'threshold': None}) == '1;3;10'
+    # complex_pde is lower-is-better
+    assert used(folder, {'metric': 'complex_pde', 'top_k': 2, 'threshold': None}) == '1;10'
+
+
+def test_threshold(folder):
+    assert used(folder, {'metric': 'confidence_score', 'top_k': None, 'threshold': 0.78}) == '1;3;10'
+    assert used(folder, {'metric': 'complex_pde', 'top_k': None, 'threshold': 1.10}) == '0;1;3;10'
+    assert used(folder, {'metric': 'confidence_score', 'top_k': None, 'threshold': 0.95}) == ''
+
+
+def test_threshold_then_top_k(folder):
+    model_filter = {'metric': 'confidence_score', 'top_k': 2, 'threshold': 0.6}
+    assert used(folder, model_filter) == '1;10'
+    assert describe_filter(model_filter) == 'confidence_score>=0.6 & confidence_score top2'
+    assert describe_filter({'metric': 'complex_pde', 'top_k': None, 'threshold': 1.1}) == 'complex_pde<=1.1'
+
+
+def test_model_label():
+    assert model_label('P_DOP_model_12') == '12'
+    assert model_label('reference') == 'reference'
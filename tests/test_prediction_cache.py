@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Prediction keys and ingest/materialize round trips of the content-addressed store."""
+import os
+
+import pytest
+
+from prediction_cache import (
+    ingest_predictions, is_cached, materialize, prediction_key, read_manifest, store_path, write_manifest
+)
+
+SEQUENCE = "MKTAYIAKQRQISFVKSHFSRQ"
+SMILES = "NCCc1ccc(O)c(O)c1"
+
+
+def write_prediction(predictions_dir, name, num_models=2):
+    """A Boltz-style folder whose files carry the folder name; contents record which file is which."""
+    folder = predictions_dir / name
+    folder.mkdir(parents=True)
+    for i in range(num_models):
+        stem = f"{name}_model_{i}"
+        for file_name in (f"{stem}.pdb", f"confidence_{stem}.json", f"pae_{stem}.npz"):
+            (folder / file_name).write_text(f"{file_name}\n")
+    (folder / f"affinity_{name}.json").write_text(f"affinity_{name}.json\n")
+    return folder
+
+
+def test_key_ignores_sequence_formatting():
+    key = prediction_key(SEQUENCE, SMILES, 25, 10)
+    assert len(key) == 64
+    assert prediction_key(SEQUENCE.lower(), SMILES, 25, 10) == key
+    assert prediction_key(f" {SEQUENCE[:10]}\n{SEQUENCE[10:]} ", f"{SMILES}\n", 25, 10) == key
+    assert prediction_key(SEQUENCE, SMILES, 25, 10, msa_server_url="https://api.colabfold.com/") == key
+
+
+@pytest.mark.parametrize("change", [
+    dict(sequence=SEQUENCE[:-1] + "A"), dict(smiles="NCCc1c[nH]c2ccc(O)cc12"), dict(num_models=5),
+    dict(recycles=3), dict(use_potentials=False), dict(output_format="mmcif"),
+    dict(msa_server_url="http://localhost:8080"), dict(msa_pairing_strategy="complete"),
+])
+def test_key_changes_with_every_setting(change):
+    settings = dict(sequence=SEQUENCE, smiles=SMILES, num_models=25, recycles=10)
+    assert prediction_key(**{**settings, **change}) != prediction_key(**settings)
+
+
+@pytest.mark.parametrize("ingest_mode, materialize_mode", [("hardlink", "symlink"), ("copy", "copy")])
+def test_ingest_then_materialize_under_another_name(tmp_path, ingest_mode, materialize_mode):
+    store, manifest = tmp_path / "store", tmp_path / "yamls_cache_manifest.csv"
+    key = prediction_key(SEQUENCE, SMILES, 2, 10)
+    other_key = prediction_key(SEQUENCE, SMILES, 2, 3)
+    # V1_DOP was predicted; V7_DOP is the same job requested under another Tag
+    write_manifest([{'name': 'V1_DOP', 'key': key, 'status': 'predict'},
+                    {'name': 'V7_DOP', 'key': key, 'status': 'duplicate'},
+                    {'name': 'V2_DOP', 'key': other_key, 'status': 'predict'}], str(manifest))
+    source = write_prediction(tmp_path / "predictions", "V1_DOP")
+
+    added, missing = ingest_predictions(str(manifest), str(tmp_path / "predictions"), str(store), ingest_mode)
+    assert (added, missing) == (1, ["V2_DOP"])
+    assert is_cached(str(store), key) and not is_cached(str(store), other_key)
+    assert sorted(os.listdir(store_path(str(store), key))) == sorted(os.listdir(source) + ["meta.json"])
+    # Already stored entries are not ingested again
+    assert ingest_predictions(str(manifest), str(tmp_path / "predictions"), str(store), ingest_mode) == (0, ["V2_DOP"])
+
+    done, missing = materialize(str(manifest), str(store), str(tmp_path / "materialized"), materialize_mode)
+    assert (done, missing) == (2, ["V2_DOP"])
+    for name in ("V1_DOP", "V7_DOP"):
+        folder = tmp_path / "materialized" / name
+        expected = sorted(f.replace("V1_DOP", name, 1) for f in os.listdir(source))
+        assert sorted(os.listdir(folder)) == expected
+        assert (folder / f"confidence_{name}_model_1.json").read_text() == "confidence_V1_DOP_model_1.json\n"
+        assert (folder / f"affinity_{name}.json").read_text() == "affinity_V1_DOP.json\n"
+        assert os.path.islink(folder / f"{name}_model_0.pdb") == (materialize_mode == "symlink")
+
+
+def test_manifest_round_trip(tmp_path):
+    rows = [{'name': 'P_DOP', 'key': 'ab' * 32, 'status': 'cached'}]
+    write_manifest(rows, str(tmp_path / "manifest.csv"))
+    assert read_manifest(str(tmp_path / "manifest.csv")) == rows
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Dependency order, stamp-based skipping and failure handling of run_pipeline.py on in-process stages."""
+import os
+
+import pytest
+
+from run_pipeline import make_stage, run_pipeline
+
+
+def diamond(tmp_path, calls, fail=()):
+    """yamls -> {volume, variance} -> merge, every stage writing one file under out/ (created by the runner)."""
+    source = tmp_path / "library.csv"
+    if not source.exists():
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        source.write_text("Tag,sequence\nP,MKT\n")
+    out = tmp_path / "out"
+
+    def step(name):
+        def run():
+            calls.append(name)
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            (out / name).write_text(name)
+        return run
+
+    return [
+        make_stage("L:yamls", [str(source)], [str(out / "yamls")], func=step("yamls")),
+        make_stage("L:volume", [], [str(out / "volume")], after=["L:yamls"], func=step("volume")),
+        make_stage("L:variance", [], [str(out / "variance")], after=["L:yamls"], func=step("variance")),
+        make_stage("L:merge", [], [str(out / "merge")], after=["L:volume", "L:variance"], func=step("merge")),
+    ]
+
+
+def statuses(report):
+    return {name: status for name, (status, _, _) in report.items()}
+
+
+def test_stages_run_in_dependency_order(tmp_path):
+    calls = []
+    report = run_pipeline(diamond(tmp_path, calls), str(tmp_path), workers=4)
+    assert set(statuses(report).values()) == {'done'}
+    assert calls[0] == "yamls" and calls[-1] == "merge"
+    assert sorted(calls[1:3]) == ["variance", "volume"]
+    assert os.path.exists(tmp_path / "pipeline_stamps" / "L__merge.done")
+
+
+def test_second_run_skips_and_changed_input_reruns_downstream(tmp_path):
+    calls = []
+    run_pipeline(diamond(tmp_path, calls), str(tmp_path))
+    calls.clear()
+    report = run_pipeline(diamond(tmp_path, calls), str(tmp_path))
+    assert calls == []
+    assert set(statuses(report).values()) == {'skipped'}
+
+    # An input newer than the stamp reruns its stage and everything below it
+    stamp = tmp_path / "pipeline_stamps" / "L__yamls.done"
+    input_time = os.path.getmtime(tmp_path / "library.csv")
+    os.utime(stamp, (input_time - 10, input_time - 10))
+    report = run_pipeline(diamond(tmp_path, calls), str(tmp_path))
+    assert sorted(calls) == ["merge", "variance", "volume", "yamls"]
+    assert set(statuses(report).values()) == {'done'}
+
+    # A deleted output reruns only the stages from there down
+    calls.clear()
+    os.remove(tmp_path / "out" / "variance")
+    report = run_pipeline(diamond(tmp_path, calls), str(tmp_path))
+    assert calls == ["variance", "merge"]
+    assert statuses(report) == {'L:yamls': 'skipped', 'L:volume': 'skipped', 'L:variance': 'done', 'L:merge': 'done'}
+
+
+def test_force_and_dry_run(tmp_path):
+    calls = []
+    run_pipeline(diamond(tmp_path, calls), str(tmp_path))
+    calls.clear()
+    run_pipeline(diamond(tmp_path, calls), str(tmp_path), force=True)
+    assert sorted(calls) == ["merge", "variance", "volume", "yamls"]
+
+    calls.clear()
+    report = run_pipeline(diamond(tmp_path / "fresh", calls), str(tmp_path / "fresh"), dry_run=True)
+    assert calls == []
+    assert set(statuses(report).values()) == {'planned'}
+
+
+def test_failure_blocks_downstream_and_is_retried(tmp_path):
+    calls = []
+    report = run_pipeline(diamond(tmp_path, calls, fail=("volume",)), str(tmp_path), workers=1)
+    assert report['L:volume'][0] == 'failed' and "volume broke" in report['L:volume'][2]
+    assert report['L:merge'][0] == 'blocked'
+    assert "merge" not in calls
+    assert not os.path.exists(tmp_path / "pipeline_stamps" / "L__volume.done")
+
+    calls.clear()
+    report = run_pipeline(diamond(tmp_path, calls), str(tmp_path))
+    assert report['L:yamls'][0] == 'skipped'
+    assert {"volume", "merge"} <= set(calls) and "yamls" not in calls
+    assert report['L:merge'][0] == 'done'
+
+
+def test_missing_output_fails_the_stage(tmp_path):
+    stage = make_stage("L:quiet", [], [str(tmp_path / "never_written.csv")], func=lambda: None)
+    report = run_pipeline([stage], str(tmp_path))
+    assert report['L:quiet'][0] == 'failed'
+    assert "outputs not written" in report['L:quiet'][2]
+
+
+def test_dependency_errors(tmp_path):
+    with pytest.raises(ValueError, match="unknown stages"):
+        run_pipeline([make_stage("a", [], [], after=["b"], func=lambda: None)], str(tmp_path))
+    cycle = [make_stage("a", [], [], after=["b"], func=lambda: None),
+             make_stage("b", [], [], after=["a"], func=lambda: None)]
+    with pytest.raises(ValueError, match="cycle"):
+        run_pipeline(cycle, str(tmp_path))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""crc32 Tag sharding and reducing --shard partials back into the unsharded output."""
+import json
+import zlib
+
+import pytest
+
+from getAffinities import extract_affinity_values
+from reduce_shards import reduce_output
+from sharding import parse_shard, select_shard, shard_of, shard_output_path
+
+TAGS = [f"V{i}_{ligand}" for i in range(40) for ligand in ("DOP", "5HT")]
+
+
+def write_affinity_folders(input_dir, tags):
+    for i, tag in enumerate(tags):
+        folder = input_dir / tag
+        folder.mkdir(parents=True)
+        (folder / f"affinity_{tag}.json").write_text(json.dumps(
+            {"affinity_pred_value": 0.25 * i - 3.0, "affinity_probability_binary": (i % 7) / 7}))
+
+
+def test_parse_shard():
+    assert parse_shard(None) is None
+    assert parse_shard("") is None
+    assert parse_shard("3/16") == (3, 16)
+    for spec in ("3", "a/4", "4/4", "-1/4", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_shards_partition_tags_by_crc32():
+    assert shard_of("P_DOP", 8) == zlib.crc32(b"P_DOP") % 8
+    shards = [select_shard(TAGS, (i, 8)) for i in range(8)]
+    assert sorted(tag for shard in shards for tag in shard) == sorted(TAGS)
+    # The assignment of a Tag does not depend on the other Tags or their order
+    assert select_shard(list(reversed(TAGS)), (5, 8)) == list(reversed(shards[5]))
+    assert select_shard(TAGS[:3], (5, 8)) == [tag for tag in TAGS[:3] if tag in shards[5]]
+    assert select_shard(TAGS, None) == TAGS
+
+
+def test_shard_output_path():
+    assert shard_output_path("out/openess.csv", None) == "out/openess.csv"
+    assert shard_output_path("out/openess.csv", (2, 8)) == "out/openess.shard-2-of-8.csv"
+
+
+def test_reduced_shards_match_unsharded_run(tmp_path):
+    write_affinity_folders(tmp_path / "predictions", TAGS)
+    extract_affinity_values(str(tmp_path / "predictions"), str(tmp_path / "full" / "affinities.csv"))
+    for i in range(4):
+        extract_affinity_values(str(tmp_path / "predictions"), str(tmp_path / "sharded" / "affinities.csv"), (i, 4))
+
+    final_path = reduce_output(str(tmp_path / "sharded"), "affinities.csv", 4)
+    assert (tmp_path / "sharded" / "affinities.csv").read_text() == (tmp_path / "full" / "affinities.csv").read_text()
+    assert final_path == str(tmp_path / "sharded" / "affinities.csv")
+
+
+def test_reduce_rejects_missing_and_duplicated_shards(tmp_path):
+    write_affinity_folders(tmp_path / "predictions", TAGS)
+    for i in range(3):
+        extract_affinity_values(str(tmp_path / "predictions"), str(tmp_path / "affinities.csv"), (i, 4))
+    with pytest.raises(ValueError, match="missing shards"):
+        reduce_output(str(tmp_path), "affinities.csv", 4)
+
+    # A Tag written by two shards, e.g. after re-running one shard with a different N
+    extract_affinity_values(str(tmp_path / "predictions"), str(tmp_path / "affinities.csv"), (3, 4))
+    partial = tmp_path / "affinities.shard-3-of-4.csv"
+    first_row = (tmp_path / "affinities.shard-0-of-4.csv").read_text().splitlines()[1]
+    partial.write_text(partial.read_text() + first_row + "\n")
+    with pytest.raises(ValueError, match="appears in shards"):
+        reduce_output(str(tmp_path), "affinities.csv", 4)
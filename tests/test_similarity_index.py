@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""k nearest neighbours of the random-projection and PCA similarity indexes on synthetic ensembles."""
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from similarity_index import (
+    build_index, ensemble_map_features, index_vectors, load_index, nearest_neighbors, save_index, update_index
+)
+
+N_RESIDUES = 20
+N_MODELS = 3
+
+
+def write_ca_pdb(path, coords):
+    lines = [f"ATOM  {i:>5}  CA  ALA A{i:>4}    {x:>8.3f}{y:>8.3f}{z:>8.3f}  1.00 80.00           C"
+             for i, (x, y, z) in enumerate(coords, 1)]
+    path.write_text("\n".join(lines + ["END"]) + "\n")
+
+
+def write_variant(input_dir, tag, backbone, rng, model_noise=0.2):
+    folder = input_dir / tag
+    folder.mkdir(parents=True)
+    for m in range(N_MODELS):
+        write_ca_pdb(folder / f"{tag}_model_{m}.pdb", backbone + rng.normal(0, model_noise, backbone.shape))
+
+
+@pytest.fixture
+def library(tmp_path):
+    """Two construct families of three variants each, plus a near copy of A0."""
+    rng = np.random.default_rng(0)
+    input_dir = tmp_path / "predictions"
+    backbones = {}
+    for family in ("A", "B"):
+        parent = np.cumsum(rng.normal(0, 2.0, (N_RESIDUES, 3)), axis=0)
+        for i in range(3):
+            backbones[f"{family}{i}"] = parent + rng.normal(0, 1.0, parent.shape)
+    backbones["A0_twin"] = backbones["A0"] + rng.normal(0, 0.05, (N_RESIDUES, 3))
+    for tag, backbone in backbones.items():
+        write_variant(input_dir, tag, backbone, rng)
+    (tmp_path / "analysis").mkdir()
+    return input_dir, tmp_path / "analysis"
+
+
+def neighbors_of(rows, tag):
+    return [neighbor for query, _, neighbor, _ in rows if query == tag]
+
+
+@pytest.mark.parametrize("method", ["random", "pca"])
+def test_nearest_neighbors_find_closest_variants(library, method):
+    input_dir, analysis_dir = library
+    index = build_index(str(input_dir), str(analysis_dir), method=method, n_components=16, seed=1)
+    rows = nearest_neighbors(index, k=3)
+
+    assert neighbors_of(rows, "A0")[0] == "A0_twin"
+    assert neighbors_of(rows, "A0_twin")[0] == "A0"
+    for tag in ("B0", "B1", "B2"):
+        assert all(neighbor.startswith("B") for neighbor in neighbors_of(rows, tag)[:2])
+
+    # Same neighbours and distances as a brute-force search over the index vectors
+    vectors = index_vectors(index)
+    tags = index['tags'].tolist()
+    distances = cdist(vectors, vectors)
+    for tag in tags:
+        q = tags.index(tag)
+        order = [j for j in np.argsort(distances[q], kind="stable") if j != q][:3]
+        hits = [(neighbor, d) for query, _, neighbor, d in rows if query == tag]
+        assert [neighbor for neighbor, _ in hits] == [tags[j] for j in order]
+        np.testing.assert_allclose([d for _, d in hits], distances[q, order], rtol=1e-5)
+
+
+def test_full_rank_pca_preserves_map_distances(library):
+    input_dir, analysis_dir = library
+    index = build_index(str(input_dir), str(analysis_dir), method="pca", n_components=32)
+    tags = index['tags'].tolist()
+    maps = np.stack([ensemble_map_features(str(input_dir / tag)) for tag in tags]).astype(np.float64)
+    assert int(index['n_components']) == len(tags) - 1
+    np.testing.assert_allclose(cdist(index['embeddings'], index['embeddings']), cdist(maps, maps),
+                               rtol=1e-3, atol=1e-3)
+
+
+@pytest.mark.parametrize("method", ["random", "pca"])
+def test_update_keeps_existing_vectors(library, tmp_path, method):
+    input_dir, analysis_dir = library
+    twin = tmp_path / "A0_twin"
+    (input_dir / "A0_twin").rename(twin)
+    index = build_index(str(input_dir), str(analysis_dir), method=method, n_components=4, seed=1)
+    path = str(tmp_path / "index.npz")
+    save_index(index, path)
+
+    twin.rename(input_dir / "A0_twin")
+    updated = update_index(load_index(path), str(input_dir), str(analysis_dir))
+    assert updated['tags'].tolist() == index['tags'].tolist() + ["A0_twin"]
+    np.testing.assert_array_equal(updated['embeddings'][:-1], index['embeddings'])
+    assert neighbors_of(nearest_neighbors(updated, ["A0_twin"], k=1), "A0_twin") == ["A0"]
+
+    with pytest.raises(ValueError, match="model filter"):
+        update_index(updated, str(input_dir), str(analysis_dir),
+                     {'metric': 'confidence_score', 'top_k': 2, 'threshold': None})
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Done manifest, row dedup and resume behaviour of watch_predictions.py."""
+import csv
+import os
+
+import watch_predictions
+from watch_predictions import AFFINITY_FIELDS, analyzed_tags, append_row, mark_analyzed
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def write_complete_folder(predictions_dir, tag, num_models=2):
+    folder = predictions_dir / tag
+    folder.mkdir(parents=True)
+    for i in range(num_models):
+        (folder / f"{tag}_model_{i}.pdb").write_text("END\n")
+        (folder / f"confidence_{tag}_model_{i}.json").write_text("{}")
+    (folder / f"affinity_{tag}.json").write_text("{}")
+
+
+def test_append_row_skips_existing_tags(tmp_path):
+    path = tmp_path / "affinities.csv"
+    append_row(str(path), AFFINITY_FIELDS, {"Tag": "P_DOP", "affinity_pred_value": 1.5})
+    append_row(str(path), AFFINITY_FIELDS, {"Tag": "V1_DOP", "affinity_pred_value": -0.5})
+    # A folder redone after an interrupted run only adds its missing rows
+    append_row(str(path), AFFINITY_FIELDS, {"Tag": "P_DOP", "affinity_pred_value": 9.0})
+
+    rows = read_rows(path)
+    assert [row["Tag"] for row in rows] == ["P_DOP", "V1_DOP"]
+    assert rows[0]["affinity_pred_value"] == "1.5"
+    assert rows[0]["affinity_probability_binary"] == ""
+    assert path.read_text().count("Tag,") == 1
+
+
+def test_done_manifest_round_trip(tmp_path):
+    assert analyzed_tags(str(tmp_path)) == set()
+    mark_analyzed(str(tmp_path), "P_DOP")
+    mark_analyzed(str(tmp_path), "V1_5HT")
+    assert analyzed_tags(str(tmp_path)) == {"P_DOP", "V1_5HT"}
+
+
+def test_watch_resumes_from_manifest_and_returns_failed(tmp_path, monkeypatch):
+    predictions_dir, output_dir = tmp_path / "predictions", tmp_path / "analysis"
+    targets = ["P_DOP", "V1_DOP", "V2_DOP"]
+    for tag in targets:
+        write_complete_folder(predictions_dir, tag)
+
+    analyzed = []
+
+    def fake_analyze_folder(folder, output_dir, *args):
+        tag = os.path.basename(folder)
+        analyzed.append(tag)
+        if tag == "V1_DOP":
+            raise ValueError("no ligand atoms")
+        append_row(os.path.join(output_dir, "affinities.csv"), AFFINITY_FIELDS, {"Tag": tag})
+
+    monkeypatch.setattr(watch_predictions, "analyze_folder", fake_analyze_folder)
+    output_dir.mkdir()
+    mark_analyzed(str(output_dir), "P_DOP")
+
+    not_done = watch_predictions.watch_predictions(str(predictions_dir), str(output_dir), targets, 2,
+                                                   poll_interval=0, settle_time=0, timeout=0)
+    assert analyzed == ["V1_DOP", "V2_DOP"]
+    assert not_done == ["V1_DOP"]
+    assert analyzed_tags(str(output_dir)) == {"P_DOP", "V2_DOP"}
+
+    # A restarted watcher retries only the failed target
+    analyzed.clear()
+    watch_predictions.watch_predictions(str(predictions_dir), str(output_dir), targets, 2,
+                                        poll_interval=0, settle_time=0, timeout=0)
+    assert analyzed == ["V1_DOP"]
+    assert [row["Tag"] for row in read_rows(output_dir / "affinities.csv")] == ["V2_DOP"]
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import time
+import argparse
+import numpy as np
+
+from batch_LigOverlapVol import (
+    BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, SUMMARY_FIELDS, VAN_DER_WAALS_RADII,
+    process_pdb_files_in_subfolder, write_individual_results_to_csv
+)
+from batch_distanceMaps_variance import COMPOSITE_VARIANCE_FIELDS, process_folder
+from getAffinities import extract_folder_affinity
+from getOpenessDistances import folder_openess_distances
+from fast_structure import is_structure_file
+from model_filter import SELECTION_FIELDS, add_model_filter_arguments, model_filter_from_args
+from memory_budget import add_memory_arguments, estimate_dimensions, log_plan, parse_memory_size, plan_memory
+
+DONE_MANIFEST = "watch_done.txt"
+AFFINITY_FIELDS = ["Tag", "affinity_pred_value", "affinity_probability_binary"]
+OPENESS_FIELDS = ["Tag", "openess_avg", "openess_min", "openess_max", "openess_range"] + SELECTION_FIELDS
+
+
+def load_targets(targets_path, ligands=None):
+    """
+    Expected prediction folder names, from either a folder of Boltz input YAMLs
+    (one folder per YAML stem), a library CSV with a Tag column (expanded with
+    _<ligand> suffixes like csv2yamls_w_molecules.py), or a text file with one
+    folder name per line.
+    """
+    if os.path.isdir(targets_path):
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(targets_path) if f.endswith(('.yaml', '.yml')))
+
+    with open(targets_path, newline='', encoding='utf-8') as f:
+        first_line = f.readline()
+        f.seek(0)
+        if 'Tag' in next(csv.reader([first_line]), []):
+            tags = [row['Tag'].replace(' ', '_') for row in csv.DictReader(f) if row.get('Tag')]
+        else:
+            tags = [line.strip() for line in f if line.strip()]
+    if ligands:
+        tags = [f"{tag}_{ligand}" for tag in tags for ligand in ligands]
+    return sorted(tags)
+
+
+def folder_is_complete(folder, num_models, require_affinity=True, require_pae=False):
+    """True once the folder holds every model, its confidence file (and optional PAE/PDE/affinity files)."""
+    files = os.listdir(folder)
+    n_structures = sum(is_structure_file(f) for f in files)
+    n_confidence = sum(f.startswith('confidence_') and f.endswith('.json') for f in files)
+    if n_structures < num_models or n_confidence < num_models:
+        return False
+    if require_pae:
+        n_pae = sum(f.startswith('pae_') and f.endswith('.npz') for f in files)
+        n_pde = sum(f.startswith('pde_') and f.endswith('.npz') for f in files)
+        if n_pae < num_models or n_pde < num_models:
+            return False
+    if require_affinity and not any(f.startswith('affinity_') and f.endswith('.json') for f in files):
+        return False
+    return True
+
+
+def folder_last_modified(folder):
+    return max([os.path.getmtime(folder)] + [os.path.getmtime(os.path.join(folder, f)) for f in os.listdir(folder)])
+
+
+def csv_tags(csv_path):
+    if not os.path.exists(csv_path):
+        return set()
+    with open(csv_path, newline='') as f:
+        return {row['Tag'] for row in csv.DictReader(f)}
+
+
+def append_row(csv_path, fieldnames, row):
+    """Appends one row, writing the header first if the file is new. A Tag already in the file is not appended again."""
+    if row['Tag'] in csv_tags(csv_path):
+        return
+    new_file = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+    with open(csv_path, 'a', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, restval='')
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def analyzed_tags(output_dir):
+    """Tags recorded in the done manifest, so a restarted watcher resumes where it stopped."""
+    path = os.path.join(output_dir, DONE_MANIFEST)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def mark_analyzed(output_dir, tag):
+    """Records `tag` in the done manifest once all of its rows are written."""
+    with open(os.path.join(output_dir, DONE_MANIFEST), 'a') as f:
+        f.write(tag + "\n")
+
+
+def analyze_folder(folder, output_dir, res1, res2, chain_id, model_filter=None, memory_plan=None):
+    """Runs the four analysis.sh analyzers on one completed folder and appends to their CSVs."""
+    tag = os.path.basename(folder)
+
+    (individual_results, pos_vol, neg_vol, raw_vol,
+     avg_plddt, min_plddt, max_plddt, _, selection) = process_pdb_files_in_subfolder(
+        folder, BINDING_POCKET_RESIDUES, LIGAND_RESIDUE_NAME, VAN_DER_WAALS_RADII, model_filter, memory_plan=memory_plan
+    )
+    write_individual_results_to_csv(individual_results, os.path.join(output_dir, f"{tag}_individual_ligand_analysis.csv"))
+
+    variance_row = process_folder(folder, output_dir, model_filter, memory_plan=memory_plan)
+
+    rec, _, err = extract_folder_affinity(folder)
+    if not rec:
+        print(f"[SKIP] affinity for {tag}: {err}")
+
+    distances, openess_selection = folder_openess_distances(folder, res1, res2, chain_id, model_filter)
+
+    # Rows are appended only after every analyzer finished; a folder interrupted while
+    # appending is redone on restart and only its missing rows are added
+    append_row(os.path.join(output_dir, "overall_folder_summary.csv"), SUMMARY_FIELDS, {
+        'Tag': tag, 'Folder_Path': folder, 'overlap_volume': raw_vol,
+        'overlap_w_pos_volume': pos_vol, 'overlap_w_neg_volume': neg_vol,
+        'ligand_pLDDT_avg': avg_plddt, 'ligand_pLDDT_min': min_plddt, 'ligand_pLDDT_max': max_plddt,
+        **selection
+    })
+    if variance_row is not None:
+        append_row(os.path.join(output_dir, "composite_variances.csv"), COMPOSITE_VARIANCE_FIELDS,
+                   dict(zip(COMPOSITE_VARIANCE_FIELDS, variance_row)))
+    if rec:
+        append_row(os.path.join(output_dir, "affinities.csv"), AFFINITY_FIELDS, {"Tag": tag, **rec})
+    if distances:
+        distances = np.array(distances)
+        append_row(os.path.join(output_dir, "openess.csv"), OPENESS_FIELDS, {
+            "Tag": tag, "openess_avg": distances.mean(), "openess_min": distances.min(),
+            "openess_max": distances.max(), "openess_range": distances.max() - distances.min(),
+            **openess_selection
+        })
+
+
+def watch_predictions(predictions_dir, output_dir, targets, num_models, res1=40, res2=389, chain_id="A",
+                      poll_interval=60.0, settle_time=30.0, timeout=None, require_affinity=True, require_pae=False,
+                      model_filter=None, max_memory=None):
+    """
+    Polls a Boltz predictions/ folder and analyzes every target folder as soon as
+    it is complete and its files stopped changing for `settle_time` seconds.
+    Returns once every target is analyzed or failed, or after `timeout` seconds without progress.
+    With `max_memory` (bytes) the memory plan is made from the first completed folders.
+
+    Returns:
+        list: Targets not analyzed: failed ones (not written to the done manifest,
+        so a restarted watcher retries them) followed by the ones still pending.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = analyzed_tags(output_dir) & set(targets)
+    pending = [t for t in targets if t not in done]
+    print(f"[INFO] Watching {predictions_dir}: {len(pending)} of {len(targets)} targets pending")
+
+    memory_plan = None
+    failed = []
+    last_progress = time.time()
+    while pending:
+        for tag in list(pending):
+            folder = os.path.join(predictions_dir, tag)
+            if not os.path.isdir(folder):
+                continue
+            if not folder_is_complete(folder, num_models, require_affinity, require_pae):
+                continue
+            if time.time() - folder_last_modified(folder) < settle_time:
+                continue
+            print(f"[INFO] {tag} complete, analyzing...")
+            if max_memory and memory_plan is None:
+                memory_plan = plan_memory(max_memory, estimate_dimensions(predictions_dir, chain_id))
+                log_plan(memory_plan)
+            pending.remove(tag)
+            try:
+                analyze_folder(folder, output_dir, res1, res2, chain_id, model_filter, memory_plan)
+                mark_analyzed(output_dir, tag)
+            except Exception as e:
+                print(f"[ERROR] Failed analyzing {tag}: {e}")
+                failed.append(tag)
+            last_progress = time.time()
+            print(f"[INFO] {len(targets) - len(pending) - len(failed)}/{len(targets)} targets done"
+                  + (f", {len(failed)} failed" if failed else ""))
+
+        if not pending:
+            break
+        if timeout is not None and time.time() - last_progress > timeout:
+            print(f"[WARN] No progress for {timeout:.0f}s, stopping with {len(pending)} targets pending:")
+            for tag in pending:
+                print(f"  - {tag}")
+            break
+        time.sleep(poll_interval)
+
+    if failed:
+        print(f"[ERROR] {len(failed)} targets failed and are not marked as analyzed (rerun to retry):")
+        for tag in failed:
+            print(f"  - {tag}")
+    if not failed and not pending:
+        print(f"[INFO] All {len(targets)} targets analyzed. Results in {output_dir}")
+    return failed + pending
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Featurize Boltz prediction folders as soon as they are complete.")
+    parser.add_argument("--input_dir", required=True, help="Boltz predictions/ folder being written")
+    parser.add_argument("--output_dir", required=True, help="Folder for the analysis CSVs (appended to)")
+    parser.add_argument("--targets", required=True,
+                        help="Folder of input YAMLs, library CSV with a Tag column, or text file of folder names")
+    parser.add_argument("--ligands", nargs='+', default=None,
+                        help="Ligand suffixes appended to Tags read from a CSV/text --targets, e.g. DOP 5HT")
+    parser.add_argument("--num_models", type=int, default=25, help="Models expected per folder (default: 25)")
+    parser.add_argument("--poll_interval", type=float, default=60.0, help="Seconds between scans (default: 60)")
+    parser.add_argument("--settle_time", type=float, default=30.0,
+                        help="Seconds a folder must be unchanged before it is analyzed (default: 30)")
+    parser.add_argument("--timeout", type=float, default=None, help="Stop after this many seconds without progress")
+    parser.add_argument("--no_affinity", action="store_true", help="Do not wait for affinity_*.json files")
+    parser.add_argument("--require_pae", action="store_true", help="Also wait for pae_/pde_*.npz files")
+    parser.add_argument("--res1", type=int, default=40, help="First openness residue (default: 40)")
+    parser.add_argument("--res2", type=int, default=389, help="Second openness residue (default: 389)")
+    parser.add_argument("--chain", default="A", help="Protein chain ID (default: A)")
+    add_model_filter_arguments(parser)
+    add_memory_arguments(parser)
+    args = parser.parse_args()
+
+    targets = load_targets(args.targets, args.ligands)
+    pending = watch_predictions(args.input_dir, args.output_dir, targets, args.num_models, args.res1, args.res2,
+                                args.chain, args.poll_interval, args.settle_time, args.timeout,
+                                not args.no_affinity, args.require_pae, model_filter_from_args(args),
+                                parse_memory_size(args.max_memory) if args.max_memory else None)
+    raise SystemExit(1 if pending else 0)